@@ -42,6 +42,7 @@ from rteval.modules.loads import LoadModules
 from rteval.modules.measurement import MeasurementModules, MeasurementProfile
 from rteval.rtevalReport import rtevalReport
 from rteval.rtevalXMLRPC import rtevalXMLRPC
+from rteval.cpupartition import CpuPartition
 from rteval.Log import Log
 from rteval import rtevalConfig
 from rteval import rtevalMailer
@@ -89,6 +90,18 @@ class RtEval(rtevalReport):
         from .sysinfo import SystemInfo
         self._sysinfo = SystemInfo(self.__rtevcfg, logger=self.__logger)
 
+        # Split the cpus between loads and measurements.  Cpu lists given
+        # by the user are kept, but still checked for SMT/NUMA conflicts
+        ldcfg = self.__cfg.GetSection('loads')
+        msrcfg = self.__cfg.GetSection('measurement')
+        if self.__rtevcfg.autopartition or (ldcfg.cpulist and msrcfg.cpulist):
+            self._cpupartition = CpuPartition(self._sysinfo, logger=self.__logger)
+            self._cpupartition.Propose(msrcfg.cpulist, ldcfg.cpulist)
+            msrcfg.cpulist = self._cpupartition.GetMeasurementCpulist()
+            ldcfg.cpulist = self._cpupartition.GetLoadsCpulist()
+        else:
+            self._cpupartition = None
+
         # prepare a mailer, if that's configured
         if self.__cfg.HasSection('smtp'):
             self.__mailer = rtevalMailer.rtevalMailer(self.__cfg.GetSection('smtp'))
@@ -107,14 +120,15 @@ class RtEval(rtevalReport):
 
         # If --xmlrpc-submit is given, check that we can access the server
         if self.__rtevcfg.xmlrpc:
-            self.__xmlrpc = rtevalXMLRPC(self.__rtevcfg.xmlrpc, self.__logger, self.__mailer)
+            self.__xmlrpc = rtevalXMLRPC(self.__rtevcfg.xmlrpc, self.__logger, self.__mailer,
+                                         os.path.join(self.__rtevcfg.workdir, 'outbox'))
             if not self.__xmlrpc.Ping():
                 if not self.__rtevcfg.xmlrpc_noabort:
                     print("ERROR: Could not reach XML-RPC server '%s'.  Aborting." % \
                         self.__rtevcfg.xmlrpc)
                     sys.exit(2)
                 else:
-                    print("WARNING: Could not ping the XML-RPC server.  Will continue anyway.")
+                    print("WARNING: Could not ping the XML-RPC server.  The report will be kept in the outbox.")
         else:
             self.__xmlrpc = None
 
@@ -278,21 +292,30 @@ class RtEval(rtevalReport):
         global earlystop
         rtevalres = 0
         measure_start = None
+        self._report_begin()
         for meas_prf in self._measuremods:
             mstart = self.__RunMeasurementProfile(meas_prf)
             if measure_start is None:
                 measure_start = mstart
+            self._report_profile(meas_prf)
 
         self._report(measure_start, self.__rtevcfg.xslt_report)
-        if self.__rtevcfg.sysreport:
-            self._sysinfo.run_sysreport(self.__reportdir)
 
-        # if --xmlrpc-submit | -X was given, send our report to the given host
-        if self.__xmlrpc:
-            rtevalres = self.__xmlrpc.SendReport(self.GetXMLreport())
+        # Compress the report while the remaining data is collected
+        self._tar_results_start(self.__rtevcfg.archive_format or 'bz2',
+                                self.__rtevcfg.archive_level, self.__logger)
+        try:
+            if self.__rtevcfg.sysreport:
+                self._sysinfo.run_sysreport(self.__reportdir)
 
-        if earlystop:
-            rtevalres = 1
-        self._sysinfo.copy_dmesg(self.__reportdir)
-        self._tar_results()
+            # if --xmlrpc-submit | -X was given, send our report to the given host
+            if self.__xmlrpc:
+                rtevalres = self.__xmlrpc.SendReportFile(self.GetXMLreportFile())
+
+            if earlystop:
+                rtevalres = 1
+            self._sysinfo.copy_dmesg(self.__reportdir)
+        finally:
+            # The archiver waits for this, also when something above failed
+            self._tar_results()
         return rtevalres
@@ -0,0 +1,244 @@
+#
+#   archive.py - compressed tar archives of rteval report directories
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import sys
+import bz2
+import gzip
+import lzma
+import shutil
+import tarfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from rteval.Log import Log
+
+# format: (file extension, external multi-threaded compressors, stdlib compressor)
+FORMATS = {
+    'bz2':  ('bz2', (['pbzip2', '-c'], ['lbzip2', '-c']),
+             lambda data, level: bz2.compress(data, level if level is not None else 9)),
+    'gz':   ('gz', (['pigz', '-c'],),
+             lambda data, level: gzip.compress(data, level if level is not None else 6)),
+    'xz':   ('xz', (['xz', '-T0', '-c'],),
+             lambda data, level: lzma.compress(data, preset=level if level is not None else 6)),
+    'zstd': ('zst', (['zstd', '-T0', '-q', '-c'],), None),
+    }
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class ParallelCompressor:
+    """File-like object compressing the written data in chunks on a pool of
+threads.  Each chunk becomes a complete stream of its own, and concatenated
+bzip2, gzip and xz streams are decompressed as one by the standard tools.
+The stdlib compressors release the GIL, so the chunks really are compressed
+in parallel."""
+
+    def __init__(self, fileobj, compress, level=None, threads=None):
+        self.__fp = fileobj
+        self.__compress = compress
+        self.__level = level
+        self.__threads = threads or os.cpu_count() or 1
+        self.__pool = ThreadPoolExecutor(max_workers=self.__threads)
+        self.__pending = []
+        self.__buffer = bytearray()
+
+
+    def __drain(self, keep):
+        "Writes the compressed chunks in order, until at most 'keep' are pending"
+        while len(self.__pending) > keep:
+            self.__fp.write(self.__pending.pop(0).result())
+
+
+    def write(self, data):
+        self.__buffer += data
+        while len(self.__buffer) >= CHUNK_SIZE:
+            chunk = bytes(self.__buffer[:CHUNK_SIZE])
+            del self.__buffer[:CHUNK_SIZE]
+            self.__pending.append(self.__pool.submit(self.__compress, chunk, self.__level))
+            # Limit the memory held by chunks not yet written
+            self.__drain(2 * self.__threads)
+        return len(data)
+
+
+    def close(self):
+        if self.__buffer:
+            self.__pending.append(self.__pool.submit(self.__compress,
+                                                     bytes(self.__buffer), self.__level))
+            self.__buffer = bytearray()
+        self.__drain(0)
+        self.__pool.shutdown()
+
+
+
+class ReportArchiver(threading.Thread):
+    """Creates <reportdir>.tar.<ext> in the background.
+
+The files present in the report directory when Start() is called are
+archived right away, while the caller goes on collecting more data into the
+directory.  Complete() adds everything created in the meantime and waits
+for the archive to be finished."""
+
+    def __init__(self, reportdir, fmt='bz2', level=None, logger=None):
+        threading.Thread.__init__(self)
+        # Never keep rteval from exiting, whatever happened to the caller
+        self.daemon = True
+        if fmt not in FORMATS:
+            raise ValueError("unknown archive format '%s' (valid: %s)" % (
+                fmt, ", ".join(sorted(FORMATS.keys()))))
+
+        self.__reportdir = os.path.abspath(reportdir)
+        self.__fmt = fmt
+        self.__level = int(level) if level is not None else None
+        self.__logger = logger
+        self.__complete = threading.Event()
+        self.__archived = set()
+        self.__initial = []
+        self.__error = None
+        self.__filename = "%s.tar.%s" % (self.__reportdir, FORMATS[fmt][0])
+
+
+    def __log(self, logtype, msg):
+        if self.__logger:
+            self.__logger.log(logtype, "[archive] %s" % msg)
+
+
+    def __scan(self):
+        "Returns all directories and files below the report directory, in tar order"
+        ret = [self.__reportdir]
+        for (root, dirs, files) in os.walk(self.__reportdir):
+            dirs.sort()
+            for f in sorted(files) + dirs:
+                ret.append(os.path.join(root, f))
+        return ret
+
+
+    def __add(self, tar, paths):
+        top = os.path.dirname(self.__reportdir)
+        for p in paths:
+            if p in self.__archived:
+                continue
+            tar.add(p, arcname=os.path.relpath(p, top), recursive=False)
+            self.__archived.add(p)
+
+
+    def __compressor(self, outfile):
+        "Returns (process, file object) for the fastest compressor available"
+        (_, external, stdlib) = FORMATS[self.__fmt]
+        for cmd in external:
+            exe = shutil.which(cmd[0])
+            if exe is None:
+                continue
+            args = [exe] + cmd[1:]
+            if self.__level is not None:
+                args.append("-%d" % self.__level)
+            self.__log(Log.DEBUG, "compressing with %s" % " ".join(args))
+            proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=outfile)
+            return (proc, proc.stdin)
+
+        if stdlib is None:
+            raise RuntimeError("no %s compressor found" % self.__fmt)
+        self.__log(Log.DEBUG, "compressing with %d threads" % (os.cpu_count() or 1))
+        return (None, ParallelCompressor(outfile, stdlib, self.__level))
+
+
+    def Start(self):
+        if not os.path.isdir(self.__reportdir):
+            raise RuntimeError("no such directory: %s" % self.__reportdir)
+        # Only what exists now is archived before Complete() is called,
+        # files still being written by the caller are picked up later
+        self.__initial = self.__scan()
+        self.start()
+
+
+    def run(self):
+        proc = None
+        try:
+            with open(self.__filename, "wb") as outfile:
+                (proc, stream) = self.__compressor(outfile)
+                tar = tarfile.open(fileobj=stream, mode="w|")
+                self.__add(tar, self.__initial)
+                self.__complete.wait()
+                self.__add(tar, self.__scan())
+                tar.close()
+                stream.close()
+                if proc is not None and proc.wait() != 0:
+                    raise RuntimeError("%s failed with exit code %d" % (proc.args[0], proc.returncode))
+        except Exception as e:
+            self.__error = e
+            if proc is not None and proc.poll() is None:
+                proc.kill()
+            # Do not leave a truncated archive behind
+            if os.path.exists(self.__filename):
+                os.unlink(self.__filename)
+
+
+    def Complete(self):
+        "Archives the remaining files and waits for the archive to be written"
+        self.__complete.set()
+        self.join()
+        if self.__error is not None:
+            raise RuntimeError("archiving %s failed: %s" % (self.__reportdir, self.__error))
+        self.__log(Log.INFO, "report archived to %s" % self.__filename)
+        return self.__filename
+
+
+
+def unit_test(rootdir):
+    import tempfile
+    try:
+        l = Log()
+        l.SetLogVerbosity(Log.INFO|Log.DEBUG)
+        tmp = tempfile.mkdtemp()
+        repdir = os.path.join(tmp, "rteval-unittest")
+        os.makedirs(os.path.join(repdir, "logs"))
+        with open(os.path.join(repdir, "summary.xml"), "wb") as f:
+            f.write(os.urandom(1024) * 10240)
+
+        for fmt in sorted(FORMATS.keys()):
+            try:
+                arch = ReportArchiver(repdir, fmt, 1, logger=l)
+            except ValueError as e:
+                print(str(e))
+                return 1
+            arch.Start()
+            with open(os.path.join(repdir, "dmesg"), "w") as f:
+                f.write("dmesg written while archiving\n")
+            try:
+                fname = arch.Complete()
+            except RuntimeError as e:
+                print("%s: %s" % (fmt, str(e)))
+                continue
+            if fmt != 'zstd':
+                print("%s: %s" % (fname, tarfile.open(fname).getnames()))
+        shutil.rmtree(tmp)
+        return 0
+    except Exception as e:
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        print("** EXCEPTION %s", str(e))
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(unit_test(None))
@@ -0,0 +1,227 @@
+#
+#   cgroups.py - cgroup v2 control groups used to contain rteval loads
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import time
+import libxml2
+from rteval.Log import Log
+
+CONTROLLERS = ('cpuset', 'cpu', 'memory', 'io')
+
+
+def cgroup2_mount():
+    "Returns the mount point of the cgroup v2 hierarchy, None if not mounted"
+    ret = None
+    mounts = open('/proc/mounts')
+    for l in mounts:
+        field = l.split()
+        if field[2] == "cgroup2":
+            ret = field[1]
+            break
+    mounts.close()
+    return ret
+
+
+def _read(path):
+    fp = open(path, 'r')
+    data = fp.read().strip()
+    fp.close()
+    return data
+
+
+def _write(path, value):
+    fp = open(path, 'w')
+    fp.write(str(value))
+    fp.close()
+
+
+def join_cgroup(procsfile):
+    """Moves the calling process into a cgroup, given its cgroup.procs file.
+    Used by load worker processes as the first thing they do"""
+    _write(procsfile, "0")
+
+
+class Cgroup:
+    """A cgroup v2 leaf holding the processes of a single load module.
+
+All leaves of a run live below a common rteval-<pid> cgroup.  The leaf is
+given the cpus and memory nodes of the load, optionally a memory.high
+limit and io.max throttling.  The resource usage is collected when the
+cgroup is closed and reported with MakeReport()."""
+
+    def __init__(self, name, logger=None):
+        self.__name = name
+        self.__logger = logger
+        self.__stats = {}
+        self.__settings = {}
+
+        root = cgroup2_mount()
+        if root is None:
+            raise RuntimeError("cgroup v2 is not mounted")
+
+        self.__parent = os.path.join(root, "rteval-%d" % os.getpid())
+        self.__path = os.path.join(self.__parent, name)
+
+        available = _read(os.path.join(root, 'cgroup.controllers')).split()
+        self.__controllers = [c for c in CONTROLLERS if c in available]
+        self.__enable(root)
+
+        if not os.path.isdir(self.__parent):
+            os.mkdir(self.__parent)
+        self.__enable(self.__parent)
+
+        if not os.path.isdir(self.__path):
+            os.mkdir(self.__path)
+        self.__log(Log.DEBUG, "created cgroup %s (controllers: %s)" % (
+            self.__path, " ".join(self.__controllers)))
+
+
+    def __log(self, logtype, msg):
+        if self.__logger:
+            self.__logger.log(logtype, "[cgroup %s] %s" % (self.__name, msg))
+
+
+    def __enable(self, path):
+        "Enables the controllers we need for the children of path"
+        ctrl = os.path.join(path, 'cgroup.subtree_control')
+        enabled = _read(ctrl).split()
+        missing = ["+%s" % c for c in self.__controllers if c not in enabled]
+        if missing:
+            _write(ctrl, " ".join(missing))
+
+
+    def Set(self, key, value):
+        "Writes a cgroup interface file, such as cpuset.cpus or memory.high"
+        if not value:
+            return
+        if key.split('.')[0] not in self.__controllers:
+            self.__log(Log.WARN, "controller for %s not available, ignoring" % key)
+            return
+        self.__log(Log.DEBUG, "%s = %s" % (key, value))
+        _write(os.path.join(self.__path, key), value)
+        self.__settings[key] = str(value)
+
+
+    def GetPath(self):
+        return self.__path
+
+
+    def GetProcsFile(self):
+        "The file a process id is written to, to move the process into the cgroup"
+        return os.path.join(self.__path, 'cgroup.procs')
+
+
+    def __collect(self):
+        "Saves the resource usage of the cgroup"
+
+        def keyvalues(fname):
+            ret = {}
+            path = os.path.join(self.__path, fname)
+            if not os.path.exists(path):
+                return ret
+            for l in _read(path).splitlines():
+                (k, v) = l.split()[0:2]
+                ret[k] = v
+            return ret
+
+        self.__stats['cpu'] = keyvalues('cpu.stat')
+        self.__stats['memory'] = {}
+        for f in ('memory.current', 'memory.peak', 'memory.swap.current'):
+            if os.path.exists(os.path.join(self.__path, f)):
+                self.__stats['memory'][f.split('.', 1)[1]] = _read(os.path.join(self.__path, f))
+        self.__stats['memory_events'] = keyvalues('memory.events')
+
+        io = {}
+        if os.path.exists(os.path.join(self.__path, 'io.stat')):
+            for l in _read(os.path.join(self.__path, 'io.stat')).splitlines():
+                for kv in l.split()[1:]:
+                    (k, v) = kv.split('=')
+                    io[k] = io.get(k, 0) + int(v)
+        self.__stats['io'] = dict([(k, str(v)) for (k, v) in list(io.items())])
+
+        self.__stats['pressure'] = {}
+        for res in ('cpu', 'memory', 'io'):
+            path = os.path.join(self.__path, '%s.pressure' % res)
+            if not os.path.exists(path):
+                continue
+            for l in _read(path).splitlines():
+                fields = l.split()
+                self.__stats['pressure']["%s_%s" % (res, fields[0])] = \
+                    dict([f.split('=') for f in fields[1:]])
+
+
+    def Close(self):
+        "Collects the final statistics, kills any leftovers and removes the cgroup"
+        if not os.path.isdir(self.__path):
+            return
+
+        self.__collect()
+
+        kill = os.path.join(self.__path, 'cgroup.kill')
+        if _read(os.path.join(self.__path, 'cgroup.procs')) and os.path.exists(kill):
+            self.__log(Log.DEBUG, "killing leftover processes")
+            _write(kill, "1")
+
+        for _ in range(10):
+            try:
+                os.rmdir(self.__path)
+                break
+            except OSError:
+                time.sleep(0.5)
+        else:
+            self.__log(Log.WARN, "could not remove %s" % self.__path)
+
+        # The last leaf to go removes the common parent
+        try:
+            os.rmdir(self.__parent)
+        except OSError:
+            pass
+
+
+    def MakeReport(self):
+        rep_n = libxml2.newNode("cgroup")
+        rep_n.newProp("name", self.__name)
+        rep_n.newProp("path", self.__path)
+
+        for (k, v) in sorted(self.__settings.items()):
+            set_n = rep_n.newTextChild(None, "setting", v)
+            set_n.newProp("name", k)
+
+        for sect in ('cpu', 'memory', 'memory_events', 'io'):
+            if not self.__stats.get(sect):
+                continue
+            sect_n = rep_n.newChild(None, sect, None)
+            for (k, v) in sorted(self.__stats[sect].items()):
+                sect_n.newProp(k, v)
+
+        if self.__stats.get('pressure'):
+            psi_n = rep_n.newChild(None, "pressure", None)
+            for (k, vals) in sorted(self.__stats['pressure'].items()):
+                (res, kind) = k.split('_')
+                p_n = psi_n.newChild(None, res, None)
+                p_n.newProp("type", kind)
+                for (vk, vv) in sorted(vals.items()):
+                    p_n.newProp(vk, vv)
+
+        return rep_n
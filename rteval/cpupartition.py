@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+#
+#   cpupartition.py - splits the system cpus between measurement and loads
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import libxml2
+from rteval.Log import Log
+from rteval.systopology import SysTopology, CpuList
+from rteval.sysinfo.cmdline import cmdlineInfo
+
+
+class CpuPartition:
+    """Splits the cpus rteval may use into a measurement set and a load set.
+
+The cpus isolated on the kernel command line (isolcpus= and nohz_full=) are
+preferred for measurements.  Without any isolation, the second half of the
+physical cores on each NUMA node is used for measurements.  SMT siblings of
+measured cpus are never given to the loads."""
+
+    def __init__(self, cmdline, logger=None):
+        if not isinstance(cmdline, cmdlineInfo):
+            raise TypeError("cmdline attribute is not a cmdlineInfo() object")
+
+        self.__cmdline = cmdline
+        self.__logger = logger
+        self.__topology = SysTopology()
+        self.__source = None
+        self.__cpuset = []
+        self.__isolcpus = []
+        self.__nohz_full = []
+        self.__measurement = []
+        self.__loads = []
+        self.__warnings = []
+
+
+    def __log(self, logtype, msg):
+        if self.__logger:
+            self.__logger.log(logtype, "[cpupartition] %s" % msg)
+
+
+    def __warn(self, msg):
+        self.__log(Log.WARN, msg)
+        self.__warnings.append(msg)
+
+
+    @staticmethod
+    def __expand(cpulist):
+        if not cpulist:
+            return []
+        return CpuList(cpulist).getcpulist()
+
+
+    @staticmethod
+    def __collapse(cpus):
+        if not cpus:
+            return ""
+        return str(CpuList(sorted(cpus)))
+
+
+    def __siblings(self, cpus):
+        "Returns all SMT siblings of the given cpus, including the cpus themselves"
+        ret = set()
+        for c in cpus:
+            ret.update(self.__topology.getsiblings(c))
+        return ret
+
+
+    def __physical_cores(self, cpus):
+        "Groups the cpus into physical cores, returned as a list of sibling lists"
+        cores = []
+        seen = set()
+        for c in sorted(cpus):
+            if c in seen:
+                continue
+            core = [s for s in self.__topology.getsiblings(c) if s in cpus]
+            seen.update(core)
+            cores.append(sorted(core))
+        return cores
+
+
+    def __split_node(self, cpus, loads):
+        "Picks the measurement cpus of a node - one thread per physical core"
+        cores = self.__physical_cores(cpus)
+        if loads is not None:
+            # Measure on every core not touched by the requested loads
+            busy = self.__siblings(loads)
+            return [core[0] for core in cores if not busy.intersection(core)]
+
+        # Keep the first half of the cores for loads and housekeeping
+        return [core[0] for core in cores[(len(cores) + 1) // 2:]]
+
+
+    def Propose(self, measurement_cpulist=None, loads_cpulist=None):
+        """Calculates the partition.  Cpu lists given by the user are kept,
+        the missing ones are derived from the topology"""
+
+        allowed = set(CpuList(sorted(os.sched_getaffinity(0))).getcpulist())
+        self.__cpuset = sorted(allowed)
+        self.__isolcpus = [c for c in self.__expand(self.__cmdline.cmdline_get_cpulist('isolcpus'))
+                           if c in allowed]
+        self.__nohz_full = [c for c in self.__expand(self.__cmdline.cmdline_get_cpulist('nohz_full'))
+                            if c in allowed]
+        isolated = set(self.__isolcpus + self.__nohz_full)
+        user_loads = [c for c in self.__expand(loads_cpulist) if c in allowed]
+
+        if measurement_cpulist:
+            self.__source = "user"
+            measurement = set(c for c in self.__expand(measurement_cpulist) if c in allowed)
+        elif isolated:
+            self.__source = "kernel"
+            measurement = isolated
+        else:
+            self.__source = "topology"
+            measurement = set()
+            for n in self.__topology.getnodes():
+                cpus = set(self.__topology.getcpus(n)).intersection(allowed)
+                node_loads = loads_cpulist and [c for c in user_loads if c in cpus] or None
+                measurement.update(self.__split_node(cpus, node_loads))
+
+        if not measurement:
+            # Small systems - nothing to split, share everything
+            self.__warn("no cpus can be set aside for measurements, sharing cpus with loads")
+            measurement = set(allowed)
+
+        if loads_cpulist:
+            loads = set(user_loads)
+        else:
+            loads = allowed.difference(self.__siblings(measurement)).difference(isolated)
+            if not loads:
+                loads = allowed.difference(measurement)
+            if not loads:
+                loads = set(allowed)
+
+        self.__measurement = sorted(measurement)
+        self.__loads = sorted(loads)
+        self.Check()
+
+        self.__log(Log.INFO, "measurement cpus: %s (from %s)" % (
+            self.GetMeasurementCpulist(), self.__source))
+        self.__log(Log.INFO, "load cpus: %s" % self.GetLoadsCpulist())
+
+
+    def Check(self):
+        "Logs a warning for each problem found in the current partition"
+
+        overlap = set(self.__measurement).intersection(self.__loads)
+        if overlap:
+            self.__warn("cpus %s are used by both loads and measurements"
+                        % self.__collapse(overlap))
+
+        shared = self.__siblings(self.__measurement).intersection(self.__loads).difference(overlap)
+        if shared:
+            self.__warn("load cpus %s are SMT siblings of measured cpus"
+                        % self.__collapse(shared))
+
+        for n in self.__topology.getnodes():
+            cpus = self.__topology.getcpus(n)
+            measured = [c for c in self.__measurement if c in cpus]
+            loaded = [c for c in self.__loads if c in cpus]
+            if measured and not loaded:
+                self.__warn("node %d has measured cpus but no load cpus" % int(n))
+
+
+    def GetMeasurementCpulist(self):
+        "Returns the measurement cpus as a cpulist string"
+        return self.__collapse(self.__measurement)
+
+
+    def GetLoadsCpulist(self):
+        "Returns the load cpus as a cpulist string"
+        return self.__collapse(self.__loads)
+
+
+    def MakeReport(self):
+        rep_n = libxml2.newNode("CPUpartition")
+        rep_n.newProp("source", str(self.__source))
+        rep_n.newTextChild(None, "cpuset", self.__collapse(self.__cpuset))
+        if self.__isolcpus:
+            rep_n.newTextChild(None, "isolcpus", self.__collapse(self.__isolcpus))
+        if self.__nohz_full:
+            rep_n.newTextChild(None, "nohz_full", self.__collapse(self.__nohz_full))
+        rep_n.newTextChild(None, "measurement", self.GetMeasurementCpulist())
+        rep_n.newTextChild(None, "loads", self.GetLoadsCpulist())
+
+        for n in self.__topology.getnodes():
+            cpus = self.__topology.getcpus(n)
+            node_n = rep_n.newChild(None, "node", None)
+            node_n.newProp("id", str(n))
+            node_n.newProp("measurement",
+                           self.__collapse([c for c in self.__measurement if c in cpus]))
+            node_n.newProp("loads", self.__collapse([c for c in self.__loads if c in cpus]))
+
+        for w in self.__warnings:
+            rep_n.newTextChild(None, "warning", w)
+
+        return rep_n
+
+
+
+def unit_test(rootdir):
+    import sys
+    try:
+        l = Log()
+        l.SetLogVerbosity(Log.INFO|Log.WARN)
+        part = CpuPartition(cmdlineInfo(logger=l), logger=l)
+        part.Propose()
+        print("measurement: %s" % part.GetMeasurementCpulist())
+        print("loads:       %s" % part.GetLoadsCpulist())
+
+        x = libxml2.newDoc("1.0")
+        x.setRootElement(part.MakeReport())
+        x.saveFormatFileEnc("-", "UTF-8", 1)
+        return 0
+    except Exception as e:
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        print("** EXCEPTION %s", str(e))
+        return 1
+
+if __name__ == '__main__':
+    unit_test(None)
@@ -26,10 +26,14 @@
 import os
 import time
 import threading
+import optparse
 import libxml2
 from rteval.Log import Log
 from rteval.rtevalConfig import rtevalCfgSection
 from rteval.modules import RtEvalModules, rtevalModulePrototype
+from rteval.misc import expand_cpulist
+from rteval.systopology import SysTopology
+from rteval.cgroups import Cgroup
 
 class LoadThread(rtevalModulePrototype):
     def __init__(self, name, config, logger=None):
@@ -60,10 +64,84 @@ class LoadThread(rtevalModulePrototype):
         self.mydir = None
         self.jobs = 0
         self.args = None
+        self._cgroup = None
 
         if not os.path.exists(self.builddir):
             os.makedirs(self.builddir)
 
+        if str(config.setdefault('cgroup', False)).lower() in ('1', 'true', 'yes'):
+            self.__setup_cgroup(logger)
+
+
+    def __setup_cgroup(self, logger):
+        "Prepares a cgroup v2 leaf which will contain all processes of this load"
+        try:
+            self._cgroup = Cgroup(self._name, logger)
+        except (RuntimeError, OSError) as err:
+            self._log(Log.WARN, "cgroup not available, running without: %s" % str(err))
+            self._cgroup = None
+            return
+
+        # Derive the cpus and memory nodes from the topology
+        cpus = []
+        mems = []
+        for (n, nodecpus) in self._node_cpus():
+            cpus.extend(nodecpus)
+            mems.append(n)
+        self._cgroup.Set('cpuset.cpus', ",".join([str(c) for c in sorted(cpus)]))
+        self._cgroup.Set('cpuset.mems', ",".join([str(n) for n in sorted(mems)]))
+        self._cgroup.Set('memory.high', self._cfg.cgroup_memory_high)
+        self._cgroup.Set('io.max', self._cfg.cgroup_io_max)
+
+
+    def _node_cpus(self):
+        """Returns a list of (node, cpus) of the NUMA nodes having cpus this
+        load may run on, only keeping the cpus in the cpulist if one is given"""
+        systop = SysTopology()
+        allowed = self.cpulist and expand_cpulist(self.cpulist) or None
+        nodes = []
+        for n in systop.getnodes():
+            cpus = systop.getcpus(n)
+            if allowed is not None:
+                cpus = [c for c in cpus if str(c) in allowed]
+            if cpus:
+                nodes.append((n, cpus))
+            else:
+                self._log(Log.DEBUG, "node %s has no available cpus, removing" % n)
+        return nodes
+
+
+    def _cgroup_wrap(self, args):
+        """Returns the command line args, run through a shell which first moves
+        itself into the cgroup of this load and then execs the command.  The
+        load and all its children so start inside the cgroup, without a
+        preexec_fn in this multi-threaded process"""
+        if not self._cgroup:
+            return args
+        return ['/bin/sh', '-c', 'echo $$ > "$0"; exec "$@"',
+                self._cgroup.GetProcsFile()] + list(args)
+
+
+    def _cgroup_procs(self):
+        """Returns the cgroup.procs file of the cgroup of this load, for worker
+        processes to join with cgroups.join_cgroup(); None without cgroups"""
+        return self._cgroup and self._cgroup.GetProcsFile() or None
+
+
+    def run(self):
+        try:
+            rtevalModulePrototype.run(self)
+        finally:
+            if self._cgroup:
+                self._cgroup.Close()
+
+
+    def MakeCgroupReport(self):
+        "Returns the resource usage of the load cgroup, None when not using cgroups"
+        if self._cgroup is None or self._donotrun:
+            return None
+        return self._cgroup.MakeReport()
+
 
     def open_logfile(self, name):
         return os.open(os.path.join(self.reportdir, "logs", name), os.O_CREAT|os.O_WRONLY)
@@ -106,10 +184,11 @@ class LoadModules(RtEvalModules):
         "Loads and imports all the configured modules"
 
         for m in modcfg:
-            # hope to eventually have different kinds but module is only on
-            # for now (jcw)
             if m[1].lower() == 'module':
                 self._LoadModule(m[0])
+            elif m[1].lower() == 'external':
+                # All external loads are run by the same driver module
+                self._LoadModule('external')
 
 
     def Setup(self, modparams):
@@ -118,20 +197,53 @@ class LoadModules(RtEvalModules):
 
         modcfg = self._cfg.GetSection(self._module_config)
         cpulist = modcfg.cpulist
+        cgroupcfg = {'cgroup': modcfg.cgroup,
+                     'cgroup_memory_high': modcfg.cgroup_memory_high,
+                     'cgroup_io_max': modcfg.cgroup_io_max}
         for m in modcfg:
-            # hope to eventually have different kinds but module is only on
-            # for now (jcw)
-            if m[1].lower() == 'module':
-                self._cfg.AppendConfig(m[0], modparams)
-                self._cfg.AppendConfig(m[0], {'cpulist': cpulist})
+            modtype = m[1].lower()
+            if modtype not in ('module', 'external'):
+                continue
+            self._cfg.AppendConfig(m[0], modparams)
+            self._cfg.AppendConfig(m[0], {'cpulist': cpulist})
+            self._cfg.AppendConfig(m[0], cgroupcfg)
+            if modtype == 'module':
                 modobj = self._InstantiateModule(m[0], self._cfg.GetSection(m[0]))
-                self._RegisterModuleObject(m[0], modobj)
+            else:
+                self._cfg.AppendConfig(m[0], {'loadname': m[0]})
+                modobj = self._InstantiateModule('external', self._cfg.GetSection(m[0]))
+            self._RegisterModuleObject(m[0], modobj)
+
+
+    def SetupModuleOptions(self, parser):
+        "Sets up optparse based option groups for the loaded modules"
+        RtEvalModules.SetupModuleOptions(self, parser)
+
+        modcfg = self._cfg.GetSection(self._module_config)
+        grparser = optparse.OptionGroup(parser, "cgroup v2 options for load modules")
+        grparser.add_option('--loads-cgroup', dest='loads___cgroup',
+                            action='store_true', default=modcfg.cgroup or False,
+                            help='run each load in its own cgroup v2 leaf, '
+                            'with cpuset.cpus/cpuset.mems set from the topology')
+        grparser.add_option('--loads-memory-high', dest='loads___cgroup_memory_high',
+                            action='store', default=modcfg.cgroup_memory_high, metavar='BYTES',
+                            help='memory.high limit for each load cgroup')
+        grparser.add_option('--loads-io-max', dest='loads___cgroup_io_max',
+                            action='store', default=modcfg.cgroup_io_max, metavar='"MAJ:MIN LIMITS"',
+                            help='io.max setting for each load cgroup, e.g. "8:0 wbps=1048576"')
+        parser.add_option_group(grparser)
 
 
     def MakeReport(self):
         rep_n = RtEvalModules.MakeReport(self)
         rep_n.newProp("load_average", str(self.GetLoadAvg()))
 
+        # Add the resource usage of the load cgroups, if used
+        for modname in self.GetModulesList():
+            cgrp_n = self.GetNamedModuleObject(modname).MakeCgroupReport()
+            if cgrp_n is not None:
+                rep_n.addChild(cgrp_n)
+
         return rep_n
 
 
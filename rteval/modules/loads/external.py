@@ -0,0 +1,429 @@
+#
+#   external.py - generic driver for the loads configured as 'external'
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import sys
+import glob
+import time
+import shutil
+import signal
+import hashlib
+import subprocess
+import libxml2
+from rteval.modules import rtevalRuntimeError
+from rteval.modules.loads import CommandLineLoad
+from rteval.Log import Log
+from rteval.misc import compress_cpulist
+
+
+class ExternalInstance:
+    '''One instance of an external load, bound to the cpus of a node'''
+
+    QUICK_EXIT = 10.0       # seconds, exiting sooner counts as a failed start
+    MAX_QUICK_EXITS = 5     # quick exits in a row before giving up
+
+    def __init__(self, node, index, cpus, runload, bind, logger=None):
+        self.node = node
+        self.index = index
+        self.cpus = cpus
+        self.logger = logger
+        self.proc = None
+        self.starts = 0
+        self.utime = 0.0
+        self.stime = 0.0
+        self.last_exit = None
+        self.started = 0.0
+        self.quick_exits = 0
+        self.next_start = 0.0
+        self.given_up = False
+        if bind == 'numactl':
+            self.args = ['numactl', '--cpunodebind', str(node), '/bin/sh', '-c', runload]
+        elif bind == 'taskset':
+            self.args = ['taskset', '-c', compress_cpulist(cpus), '/bin/sh', '-c', runload]
+        else:
+            self.args = ['/bin/sh', '-c', runload]
+
+
+    def log(self, logtype, msg):
+        if self.logger:
+            self.logger.log(logtype, "[external node%d.%d] %s" % (self.node, self.index, msg))
+
+
+    def start(self, cwd, sin, sout, serr, wrap=None):
+        env = dict(os.environ)
+        env.update({'RTEVAL_NODE': str(self.node),
+                    'RTEVAL_INSTANCE': str(self.index),
+                    'RTEVAL_CPUS': compress_cpulist(self.cpus)})
+        self.log(Log.DEBUG, "starting: %s" % " ".join(self.args))
+        # A session of its own, so the whole process tree can be stopped
+        self.proc = subprocess.Popen(wrap and wrap(self.args) or self.args, cwd=cwd, env=env,
+                                     stdin=sin, stdout=sout, stderr=serr,
+                                     start_new_session=True)
+        self.started = time.monotonic()
+        self.starts += 1
+
+
+    def reap(self, block=False):
+        """Collects the exit status and cpu time of an exited instance.
+        Returns True once the instance is no longer running"""
+        if self.proc is None:
+            return True
+        (pid, status, rusage) = os.wait4(self.proc.pid, 0 if block else os.WNOHANG)
+        if pid == 0:
+            return False
+        # The rusage of the shell includes the processes it has waited for
+        self.utime += rusage.ru_utime
+        self.stime += rusage.ru_stime
+        self.last_exit = os.waitstatus_to_exitcode(status)
+        self.proc.returncode = self.last_exit
+        self.proc = None
+
+        # Back off exponentially from instances failing right away
+        now = time.monotonic()
+        if now - self.started < self.QUICK_EXIT:
+            self.quick_exits += 1
+            self.next_start = now + 2 ** self.quick_exits
+        else:
+            self.quick_exits = 0
+            self.next_start = now
+        return True
+
+
+    def may_restart(self):
+        "Returns True when the instance may be started again now"
+        if self.given_up:
+            return False
+        if self.quick_exits >= self.MAX_QUICK_EXITS:
+            self.log(Log.WARN, "exited within %is of starting %i times in a row "
+                     "(last exit %s), not restarting it"
+                     % (self.QUICK_EXIT, self.quick_exits, self.last_exit))
+            self.given_up = True
+            return False
+        return time.monotonic() >= self.next_start
+
+
+    def stop(self, timeout=5.0):
+        if self.proc is None:
+            return
+        try:
+            os.killpg(self.proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        stoptime = time.time() + timeout
+        while not self.reap():
+            if time.time() > stoptime:
+                self.log(Log.DEBUG, "not stopping, sending SIGKILL")
+                try:
+                    os.killpg(self.proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                self.reap(block=True)
+                break
+            time.sleep(0.1)
+
+
+    def MakeReport(self):
+        inst_n = libxml2.newNode('instance')
+        inst_n.newProp('node', str(self.node))
+        inst_n.newProp('id', str(self.index))
+        inst_n.newProp('cpus', compress_cpulist(self.cpus))
+        inst_n.newProp('starts', str(self.starts))
+        inst_n.newProp('restarts', str(max(self.starts - 1, 0)))
+        inst_n.newProp('user_time', "%.2f" % self.utime)
+        inst_n.newProp('system_time', "%.2f" % self.stime)
+        if self.last_exit is not None:
+            inst_n.newProp('last_exit', str(self.last_exit))
+        if self.given_up:
+            inst_n.newProp('given_up', 'true')
+        return inst_n
+
+
+
+class ExternalLoad(CommandLineLoad):
+    """Runs a load given as shell commands in the configuration file, in a
+section named after the load:
+
+    [loads]
+    dbench: external
+
+    [dbench]
+    source:  dbench.tar.gz
+    setup:   tar -xvf dbench.tar.gz
+    build:   ./autogen.sh && ./configure && make dbench
+    runload: ./dbench -c ./client.txt 10
+
+The source file is linked into <builddir>/<name> where 'setup' is run.  The
+'build' and 'runload' commands are run in the directory unpacked by setup,
+unless 'directory' says otherwise.  The setup and build results are kept
+between runs and only redone when the source or the commands change.
+'instances' copies of runload are started on each node, and restarted when
+they exit as long as 'restart' is on.  Instances exiting right after being
+started are restarted with an increasing delay, and given up on after a few
+attempts."""
+
+    def __init__(self, config, logger):
+        CommandLineLoad.__init__(self, config.loadname, config, logger)
+        self.__logger = logger
+        self.__setup = config.setdefault('setup', None)
+        self.__build = config.setdefault('build', None)
+        self.__runload = config.setdefault('runload', None)
+        self.__directory = config.setdefault('directory', None)
+        self.__ninstances = int(config.setdefault('instances', 1))
+        self.__restart = str(config.setdefault('restart', True)).lower() in ('1', 'true', 'yes', 'on')
+        self.__workdir = os.path.join(self.builddir, self._name)
+        self.__tree = None
+        self.__instances = []
+
+        if not self.__runload:
+            self._log(Log.WARN, "no runload command given, not running")
+            self._donotrun = True
+
+
+    def __find_source(self):
+        "Returns the path to the source file, None when the load has no source"
+        if not self.source:
+            return None
+        if os.path.isabs(self.source):
+            if os.path.exists(self.source):
+                return self.source
+        elif os.path.exists(os.path.join(self.srcdir, self.source)):
+            return os.path.join(self.srcdir, self.source)
+        # Like kcompile, accept a versioned file name, e.g. dbench-4.0.tar.gz
+        found = sorted(glob.glob(os.path.join(self.srcdir, "%s*" % self._name)))
+        if not found:
+            raise rtevalRuntimeError(self, " source %s not found in %s" % (self.source, self.srcdir))
+        return found[0]
+
+
+    def __stamp(self, *parts):
+        return hashlib.sha1("\0".join([str(p) for p in parts]).encode()).hexdigest()
+
+
+    def __stampfile(self, stage):
+        return os.path.join(self.__workdir, ".rteval-%s" % stage)
+
+
+    def __stamp_ok(self, stage, stamp):
+        try:
+            fp = open(self.__stampfile(stage), 'r')
+            ok = fp.read().strip() == stamp
+            fp.close()
+            return ok
+        except IOError:
+            return False
+
+
+    def __stamp_save(self, stage, stamp):
+        fp = open(self.__stampfile(stage), 'w')
+        fp.write(stamp + "\n")
+        fp.close()
+
+
+    def __call(self, stage, cmd, cwd):
+        null = os.open("/dev/null", os.O_RDWR)
+        if self._logging:
+            out = self.open_logfile("%s-%s.stdout" % (self._name, stage))
+            err = self.open_logfile("%s-%s.stderr" % (self._name, stage))
+        else:
+            out = err = null
+        self._log(Log.DEBUG, "%s: %s (in %s)" % (stage, cmd, cwd))
+        ret = subprocess.call(cmd, shell=True, cwd=cwd, stdin=null, stdout=out, stderr=err)
+        if self._logging:
+            os.close(out)
+            os.close(err)
+        os.close(null)
+        if ret:
+            raise rtevalRuntimeError(self, " %s command failed (ret=%d): %s" % (stage, ret, cmd))
+
+
+    def __find_tree(self):
+        "The directory build and runload are run in"
+        if self.__directory:
+            return os.path.join(self.__workdir, self.__directory)
+        # Most tarballs unpack into a single top directory
+        entries = [e for e in os.listdir(self.__workdir)
+                   if not e.startswith('.') and os.path.isdir(os.path.join(self.__workdir, e))]
+        if len(entries) == 1:
+            return os.path.join(self.__workdir, entries[0])
+        return self.__workdir
+
+
+    def _WorkloadSetup(self):
+        if self._donotrun:
+            return
+        source = self.__find_source()
+        if source:
+            st = os.stat(source)
+            setup_stamp = self.__stamp(os.path.realpath(source), st.st_size, st.st_mtime, self.__setup)
+        else:
+            setup_stamp = self.__stamp(None, self.__setup)
+
+        if os.path.isdir(self.__workdir) and self.__stamp_ok('setup', setup_stamp):
+            self._log(Log.DEBUG, "reusing %s" % self.__workdir)
+        else:
+            if os.path.exists(self.__workdir):
+                shutil.rmtree(self.__workdir)
+            os.makedirs(self.__workdir)
+            if source:
+                # Under the configured name, which the setup command refers to
+                os.symlink(os.path.abspath(source),
+                           os.path.join(self.__workdir, os.path.basename(self.source)))
+            if self.__setup:
+                self.__call('setup', self.__setup, self.__workdir)
+            self.__stamp_save('setup', setup_stamp)
+        self.__tree = self.__find_tree()
+        self.__build_stamp = self.__stamp(setup_stamp, self.__build)
+
+        # One set of instances per node with cpus to run on
+        nodes = self._node_cpus()
+
+        if len(nodes) > 1 and os.path.exists('/usr/bin/numactl') and not self.cpulist:
+            bind = 'numactl'
+        elif len(nodes) > 1 or self.cpulist:
+            bind = 'taskset'
+        else:
+            bind = None
+
+        self.__instances = []
+        for (n, cpus) in nodes:
+            for i in range(self.__ninstances):
+                self.__instances.append(ExternalInstance(n, i, cpus, self.__runload,
+                                                         bind, self.__logger))
+        self.jobs = len(self.__instances)
+        self.args = [self.__runload]
+
+
+    def _WorkloadBuild(self):
+        if self.__build and not self.__stamp_ok('build', self.__build_stamp):
+            self.__call('build', self.__build, self.__tree)
+            self.__stamp_save('build', self.__build_stamp)
+        self._setReady()
+
+
+    def _WorkloadPrepare(self):
+        self.__nullfd = os.open("/dev/null", os.O_RDWR)
+        if self._logging:
+            self.__outfd = self.open_logfile("%s.stdout" % self._name)
+            self.__errfd = self.open_logfile("%s.stderr" % self._name)
+        else:
+            self.__outfd = self.__errfd = self.__nullfd
+
+
+    def _WorkloadTask(self):
+        for inst in self.__instances:
+            if not inst.reap():
+                continue
+            if inst.starts:
+                if not self.__restart or not inst.may_restart():
+                    continue
+                self._log(Log.DEBUG, "node%d.%d exited with %s, restarting"
+                          % (inst.node, inst.index, inst.last_exit))
+            inst.start(self.__tree, self.__nullfd, self.__outfd, self.__errfd,
+                       self._cgroup_wrap)
+
+
+    def WorkloadAlive(self):
+        if self.__restart:
+            return len([i for i in self.__instances if not i.given_up]) > 0
+        return len([i for i in self.__instances if i.proc is not None]) > 0
+
+
+    def _WorkloadCleanup(self):
+        if self._donotrun:
+            return
+        for inst in self.__instances:
+            inst.stop()
+        os.close(self.__nullfd)
+        if self._logging:
+            os.close(self.__outfd)
+            os.close(self.__errfd)
+        self._setFinished()
+
+
+    def MakeReport(self):
+        rep_n = CommandLineLoad.MakeReport(self)
+        if rep_n is None:
+            return None
+        rep_n.newProp('type', 'external')
+        starts = sum([i.starts for i in self.__instances])
+        rep_n.newProp('restarts', str(starts - len([i for i in self.__instances if i.starts])))
+        rep_n.newProp('user_time', "%.2f" % sum([i.utime for i in self.__instances]))
+        rep_n.newProp('system_time', "%.2f" % sum([i.stime for i in self.__instances]))
+        for inst in self.__instances:
+            rep_n.addChild(inst.MakeReport())
+        return rep_n
+
+
+
+def ModuleParameters():
+    # The parameters are read from the section of each external load
+    return {}
+
+
+
+def create(config, logger):
+    return ExternalLoad(config, logger)
+
+
+
+def unit_test(rootdir):
+    try:
+        null = os.open(os.devnull, os.O_RDWR)
+        cpus = sorted(os.sched_getaffinity(0))
+
+        # An instance failing right away is started again later and later
+        inst = ExternalInstance(0, 0, cpus, 'exit 3', None)
+        inst.start('/', null, null, null)
+        if not inst.reap(block=True) or inst.last_exit != 3 or inst.quick_exits != 1:
+            raise Exception("exit 3 reaped as %s, %i quick exits"
+                            % (inst.last_exit, inst.quick_exits))
+        if inst.may_restart() or inst.next_start - time.monotonic() <= 1.0:
+            raise Exception("restarted without backing off")
+        inst.next_start = time.monotonic()
+        if not inst.may_restart():
+            raise Exception("not restarted after the backoff delay")
+        inst.quick_exits = ExternalInstance.MAX_QUICK_EXITS
+        if inst.may_restart() or not inst.given_up:
+            raise Exception("not given up after %i quick exits" % inst.quick_exits)
+        print("backoff OK")
+
+        # Stopping takes the whole process tree down
+        inst = ExternalInstance(0, 0, cpus, 'sleep 30 & sleep 30', None)
+        inst.start('/', null, null, null)
+        if inst.reap():
+            raise Exception("instance exited right away (%s)" % inst.last_exit)
+        inst.stop()
+        if inst.proc is not None or inst.last_exit != -signal.SIGTERM:
+            raise Exception("stopped instance exited with %s" % inst.last_exit)
+        print("stop OK")
+        os.close(null)
+        return 0
+    except Exception as e:
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        print("** EXCEPTION %s", str(e))
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(unit_test(None))
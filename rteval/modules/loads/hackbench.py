@@ -133,7 +133,7 @@ class Hackbench(CommandLineLoad):
             args = self.args
 
         self._log(Log.DEBUG, "starting on node %s: args = %s" % (node, args))
-        p = subprocess.Popen(args,
+        p = subprocess.Popen(self._cgroup_wrap(args),
                              stdin=self.__nullfp,
                              stdout=self.__out,
                              stderr=self.__err)
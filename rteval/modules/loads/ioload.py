@@ -0,0 +1,343 @@
+#
+#   ioload.py - rteval load module generating block I/O with a fixed queue
+#               depth on every NUMA node
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import sys
+import mmap
+import time
+import random
+import threading
+import multiprocessing
+import libxml2
+from rteval.modules import rtevalRuntimeError
+from rteval.modules.loads import LoadThread
+from rteval.Log import Log
+from rteval.cgroups import join_cgroup
+
+MB = 1024 * 1024
+
+
+def _open_direct(path):
+    "Opens path for O_DIRECT I/O, returns (fd, direct)"
+    try:
+        return (os.open(path, os.O_RDWR | os.O_DIRECT), True)
+    except OSError:
+        # tmpfs and some others do not support O_DIRECT
+        return (os.open(path, os.O_RDWR), False)
+
+
+def _io_thread(fd, filesize, blocksize, rwmix, stop, stats, errors):
+    """Keeps one request in flight until stop is set.  A failing request
+    is added to errors and stops the other threads too"""
+    buf = mmap.mmap(-1, blocksize)      # page aligned, as O_DIRECT needs
+    buf.write(os.urandom(blocksize))
+    nblocks = filesize // blocksize
+    rnd = random.Random()
+    reads = writes = 0
+    latsum = 0.0
+    latmax = 0.0
+    try:
+        while not stop.is_set():
+            offset = rnd.randrange(nblocks) * blocksize
+            start = time.monotonic()
+            if rnd.randrange(100) < rwmix:
+                os.preadv(fd, [buf], offset)
+                reads += 1
+            else:
+                os.pwritev(fd, [buf], offset)
+                writes += 1
+            lat = time.monotonic() - start
+            latsum += lat
+            if lat > latmax:
+                latmax = lat
+    except Exception as err:
+        errors.append(str(err))
+        stop.set()
+    buf.close()
+    stats.append((reads, writes, latsum, latmax))
+
+
+def _io_worker(path, filesize, blocksize, qdepth, rwmix, cpus, cgprocs, stopevent, conn):
+    """Runs in a process of its own per node: qdepth threads doing
+    preadv/pwritev, the GIL being released during each request.  Returns
+    early when the I/O fails, with the error in the results"""
+    try:
+        if cgprocs:
+            join_cgroup(cgprocs)
+        os.sched_setaffinity(0, cpus)
+        (fd, direct) = _open_direct(path)
+    except Exception as err:
+        conn.send({'error': str(err)})
+        conn.close()
+        return
+    stop = threading.Event()
+    stats = []
+    errors = []
+    threads = [threading.Thread(target=_io_thread,
+                                args=(fd, filesize, blocksize, rwmix, stop, stats, errors))
+               for i in range(qdepth)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    while not stopevent.wait(0.5):
+        if stop.is_set():
+            break
+    stop.set()
+    for t in threads:
+        t.join()
+    duration = time.monotonic() - start
+    os.close(fd)
+    res = {'duration': duration,
+           'direct': direct,
+           'reads': sum([s[0] for s in stats]),
+           'writes': sum([s[1] for s in stats]),
+           'latsum': sum([s[2] for s in stats]),
+           'latmax': max([s[3] for s in stats] or [0.0])}
+    if errors:
+        res['error'] = errors[0]
+    conn.send(res)
+    conn.close()
+
+
+
+class IOLoad(LoadThread):
+    """Generates random block I/O against a scratch file per NUMA node.
+Each node gets a worker process bound to its load cpus, keeping 'qdepth'
+O_DIRECT requests of 'blocksize' bytes in flight, 'rwmix' percent of them
+being reads.  The scratch files are written before the run starts, so the
+reads hit the storage, and removed afterwards.  A worker whose I/O fails
+stops, which ends the load."""
+
+    def __init__(self, config, logger):
+        LoadThread.__init__(self, "ioload", config, logger)
+        self.__blocksize = int(config.setdefault('blocksize', 4096))
+        self.__qdepth = int(config.setdefault('qdepth', 16))
+        self.__rwmix = int(config.setdefault('rwmix', 70))
+        self.__filesize = int(config.setdefault('filesize', 512)) * MB
+        self.__directory = config.setdefault('directory', None) or config.workdir or os.getcwd()
+        self.__nodes = {}
+        self.__workers = {}
+        self.__results = {}
+
+        if self.__blocksize % 512 or self.__filesize < self.__blocksize:
+            raise rtevalRuntimeError(self, " invalid blocksize %d" % self.__blocksize)
+        if not 0 <= self.__rwmix <= 100:
+            raise rtevalRuntimeError(self, " rwmix must be a percentage, not %d" % self.__rwmix)
+
+
+    def __scratchfile(self, node):
+        return os.path.join(self.__directory, "rteval-ioload-node%d.dat" % node)
+
+
+    def _WorkloadSetup(self):
+        self.__nodes = dict(self._node_cpus())
+
+
+    def _WorkloadBuild(self):
+        # Fill the scratch files with data; reading holes or unwritten
+        # extents would not cause any I/O
+        chunk = mmap.mmap(-1, MB)
+        chunk.write(os.urandom(MB))
+        for n in self.__nodes:
+            path = self.__scratchfile(n)
+            self._log(Log.DEBUG, "writing %d MB to %s" % (self.__filesize // MB, path))
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            written = 0
+            while written < self.__filesize:
+                written += os.pwrite(fd, chunk[:min(MB, self.__filesize - written)], written)
+            os.fsync(fd)
+            os.close(fd)
+        chunk.close()
+        self._setReady()
+
+
+    def _WorkloadPrepare(self):
+        # Forking rteval itself, with all its threads, is not safe
+        self.__mp = multiprocessing.get_context('forkserver')
+        self.__stopevent = self.__mp.Event()
+
+
+    def _WorkloadTask(self):
+        if self.__workers:
+            # Already running
+            return
+        for (n, cpus) in self.__nodes.items():
+            (rconn, wconn) = self.__mp.Pipe(duplex=False)
+            proc = self.__mp.Process(target=_io_worker,
+                                     name="ioload-node%d" % n,
+                                     args=(self.__scratchfile(n), self.__filesize,
+                                           self.__blocksize, self.__qdepth, self.__rwmix,
+                                           cpus, self._cgroup_procs(), self.__stopevent, wconn))
+            proc.start()
+            wconn.close()
+            self.__workers[n] = (proc, rconn)
+            self._log(Log.DEBUG, "started I/O worker on node %d (pid %d)" % (n, proc.pid))
+
+
+    def WorkloadAlive(self):
+        for (proc, _) in self.__workers.values():
+            if not proc.is_alive():
+                return False
+        return True
+
+
+    def _WorkloadCleanup(self):
+        if self.__workers:
+            self.__stopevent.set()
+        for (n, (proc, rconn)) in self.__workers.items():
+            # The outstanding requests have to complete first
+            if rconn.poll(30):
+                self.__results[n] = rconn.recv()
+                if 'error' in self.__results[n]:
+                    self._log(Log.ERR, "I/O worker on node %d failed: %s"
+                              % (n, self.__results[n]['error']))
+            else:
+                self._log(Log.WARN, "no results from the I/O worker on node %d" % n)
+                proc.terminate()
+            proc.join()
+            rconn.close()
+        self.__workers = {}
+        for n in self.__nodes:
+            if os.path.exists(self.__scratchfile(n)):
+                os.unlink(self.__scratchfile(n))
+        self._setFinished()
+
+
+    def MakeReport(self):
+        if self._donotrun or not self.__results:
+            return None
+
+        rep_n = libxml2.newNode("ioload")
+        rep_n.newProp("blocksize", str(self.__blocksize))
+        rep_n.newProp("qdepth", str(self.__qdepth))
+        rep_n.newProp("rwmix", str(self.__rwmix))
+        rep_n.newProp("filesize", str(self.__filesize))
+        rep_n.newProp("directory", self.__directory)
+
+        total_iops = 0.0
+        for n in sorted(self.__results.keys()):
+            res = self.__results[n]
+            node_n = rep_n.newChild(None, "node", None)
+            node_n.newProp("id", str(n))
+            if 'error' in res:
+                node_n.newProp("error", res['error'])
+                if 'duration' not in res:
+                    continue
+            ios = res['reads'] + res['writes']
+            iops = res['duration'] and ios / res['duration'] or 0.0
+            total_iops += iops
+            node_n.newProp("direct", res['direct'] and "1" or "0")
+            node_n.newProp("duration", "%.3f" % res['duration'])
+            node_n.newProp("reads", str(res['reads']))
+            node_n.newProp("writes", str(res['writes']))
+            node_n.newProp("iops", "%.1f" % iops)
+            node_n.newProp("throughput", "%.0f" % (iops * self.__blocksize))
+            if ios:
+                node_n.newProp("avg_latency", "%.1f" % (res['latsum'] / ios * 1000000.0))
+                node_n.newProp("max_latency", "%.1f" % (res['latmax'] * 1000000.0))
+        rep_n.newProp("iops", "%.1f" % total_iops)
+        rep_n.newProp("throughput", "%.0f" % (total_iops * self.__blocksize))
+        return rep_n
+
+
+
+def ModuleParameters():
+    return {"blocksize": {"descr": "Size of each I/O request",
+                          "default": 4096,
+                          "metavar": "BYTES"},
+            "qdepth": {"descr": "Number of requests in flight per node",
+                       "default": 16,
+                       "metavar": "NUM"},
+            "rwmix": {"descr": "Percentage of the requests being reads",
+                      "default": 70,
+                      "metavar": "PERCENT"},
+            "filesize": {"descr": "Size of the scratch file of each node",
+                         "default": 512,
+                         "metavar": "MB"},
+            "directory": {"descr": "Directory for the scratch files (default: the work directory)",
+                          "metavar": "DIR"},
+            }
+
+
+
+def create(config, logger):
+    return IOLoad(config, logger)
+
+
+
+def unit_test(rootdir):
+    import tempfile
+    try:
+        cpus = os.sched_getaffinity(0)
+        (fd, path) = tempfile.mkstemp(prefix='rteval-ioload-')
+        os.write(fd, b'\0' * MB)
+        os.close(fd)
+
+        # A worker on a scratch file, run in a thread here
+        stopevent = threading.Event()
+        (rconn, wconn) = multiprocessing.Pipe(duplex=False)
+        worker = threading.Thread(target=_io_worker,
+                                  args=(path, MB, 4096, 4, 50, cpus, None, stopevent, wconn))
+        worker.start()
+        time.sleep(0.5)
+        stopevent.set()
+        worker.join()
+        res = rconn.recv()
+        if 'error' in res or not res['reads'] or not res['writes']:
+            raise Exception("worker results: %s" % res)
+        print("%i reads, %i writes in %.2fs (direct: %s)"
+              % (res['reads'], res['writes'], res['duration'], res['direct']))
+
+        # A failing request stops the other threads and is reported
+        fd = os.open(path, os.O_RDONLY)
+        (stop, stats, errors) = (threading.Event(), [], [])
+        threads = [threading.Thread(target=_io_thread,
+                                    args=(fd, MB, 4096, 0, stop, stats, errors))
+                   for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        os.close(fd)
+        if not stop.is_set() or not errors or len(stats) != 2:
+            raise Exception("failed writes gave %s" % errors)
+
+        # So is a scratch file which can not be opened
+        os.unlink(path)
+        (rconn, wconn) = multiprocessing.Pipe(duplex=False)
+        _io_worker(path, MB, 4096, 4, 50, cpus, None, stopevent, wconn)
+        res = rconn.recv()
+        if 'error' not in res:
+            raise Exception("missing scratch file gave %s" % res)
+        print("errors OK")
+        return 0
+    except Exception as e:
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        print("** EXCEPTION %s", str(e))
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(unit_test(None))
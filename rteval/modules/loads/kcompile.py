@@ -92,10 +92,11 @@ class KBuildJob:
         subprocess.call(self.cleancmd, shell=True,
                         stdin=sin, stdout=sout, stderr=serr)
 
-    def run(self, sin=None, sout=None, serr=None):
+    def run(self, sin=None, sout=None, serr=None, wrap=None):
         self.log(Log.INFO, "starting workload on node %d" % int(self.node))
         self.log(Log.DEBUG, "running on node %d: %s" % (int(self.node), self.runcmd))
-        self.jobid = subprocess.Popen(self.runcmd, shell=True,
+        args = ['/bin/sh', '-c', self.runcmd]
+        self.jobid = subprocess.Popen(wrap and wrap(args) or args,
                                       stdin=sin, stdout=sout, stderr=serr)
 
     def isrunning(self):
@@ -268,7 +269,8 @@ class Kcompile(CommandLineLoad):
                         raise RuntimeError("kcompile module failed to run (returned %d), please check logs for more detail" \
                             % self.buildjobs[n].jobid.returncode)
                 self._log(Log.INFO, "Starting load on node %d" % n)
-                self.buildjobs[n].run(self.__nullfd, self.__outfd, self.__errfd)
+                self.buildjobs[n].run(self.__nullfd, self.__outfd, self.__errfd,
+                                      self._cgroup_wrap)
 
     def WorkloadAlive(self):
         # if any of the jobs has stopped, return False
@@ -0,0 +1,286 @@
+#
+#   memload.py - rteval load module generating memory bandwidth and cache
+#                pressure on every NUMA node
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import sys
+import glob
+import mmap
+import time
+import multiprocessing
+import libxml2
+from rteval.modules import rtevalRuntimeError
+from rteval.modules.loads import LoadThread
+from rteval.Log import Log
+from rteval.systopology import SysTopology
+from rteval.cgroups import join_cgroup
+
+MB = 1024 * 1024
+CACHELINE = 64
+
+
+def _llc_size(cpu):
+    "Returns the size in bytes of the last level cache of a cpu, 0 if unknown"
+    size = 0
+    level = 0
+    for idx in glob.glob('/sys/devices/system/cpu/cpu%d/cache/index[0-9]*' % int(cpu)):
+        try:
+            l = int(open(os.path.join(idx, 'level')).read())
+            s = open(os.path.join(idx, 'size')).read().strip()
+        except (IOError, ValueError):
+            continue
+        mult = {'K': 1024, 'M': MB, 'G': 1024 * MB}.get(s[-1:], 1)
+        if l > level:
+            level = l
+            size = int(s.rstrip('KMG')) * mult
+    return size
+
+
+def _mem_worker(mode, bufsize, stride, cpu, cgprocs, stopevent, conn):
+    """Runs in a process of its own, pinned to one cpu.  The buffer is first
+    touched from that cpu, so it is allocated on the cpu's node"""
+    if cgprocs:
+        join_cgroup(cgprocs)
+    os.sched_setaffinity(0, [cpu])
+    buf = mmap.mmap(-1, bufsize)
+    chunk = b'\x5a' * MB
+    for off in range(0, bufsize, MB):
+        buf[off:off + MB] = chunk[:bufsize - off]
+    mv = memoryview(buf)
+
+    moved = 0
+    start = time.monotonic()
+    if mode == 'stream':
+        # memcpy() between the two halves, reading and writing every byte
+        half = bufsize // 2
+        while not stopevent.is_set():
+            mv[:half] = mv[half:half * 2]
+            mv[half:half * 2] = mv[:half]
+            moved += 4 * half
+    else:
+        # One byte of every stride, the stride crossing pages and cache
+        # sets; each of them costs a full cache line from memory
+        count = bufsize // stride - 1
+        dst = memoryview(bytearray(count))
+        offset = 0
+        while not stopevent.is_set():
+            dst[:] = mv[offset:offset + count * stride:stride]
+            moved += count * CACHELINE
+            offset = (offset + CACHELINE) % stride
+        dst.release()
+    duration = time.monotonic() - start
+    mv.release()
+    buf.close()
+    conn.send({'duration': duration, 'bytes': moved})
+    conn.close()
+
+
+
+class MemLoad(LoadThread):
+    """Generates memory bandwidth and cache pressure with worker processes
+pinned to the load cpus of every NUMA node.  'stream' workers copy large
+buffers back and forth, 'thrash' workers read single bytes spread over
+their buffer so that every access misses the caches; 'mixed' runs both
+kinds on alternating cpus.  The bytes read by thrash workers are 'stride'
+bytes apart, by default a page and a cache line.  The buffers of a node add
+up to 'llcmultiple' times its last level cache, limited to 'memfraction'
+percent of the node's free memory.  The bandwidth achieved on each node is
+reported."""
+
+    def __init__(self, config, logger):
+        LoadThread.__init__(self, "memload", config, logger)
+        self.__mode = str(config.setdefault('mode', 'mixed')).lower()
+        self.__llcmultiple = float(config.setdefault('llcmultiple', 4))
+        self.__memfraction = float(config.setdefault('memfraction', 10))
+        self.__workerspernode = int(config.setdefault('workers', 0))
+        self.__stride = int(config.setdefault('stride', 4096 + CACHELINE))
+        self.__nodes = {}
+        self.__workers = []
+        self.__results = {}
+
+        if self.__mode not in ('stream', 'thrash', 'mixed'):
+            raise rtevalRuntimeError(self, " unknown mode '%s'" % self.__mode)
+
+
+    def _WorkloadSetup(self):
+        systop = SysTopology()
+        for (n, cpus) in self._node_cpus():
+            if self.__workerspernode:
+                cpus = cpus[:self.__workerspernode]
+
+            llc = _llc_size(cpus[0]) or 32 * MB
+            total = self.__llcmultiple * llc
+            limit = systop[n].meminfo.get('MemFree', 0) * self.__memfraction / 100.0
+            if limit and total > limit:
+                self._log(Log.INFO, "node %d: limiting buffers to %d%% of the free memory"
+                          % (n, self.__memfraction))
+                total = limit
+            bufsize = int(total / len(cpus)) // mmap.PAGESIZE * mmap.PAGESIZE
+            bufsize = max(bufsize, 2 * self.__stride, MB)
+            if bufsize * len(cpus) < 2 * llc:
+                self._log(Log.WARN, "node %d: the buffers (%d MB) partly fit in the caches (%d MB)"
+                          % (n, bufsize * len(cpus) // MB, llc // MB))
+
+            if self.__mode == 'mixed':
+                modes = ['stream', 'thrash'] * len(cpus)
+            else:
+                modes = [self.__mode] * len(cpus)
+            self.__nodes[n] = {'llc': llc, 'bufsize': bufsize,
+                               'workers': list(zip(cpus, modes))}
+            self._log(Log.DEBUG, "node %d: %d workers with %d MB buffers, llc %d MB"
+                      % (n, len(cpus), bufsize // MB, llc // MB))
+
+
+    def _WorkloadBuild(self):
+        # Nothing to build
+        self._setReady()
+
+
+    def _WorkloadPrepare(self):
+        # Forking rteval itself, with all its threads, is not safe
+        self.__mp = multiprocessing.get_context('forkserver')
+        self.__stopevent = self.__mp.Event()
+
+
+    def _WorkloadTask(self):
+        if self.__workers:
+            # Already running
+            return
+        for (n, node) in self.__nodes.items():
+            for (cpu, mode) in node['workers']:
+                (rconn, wconn) = self.__mp.Pipe(duplex=False)
+                proc = self.__mp.Process(target=_mem_worker,
+                                         name="memload-cpu%d" % cpu,
+                                         args=(mode, node['bufsize'], self.__stride, cpu,
+                                               self._cgroup_procs(), self.__stopevent, wconn))
+                proc.start()
+                wconn.close()
+                self.__workers.append((n, cpu, mode, proc, rconn))
+
+
+    def WorkloadAlive(self):
+        for (_, _, _, proc, _) in self.__workers:
+            if not proc.is_alive():
+                return False
+        return True
+
+
+    def _WorkloadCleanup(self):
+        if self.__workers:
+            self.__stopevent.set()
+        for (n, cpu, mode, proc, rconn) in self.__workers:
+            if rconn.poll(10):
+                res = rconn.recv()
+                node = self.__results.setdefault(n, {'stream': 0.0, 'thrash': 0.0})
+                node[mode] += res['duration'] and res['bytes'] / res['duration'] or 0.0
+            else:
+                self._log(Log.WARN, "no results from the worker on cpu %d" % cpu)
+                proc.terminate()
+            proc.join()
+            rconn.close()
+        self.__workers = []
+        self._setFinished()
+
+
+    def MakeReport(self):
+        if self._donotrun or not self.__results:
+            return None
+
+        rep_n = libxml2.newNode("memload")
+        rep_n.newProp("mode", self.__mode)
+        rep_n.newProp("stride", str(self.__stride))
+
+        total = 0.0
+        for n in sorted(self.__results.keys()):
+            res = self.__results[n]
+            node_n = rep_n.newChild(None, "node", None)
+            node_n.newProp("id", str(n))
+            node_n.newProp("workers", str(len(self.__nodes[n]['workers'])))
+            node_n.newProp("llc_size", str(self.__nodes[n]['llc']))
+            node_n.newProp("buffer_size", str(self.__nodes[n]['bufsize']))
+            node_n.newProp("bandwidth", "%.0f" % (res['stream'] + res['thrash']))
+            for mode in ('stream', 'thrash'):
+                if res[mode]:
+                    node_n.newProp("%s_bandwidth" % mode, "%.0f" % res[mode])
+            total += res['stream'] + res['thrash']
+        rep_n.newProp("bandwidth", "%.0f" % total)
+        return rep_n
+
+
+
+def ModuleParameters():
+    return {"mode": {"descr": "Access pattern: stream, thrash or mixed",
+                     "default": "mixed",
+                     "metavar": "MODE"},
+            "workers": {"descr": "Workers per node, 0 for one per load cpu",
+                        "default": 0,
+                        "metavar": "NUM"},
+            "llcmultiple": {"descr": "Buffer size per node, in multiples of the last level cache",
+                            "default": 4,
+                            "metavar": "NUM"},
+            "memfraction": {"descr": "Limit of the buffers, in percent of the node's free memory",
+                            "default": 10,
+                            "metavar": "PERCENT"},
+            "stride": {"descr": "Distance between the bytes read by thrash workers",
+                       "default": 4096 + CACHELINE,
+                       "metavar": "BYTES"},
+            }
+
+
+
+def create(config, logger):
+    return MemLoad(config, logger)
+
+
+
+def unit_test(rootdir):
+    import threading
+    try:
+        cpu = min(os.sched_getaffinity(0))
+        print("last level cache of cpu %d: %d kB" % (cpu, _llc_size(cpu) // 1024))
+
+        # Both kinds of workers, run in threads here
+        for mode in ('stream', 'thrash'):
+            stopevent = threading.Event()
+            (rconn, wconn) = multiprocessing.Pipe(duplex=False)
+            worker = threading.Thread(target=_mem_worker,
+                                      args=(mode, 4 * MB, 4096 + CACHELINE, cpu, None,
+                                            stopevent, wconn))
+            worker.start()
+            time.sleep(0.3)
+            stopevent.set()
+            worker.join()
+            res = rconn.recv()
+            if not res['bytes'] or not res['duration']:
+                raise Exception("%s worker results: %s" % (mode, res))
+            print("%s: %.0f MB/s" % (mode, res['bytes'] / res['duration'] / MB))
+        return 0
+    except Exception as e:
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        print("** EXCEPTION %s", str(e))
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(unit_test(None))
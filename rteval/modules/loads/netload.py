@@ -0,0 +1,486 @@
+#
+#   netload.py - rteval load module generating network traffic over
+#                loopback or a private veth pair
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import sys
+import time
+import errno
+import socket
+import struct
+import ctypes
+import subprocess
+import multiprocessing
+import libxml2
+from rteval.modules import rtevalRuntimeError
+from rteval.modules.loads import LoadThread
+from rteval.Log import Log
+from rteval.cgroups import join_cgroup
+
+CLONE_NEWNET = 0x40000000
+MSG_WAITFORONE = 0x10000
+
+# Addresses of the veth pair, the receivers are on the host side
+VETH_HOST = ('rtevl0', '10.209.0.1')
+VETH_PEER = ('rtevl1', '10.209.0.2')
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_iovec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+class MessageBatch:
+    """A batch of equally sized datagrams, sent or received with a single
+sendmmsg(2)/recvmmsg(2) call.  Falls back to one send()/recv() per message
+where the C library lacks these calls."""
+
+    def __init__(self, sock, msgsize, count):
+        self.sock = sock
+        self.msgsize = msgsize
+        self.count = count
+        self.__libc = ctypes.CDLL(None, use_errno=True)
+        self.__batched = hasattr(self.__libc, 'sendmmsg') and hasattr(self.__libc, 'recvmmsg')
+        self.__buf = ctypes.create_string_buffer(os.urandom(msgsize * count), msgsize * count)
+        self.__iov = (_iovec * count)()
+        self.__hdrs = (_mmsghdr * count)()
+        base = ctypes.addressof(self.__buf)
+        for i in range(count):
+            self.__iov[i].iov_base = base + i * msgsize
+            self.__iov[i].iov_len = msgsize
+            self.__hdrs[i].msg_hdr.msg_iov = ctypes.pointer(self.__iov[i])
+            self.__hdrs[i].msg_hdr.msg_iovlen = 1
+
+
+    def __check(self, ret):
+        if ret < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EINTR, errno.ECONNREFUSED):
+                return 0
+            raise OSError(err, os.strerror(err))
+        return ret
+
+
+    def send(self):
+        "Returns the number of datagrams sent"
+        if self.__batched:
+            return self.__check(self.__libc.sendmmsg(self.sock.fileno(), self.__hdrs, self.count, 0))
+        sent = 0
+        for i in range(self.count):
+            try:
+                self.sock.send(self.__buf[i * self.msgsize:(i + 1) * self.msgsize])
+                sent += 1
+            except (BlockingIOError, ConnectionRefusedError, InterruptedError):
+                break
+        return sent
+
+
+    def recv(self):
+        "Returns the number of datagrams received, waiting for at least one"
+        if self.__batched:
+            return self.__check(self.__libc.recvmmsg(self.sock.fileno(), self.__hdrs, self.count,
+                                                     MSG_WAITFORONE, None))
+        try:
+            self.sock.recv(self.msgsize)
+        except (BlockingIOError, InterruptedError, socket.timeout):
+            return 0
+        return 1
+
+
+
+def _setns(name):
+    "Moves the calling process into the named network namespace"
+    fd = os.open(os.path.join('/run/netns', name), os.O_RDONLY)
+    try:
+        if hasattr(os, 'setns'):
+            os.setns(fd, CLONE_NEWNET)
+        else:
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.setns(fd, CLONE_NEWNET) < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err))
+    finally:
+        os.close(fd)
+
+
+def _net_receiver(sock, protocol, msgsize, batch, cpus, cgprocs, stopevent, conn):
+    if cgprocs:
+        join_cgroup(cgprocs)
+    os.sched_setaffinity(0, cpus)
+    msgs = nbytes = 0
+    start = time.monotonic()
+    if protocol == 'udp':
+        # Wake up now and then to see if the run is over
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, struct.pack('ll', 0, 200000))
+        mb = MessageBatch(sock, msgsize, batch)
+        while not stopevent.is_set():
+            n = mb.recv()
+            msgs += n
+            nbytes += n * msgsize
+    else:
+        # The sender may connect late, or not at all
+        sock.settimeout(0.2)
+        peer = None
+        while peer is None and not stopevent.is_set():
+            try:
+                (peer, _) = sock.accept()
+            except (BlockingIOError, InterruptedError, socket.timeout):
+                continue
+        if peer is not None:
+            peer.setblocking(True)
+            peer.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, struct.pack('ll', 0, 200000))
+            buf = bytearray(msgsize * batch)
+            while not stopevent.is_set():
+                try:
+                    n = peer.recv_into(buf)
+                except (BlockingIOError, InterruptedError, socket.timeout):
+                    continue
+                if n == 0:
+                    break
+                nbytes += n
+            msgs = nbytes // msgsize
+            peer.close()
+    conn.send({'duration': time.monotonic() - start, 'msgs': msgs, 'bytes': nbytes})
+    conn.close()
+
+
+def _net_sender(addr, protocol, msgsize, batch, netns, cpus, cgprocs, stopevent, conn):
+    if cgprocs:
+        join_cgroup(cgprocs)
+    if netns:
+        _setns(netns)
+    os.sched_setaffinity(0, cpus)
+    msgs = nbytes = 0
+    start = time.monotonic()
+    if protocol == 'udp':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect(addr)
+        mb = MessageBatch(sock, msgsize, batch)
+        while not stopevent.is_set():
+            n = mb.send()
+            msgs += n
+            nbytes += n * msgsize
+    else:
+        sock = socket.create_connection(addr)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(0.2)
+        data = os.urandom(msgsize * batch)
+        while not stopevent.is_set():
+            try:
+                nbytes += sock.send(data)
+            except socket.timeout:
+                continue
+            except (BrokenPipeError, ConnectionResetError):
+                break
+        msgs = nbytes // msgsize
+    sock.close()
+    conn.send({'duration': time.monotonic() - start, 'msgs': msgs, 'bytes': nbytes})
+    conn.close()
+
+
+
+class NetLoad(LoadThread):
+    """Sends UDP datagrams (or a TCP stream) between sender/receiver process
+pairs bound to the load cpus of each NUMA node, keeping the NET_RX/NET_TX
+softirqs busy.  The traffic goes over loopback, or with mode 'veth' over a
+veth pair into a private network namespace, which is removed again when
+the run is over.  Datagrams are sent and received in batches with
+sendmmsg(2)/recvmmsg(2)."""
+
+    def __init__(self, config, logger):
+        LoadThread.__init__(self, "netload", config, logger)
+        self.__protocol = str(config.setdefault('protocol', 'udp')).lower()
+        self.__mode = str(config.setdefault('mode', 'loopback')).lower()
+        self.__msgsize = int(config.setdefault('msgsize', 256))
+        self.__batch = int(config.setdefault('batch', 64))
+        self.__pairs = int(config.setdefault('pairs', 1))
+        self.__nodes = {}
+        self.__netns = None
+        self.__workers = []
+        self.__results = []
+
+        if self.__protocol not in ('udp', 'tcp'):
+            raise rtevalRuntimeError(self, " unknown protocol '%s'" % self.__protocol)
+        if self.__mode not in ('loopback', 'veth'):
+            raise rtevalRuntimeError(self, " unknown mode '%s'" % self.__mode)
+
+
+    def __ip(self, *args):
+        nullfp = open(os.devnull, 'w')
+        ret = subprocess.call(['ip'] + list(args), stdin=subprocess.DEVNULL,
+                              stdout=nullfp, stderr=nullfp)
+        nullfp.close()
+        if ret:
+            raise RuntimeError("'ip %s' failed (ret=%d)" % (" ".join(args), ret))
+
+
+    def __setup_veth(self):
+        "Creates the namespace and the veth pair, returns the namespace name"
+        netns = "rteval-netload-%d" % os.getpid()
+        self.__ip('netns', 'add', netns)
+        try:
+            self.__ip('link', 'add', VETH_HOST[0], 'type', 'veth', 'peer', 'name', VETH_PEER[0])
+            self.__ip('link', 'set', VETH_PEER[0], 'netns', netns)
+            self.__ip('addr', 'add', VETH_HOST[1] + '/30', 'dev', VETH_HOST[0])
+            self.__ip('link', 'set', VETH_HOST[0], 'up')
+            self.__ip('-n', netns, 'addr', 'add', VETH_PEER[1] + '/30', 'dev', VETH_PEER[0])
+            self.__ip('-n', netns, 'link', 'set', VETH_PEER[0], 'up')
+            self.__ip('-n', netns, 'link', 'set', 'lo', 'up')
+        except (RuntimeError, OSError):
+            self.__ip('netns', 'del', netns)
+            raise
+        return netns
+
+
+    def _WorkloadSetup(self):
+        self.__nodes = dict(self._node_cpus())
+
+
+    def _WorkloadBuild(self):
+        if self.__mode == 'veth':
+            try:
+                self.__netns = self.__setup_veth()
+                self._log(Log.DEBUG, "created network namespace %s" % self.__netns)
+            except (RuntimeError, OSError) as err:
+                self._log(Log.WARN, "could not set up the veth pair, using loopback: %s" % err)
+                self.__mode = 'loopback'
+        self._setReady()
+
+
+    def _WorkloadPrepare(self):
+        # Forking rteval itself, with all its threads, is not safe
+        self.__mp = multiprocessing.get_context('forkserver')
+        self.__stopevent = self.__mp.Event()
+
+
+    def __start(self, target, args):
+        (rconn, wconn) = self.__mp.Pipe(duplex=False)
+        proc = self.__mp.Process(target=target, args=args + (self.__stopevent, wconn))
+        proc.start()
+        wconn.close()
+        return (proc, rconn)
+
+
+    def _WorkloadTask(self):
+        if self.__workers:
+            # Already running
+            return
+        host = self.__mode == 'veth' and VETH_HOST[1] or '127.0.0.1'
+        for (n, cpus) in self.__nodes.items():
+            for i in range(self.__pairs):
+                if self.__protocol == 'udp':
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+                    sock.bind((host, 0))
+                else:
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.bind((host, 0))
+                    sock.listen(1)
+                addr = sock.getsockname()
+                recv = self.__start(_net_receiver,
+                                    (sock, self.__protocol, self.__msgsize, self.__batch,
+                                     cpus, self._cgroup_procs()))
+                sock.close()
+                send = self.__start(_net_sender,
+                                    (addr, self.__protocol, self.__msgsize, self.__batch,
+                                     self.__netns, cpus, self._cgroup_procs()))
+                self.__workers.append((n, i, send, recv))
+                self._log(Log.DEBUG, "started %s pair %d on node %d (port %d)"
+                          % (self.__protocol, i, n, addr[1]))
+
+
+    def WorkloadAlive(self):
+        for (_, _, send, recv) in self.__workers:
+            if not (send[0].is_alive() and recv[0].is_alive()):
+                return False
+        return True
+
+
+    def __collect(self, worker):
+        (proc, rconn) = worker
+        res = None
+        if rconn.poll(10):
+            res = rconn.recv()
+        else:
+            proc.terminate()
+        proc.join()
+        rconn.close()
+        return res
+
+
+    def _WorkloadCleanup(self):
+        if self.__workers:
+            self.__stopevent.set()
+        for (n, i, send, recv) in self.__workers:
+            sent = self.__collect(send)
+            received = self.__collect(recv)
+            if sent is None or received is None:
+                self._log(Log.WARN, "no results from pair %d on node %d" % (i, n))
+                continue
+            self.__results.append((n, i, sent, received))
+        self.__workers = []
+        if self.__netns:
+            try:
+                # Removing the namespace also removes the veth pair
+                self.__ip('netns', 'del', self.__netns)
+            except RuntimeError as err:
+                self._log(Log.WARN, str(err))
+            self.__netns = None
+        self._setFinished()
+
+
+    def MakeReport(self):
+        if self._donotrun or not self.__results:
+            return None
+
+        rep_n = libxml2.newNode("netload")
+        rep_n.newProp("protocol", self.__protocol)
+        rep_n.newProp("mode", self.__mode)
+        rep_n.newProp("msgsize", str(self.__msgsize))
+        rep_n.newProp("batch", str(self.__batch))
+
+        total_pps = total_bps = 0.0
+        for (n, i, sent, received) in self.__results:
+            pair_n = rep_n.newChild(None, "pair", None)
+            pair_n.newProp("node", str(n))
+            pair_n.newProp("id", str(i))
+            for (tag, res) in (('sent', sent), ('received', received)):
+                res_n = pair_n.newChild(None, tag, None)
+                duration = res['duration'] or 1.0
+                res_n.newProp("packets", str(res['msgs']))
+                res_n.newProp("bytes", str(res['bytes']))
+                res_n.newProp("pps", "%.1f" % (res['msgs'] / duration))
+                res_n.newProp("bps", "%.0f" % (res['bytes'] * 8 / duration))
+            total_pps += received['msgs'] / (received['duration'] or 1.0)
+            total_bps += received['bytes'] * 8 / (received['duration'] or 1.0)
+            if self.__protocol == 'udp':
+                pair_n.newProp("dropped", str(max(sent['msgs'] - received['msgs'], 0)))
+        rep_n.newProp("pps", "%.1f" % total_pps)
+        rep_n.newProp("bps", "%.0f" % total_bps)
+        return rep_n
+
+
+
+def ModuleParameters():
+    return {"protocol": {"descr": "Traffic type, udp or tcp",
+                         "default": "udp",
+                         "metavar": "udp|tcp"},
+            "mode": {"descr": "Send over loopback or a veth pair into a private network namespace",
+                     "default": "loopback",
+                     "metavar": "loopback|veth"},
+            "msgsize": {"descr": "Size of each datagram or TCP write unit",
+                        "default": 256,
+                        "metavar": "BYTES"},
+            "batch": {"descr": "Datagrams per sendmmsg/recvmmsg call",
+                      "default": 64,
+                      "metavar": "NUM"},
+            "pairs": {"descr": "Sender/receiver pairs per node",
+                      "default": 1,
+                      "metavar": "NUM"},
+            }
+
+
+
+def create(config, logger):
+    return NetLoad(config, logger)
+
+
+
+def unit_test(rootdir):
+    import threading
+    try:
+        cpus = os.sched_getaffinity(0)
+
+        rsock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rsock.bind(('127.0.0.1', 0))
+        ssock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        ssock.connect(rsock.getsockname())
+        sent = MessageBatch(ssock, 128, 8).send()
+        received = MessageBatch(rsock, 128, 8).recv()
+        if sent != 8 or not 1 <= received <= 8:
+            raise Exception("MessageBatch sent %i and received %i datagrams" % (sent, received))
+        ssock.close()
+        rsock.close()
+        print("MessageBatch OK")
+
+        # A receiver and sender pair, run in threads here; the TCP receiver
+        # is also run without a sender connecting
+        for (protocol, with_sender) in (('udp', True), ('tcp', True), ('tcp', False)):
+            if protocol == 'udp':
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.bind(('127.0.0.1', 0))
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.bind(('127.0.0.1', 0))
+                sock.listen(1)
+            stopevent = threading.Event()
+            workers = []
+            (rconn, wconn) = multiprocessing.Pipe(duplex=False)
+            workers.append((threading.Thread(target=_net_receiver,
+                                             args=(sock, protocol, 256, 16, cpus, None,
+                                                   stopevent, wconn)), rconn))
+            if with_sender:
+                (rconn, wconn) = multiprocessing.Pipe(duplex=False)
+                workers.append((threading.Thread(target=_net_sender,
+                                                 args=(sock.getsockname(), protocol, 256, 16,
+                                                       None, cpus, None, stopevent, wconn)),
+                                rconn))
+            for (t, _) in workers:
+                t.start()
+            time.sleep(0.5)
+            stopevent.set()
+            res = []
+            for (t, rconn) in workers:
+                t.join(10)
+                if t.is_alive():
+                    raise Exception("%s worker did not stop" % protocol)
+                res.append(rconn.recv())
+            sock.close()
+            if with_sender and not (res[0]['bytes'] and res[1]['bytes']):
+                raise Exception("%s: nothing sent or received: %s" % (protocol, res))
+            print("%s: %s" % (protocol, " ".join(["%i msgs" % r['msgs'] for r in res])))
+        return 0
+    except Exception as e:
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        print("** EXCEPTION %s", str(e))
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(unit_test(None))
@@ -1,22 +1,113 @@
 """ Module containing class Stressng to manage stress-ng as an rteval load """
 import os
 import os.path
+import sys
 import time
 import subprocess
 import signal
 from rteval.modules.loads import CommandLineLoad
 from rteval.Log import Log
-from rteval.misc import expand_cpulist
-from rteval.systopology import SysTopology
+from rteval.misc import compress_cpulist
+
+
+def parse_stressors(option, arg=None):
+    """ Parses 'cpu:2,vm,hdd:1' into [('cpu', 2), ('vm', arg), ('hdd', 1)],
+    arg being the value passed to stress-ng as is for the stressors without
+    a count (None for one worker per cpu) """
+    stressors = []
+    for s in str(option).split(','):
+        s = s.strip().lstrip('-')
+        if not s:
+            continue
+        if ':' in s:
+            (name, count) = s.split(':', 1)
+            stressors.append((name, int(count)))
+        else:
+            stressors.append((s, arg is not None and str(arg) or None))
+    return stressors
+
+
+def parse_yaml_metrics(path):
+    """ Reads the metrics section of a stress-ng --yaml file, returns a list
+    of dicts with the stressor name and its figures.  Only this simple part
+    of the YAML output is parsed, so PyYAML is not needed """
+    metrics = []
+    current = None
+    insection = False
+    with open(path) as fp:
+        for line in fp:
+            if not line.strip() or line.startswith('---'):
+                continue
+            if not line[0].isspace():
+                insection = line.strip() == 'metrics:'
+                continue
+            if not insection:
+                continue
+            item = line.strip()
+            if item.startswith('- '):
+                current = {}
+                metrics.append(current)
+                item = item[2:]
+            if current is None or ':' not in item:
+                continue
+            (key, value) = item.split(':', 1)
+            current[key.strip()] = value.strip()
+    return [m for m in metrics if 'stressor' in m]
+
+
+class StressngInstance:
+    " One stress-ng process, running all the stressors on the cpus of a node "
+    def __init__(self, node, cpus, args, yamlfile):
+        self.node = node
+        self.cpus = cpus
+        self.yamlfile = yamlfile
+        self.command = args
+        self.args = args + ['--taskset', compress_cpulist([str(c) for c in cpus]),
+                            '--metrics-brief', '--yaml', yamlfile]
+        self.process = None
+        self.metrics = []
+
+    def start(self, sin, sout, serr, wrap=None):
+        " Starts stress-ng, removing the metrics of an earlier run "
+        if os.path.exists(self.yamlfile):
+            os.unlink(self.yamlfile)
+        args = wrap and wrap(self.args) or self.args
+        self.process = subprocess.Popen(args, stdin=sin, stdout=sout, stderr=serr)
+
+    def kill(self):
+        " Stops stress-ng right away, without waiting for its metrics "
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process = None
+
+    def stop(self):
+        " stress-ng writes its metrics when interrupted "
+        if self.process is None:
+            return
+        while self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+            time.sleep(1)
+        if os.path.exists(self.yamlfile):
+            self.metrics = parse_yaml_metrics(self.yamlfile)
+
 
 class Stressng(CommandLineLoad):
-    " This class creates a load module that runs stress-ng "
+    """ This class creates a load module that runs stress-ng, one instance per
+    NUMA node pinned to the load cpus of that node.  'option' lists the
+    stressors to run, as 'cpu:2,vm,hdd:1'; the number after a stressor is
+    the number of its workers per node.  'arg' is passed to stress-ng as is
+    after the stressors without a number.  Without either one worker per cpu
+    is started """
     def __init__(self, config, logger):
         CommandLineLoad.__init__(self, "stressng", config, logger)
         self.logger = logger
         self.started = False
-        self.process = None
+        self.instances = []
         self.cfg = config
+        self.stressors = []
         self.__in = None
         self.__out = None
         self.__err = None
@@ -25,6 +116,7 @@ class Stressng(CommandLineLoad):
         " Only run this module if the user specifies an option "
         if self.cfg.option is not None:
             self._donotrun = False
+            self.stressors = parse_stressors(self.cfg.option, self.cfg.arg)
         else:
             self._donotrun = True
 
@@ -46,35 +138,27 @@ class Stressng(CommandLineLoad):
         else:
             self.__out = self.__err = self.__nullfp
 
+        # the nodes with cpus available for running, and their cpus
+        cpus = dict(self._node_cpus())
+        nodes = list(cpus.keys())
+
+        logdir = os.path.join(self.reportdir, "logs")
+        if not os.path.isdir(logdir):
+            logdir = self.builddir
+
         # stress-ng is only run if the user specifies an option
-        self.args = ['stress-ng']
-        self.args.append('--%s' % str(self.cfg.option))
-        if self.cfg.arg is not None:
-            self.args.append(self.cfg.arg)
-        if self.cfg.timeout is not None:
-            self.args.append('--timeout %s' % str(self.cfg.timeout))
-
-        systop = SysTopology()
-        # get the number of nodes
-        nodes = systop.getnodes()
-
-        # get the cpus for each node
-        cpus = {}
-        for n in nodes:
-            cpus[n] = systop.getcpus(int(n))
-            # if a cpulist was specified, only allow cpus in that list on the node
-            if self.cpulist:
-                cpus[n] = [c for c in cpus[n] if str(c) in expand_cpulist(self.cpulist)]
-
-        # remove nodes with no cpus available for running
-        for node, cpu in list(cpus.items()):
-            if not cpu:
-                nodes.remove(node)
-                self._log(Log.DEBUG, "node %s has no available cpus, removing" % node)
-        if self.cpulist:
-            for node in nodes:
-                cpulist = ",".join([str(n) for n in cpus[node]])
-                self.args.append('--taskset %s' % cpulist)
+        self.instances = []
+        for node in nodes:
+            args = ['stress-ng']
+            for (name, count) in self.stressors:
+                args += ['--%s' % name, str(count is not None and count or len(cpus[node]))]
+            if self.cfg.timeout is not None:
+                args += ['--timeout', str(self.cfg.timeout)]
+            self.instances.append(StressngInstance(node, cpus[node], args,
+                                                   os.path.join(logdir, "stressng-node%d.yaml" % node)))
+        if self.instances:
+            # The command line, without the per node arguments
+            self.args = self.instances[0].command
 
     def _WorkloadTask(self):
         """ Kick of the workload here """
@@ -82,37 +166,74 @@ class Stressng(CommandLineLoad):
             # Only start the task once
             return
 
-        self._log(Log.DEBUG, "starting with %s" % " ".join(self.args))
         try:
-            self.process = subprocess.Popen(self.args,
-                                            stdout=self.__out,
-                                            stderr=self.__err,
-                                            stdin=self.__in)
+            for inst in self.instances:
+                self._log(Log.DEBUG, "starting on node %d with %s" % (inst.node, " ".join(inst.args)))
+                inst.start(self.__in, self.__out, self.__err, self._cgroup_wrap)
             self.started = True
-            self.jobs = 1
+            self.jobs = len(self.instances)
             self._log(Log.DEBUG, "running")
-        except OSError:
-            self._log(Log.DEBUG, "Failed to run")
+        except OSError as err:
+            self._log(Log.WARN, "Failed to run: %s" % err)
+            # Do not leave the nodes started so far loaded
+            for inst in self.instances:
+                inst.kill()
             self.started = False
         return
 
     def WorkloadAlive(self):
-        " Return true if stress-ng workload is alive "
-        if self.started:
-            return self.process.poll() is None
-        return False
+        " Return true while all the stress-ng instances are running "
+        if not self.started:
+            return False
+        for inst in self.instances:
+            if inst.process.poll() is not None:
+                return False
+        return True
 
     def _WorkloadCleanup(self):
         " Makesure to kill stress-ng before rteval ends "
         if not self.started:
             return
-        # poll() returns None if the process is still running
-        while self.process.poll() is None:
-            self._log(Log.DEBUG, "Sending SIGINT")
-            self.process.send_signal(signal.SIGINT)
-            time.sleep(2)
+        self._log(Log.DEBUG, "Sending SIGINT")
+        for inst in self.instances:
+            inst.stop()
         return
 
+    def MakeReport(self):
+        " The command line, with the bogo-ops figures per node and in total "
+        rep_n = CommandLineLoad.MakeReport(self)
+        if rep_n is None:
+            return None
+
+        totals = {}
+        for inst in self.instances:
+            inst_n = rep_n.newChild(None, "instance", None)
+            inst_n.newProp("node", str(inst.node))
+            inst_n.newProp("cpus", compress_cpulist([str(c) for c in inst.cpus]))
+            for m in inst.metrics:
+                st_n = inst_n.newChild(None, "stressor", None)
+                st_n.newProp("name", m['stressor'])
+                for (key, attr) in (('bogo-ops', 'bogo_ops'),
+                                    ('bogo-ops-per-second-real-time', 'ops_per_sec'),
+                                    ('wall-clock-time', 'real_time'),
+                                    ('user-time', 'user_time'),
+                                    ('system-time', 'system_time')):
+                    if key in m:
+                        st_n.newProp(attr, m[key])
+                try:
+                    tot = totals.setdefault(m['stressor'], [0, 0.0])
+                    tot[0] += int(m.get('bogo-ops', 0))
+                    tot[1] += float(m.get('bogo-ops-per-second-real-time', 0))
+                except ValueError:
+                    pass
+
+        for (name, (ops, rate)) in sorted(totals.items()):
+            st_n = rep_n.newChild(None, "stressor", None)
+            st_n.newProp("name", name)
+            st_n.newProp("bogo_ops", str(ops))
+            st_n.newProp("ops_per_sec", "%.2f" % rate)
+        return rep_n
+
 
 def create(config, logger):
     """ Create an instance of the Stressng class in stressng module """
@@ -122,11 +243,11 @@ def ModuleParameters():
     """ Commandline options for Stress-ng """
     return {
         "option": {
-            "descr": "stressor specific option",
+            "descr": "stressors to run, e.g. cpu:2,vm,hdd:1",
             "metavar": "OPTION"
         },
         "arg": {
-            "descr": "stressor specific arg",
+            "descr": "value given to the stressors without a number in option",
             "metavar" : "ARG"
         },
         "timeout": {
@@ -134,3 +255,62 @@ def ModuleParameters():
             "metavar" : "T"
         },
         }
+
+
+def unit_test(rootdir):
+    import tempfile
+    try:
+        for (option, arg, expected) in (
+                ('cpu:2,vm,hdd:1', None, [('cpu', 2), ('vm', None), ('hdd', 1)]),
+                ('cpu', 4, [('cpu', '4')]),
+                (' --cpu:2, ,vm ', '1', [('cpu', 2), ('vm', '1')]),
+                ('matrix:0', None, [('matrix', 0)])):
+            ret = parse_stressors(option, arg)
+            if ret != expected:
+                raise Exception("parse_stressors(%r, %r) returned %r" % (option, arg, ret))
+        try:
+            parse_stressors('cpu:two')
+            raise Exception("parse_stressors() accepted a bad count")
+        except ValueError:
+            pass
+        print("parse_stressors OK")
+
+        # As written by stress-ng --metrics-brief --yaml
+        with tempfile.NamedTemporaryFile('w', suffix='.yaml') as f:
+            f.write("---\n"
+                    "system-info:\n"
+                    "      stress-ng-version: 0.17.06\n"
+                    "      run-by: root\n"
+                    "      cpus: 4\n"
+                    "metrics:\n"
+                    "    - stressor: cpu\n"
+                    "      bogo-ops: 15426\n"
+                    "      bogo-ops-per-second-usr-sys-time: 3851.190418\n"
+                    "      bogo-ops-per-second-real-time: 3853.125186\n"
+                    "      wall-clock-time: 4.003520\n"
+                    "      user-time: 4.001200\n"
+                    "      system-time: 0.004360\n"
+                    "    - stressor: vm\n"
+                    "      bogo-ops: 8064\n"
+                    "      bogo-ops-per-second-real-time: 2014.380132\n"
+                    "times:\n"
+                    "      run-time: 4.01\n"
+                    "...\n")
+            f.flush()
+            metrics = parse_yaml_metrics(f.name)
+        if [m['stressor'] for m in metrics] != ['cpu', 'vm']:
+            raise Exception("parse_yaml_metrics() returned %r" % metrics)
+        if metrics[0]['bogo-ops'] != '15426' or metrics[0]['system-time'] != '0.004360' \
+           or metrics[1]['bogo-ops-per-second-real-time'] != '2014.380132' \
+           or 'run-time' in metrics[1]:
+            raise Exception("parse_yaml_metrics() returned %r" % metrics)
+        print("parse_yaml_metrics OK")
+        return 0
+    except Exception as e:
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        print("** EXCEPTION %s", str(e))
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(unit_test(None))
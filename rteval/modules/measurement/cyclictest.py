@@ -35,6 +35,7 @@ import libxml2
 from rteval.Log import Log
 from rteval.modules import rtevalModulePrototype
 from rteval.misc import expand_cpulist, online_cpus, cpuinfo
+from rteval.tracecapture import TraceCapture
 
 class RunData:
     '''class to keep instance data from a cyclictest run'''
@@ -192,6 +193,7 @@ class Cyclictest(rtevalModulePrototype):
     def __init__(self, config, logger=None):
         rtevalModulePrototype.__init__(self, 'measurement', 'cyclictest', logger)
         self.__cfg = config
+        self.__logger = logger
 
         # Create a RunData object per CPU core
         self.__numanodes = int(self.__cfg.setdefault('numanodes', 0))
@@ -241,19 +243,8 @@ class Cyclictest(rtevalModulePrototype):
         self.__started = False
         self.__cyclicoutput = None
         self.__breaktraceval = None
-
-
-    @staticmethod
-    def __get_debugfs_mount():
-        ret = None
-        mounts = open('/proc/mounts')
-        for l in mounts:
-            field = l.split()
-            if field[2] == "debugfs":
-                ret = field[1]
-                break
-        mounts.close()
-        return ret
+        self.__tracecapture = None
+        self.__tracefile = None
 
 
     def _WorkloadSetup(self):
@@ -286,6 +277,14 @@ class Cyclictest(rtevalModulePrototype):
         if 'breaktrace' in self.__cfg and self.__cfg.breaktrace:
             self.__cmd.append("-b%d" % int(self.__cfg.breaktrace))
             self.__cmd.append("--tracemark")
+            try:
+                self.__tracecapture = TraceCapture(self.__cfg.reportdir or ".",
+                                                   self.__cfg.tracer,
+                                                   self.__cfg.traceevents,
+                                                   self.__cfg.tracebufsize,
+                                                   logger=self.__logger)
+            except RuntimeError as err:
+                self._log(Log.WARN, "breaktrace without trace capture: %s" % err)
 
         # Buffer for cyclictest data written to stdout
         self.__cyclicoutput = tempfile.SpooledTemporaryFile(mode='w+b')
@@ -299,14 +298,17 @@ class Cyclictest(rtevalModulePrototype):
         self._log(Log.DEBUG, "starting with cmd: %s" % " ".join(self.__cmd))
         self.__nullfp = os.open('/dev/null', os.O_RDWR)
 
-        debugdir = self.__get_debugfs_mount()
-        if 'breaktrace' in self.__cfg and self.__cfg.breaktrace and debugdir:
-            # Ensure that the trace log is clean
-            trace = os.path.join(debugdir, 'tracing', 'trace')
-            fp = open(os.path.join(trace), "w")
-            fp.write("0")
-            fp.flush()
-            fp.close()
+        if self.__tracecapture:
+            # Set up the tracer and start with clean trace buffers
+            try:
+                self.__tracecapture.Setup()
+            except (OSError, RuntimeError) as err:
+                self._log(Log.WARN, "breaktrace without trace capture: %s" % err)
+                try:
+                    self.__tracecapture.Restore()
+                except (OSError, RuntimeError) as err:
+                    self._log(Log.WARN, "could not restore the tracer settings: %s" % err)
+                self.__tracecapture = None
 
         self.__cyclicoutput.seek(0)
         try:
@@ -362,6 +364,15 @@ class Cyclictest(rtevalModulePrototype):
                 self.__cyclicdata[core].bucket(index, int(vals[i+1]))
                 self.__cyclicdata['system'].bucket(index, int(vals[i+1]))
 
+        if self.__tracecapture:
+            try:
+                if self.__breaktraceval:
+                    self.__tracefile = self.__tracecapture.Capture()
+            except (IOError, OSError, RuntimeError) as err:
+                self._log(Log.WARN, "could not save the trace: %s" % err)
+            finally:
+                self.__tracecapture.Restore()
+
         # generate statistics for each RunData object
         for n in list(self.__cyclicdata.keys()):
             #print "reducing self.__cyclicdata[%s]" % n
@@ -387,6 +398,9 @@ class Cyclictest(rtevalModulePrototype):
             btv_n = abrt_n.newChild(None, 'breaktrace', None)
             btv_n.newProp('latency_threshold', str(self.__cfg.breaktrace))
             btv_n.newProp('measured_latency', str(self.__breaktraceval))
+            if self.__tracefile:
+                # Relative to the report directory
+                btv_n.newProp('tracefile', self.__tracefile)
             abrt = True
 
         # Only add the <abort_report/> node if an abortion happened
@@ -421,7 +435,19 @@ def ModuleParameters():
                          "metavar": "PRIO"},
             "breaktrace": {"descr": "Send a break trace command when latency > USEC",
                            "default": None,
-                           "metavar": "USEC"}
+                           "metavar": "USEC"},
+            "tracer": {"descr": "ftrace tracer used with breaktrace",
+                       "default": "nop",
+                       "metavar": "TRACER"},
+            "traceevents": {"descr": "Trace events enabled with breaktrace",
+                            "default": "sched:sched_switch sched:sched_wakeup "
+                                       "irq:irq_handler_entry irq:irq_handler_exit "
+                                       "irq:softirq_entry irq:softirq_exit",
+                            "metavar": "EVENTS"},
+            "tracebufsize": {"descr": "Per cpu trace buffer size used with breaktrace, "
+                                      "0 keeps the current size",
+                             "default": 0,
+                             "metavar": "KB"}
             }
 
 
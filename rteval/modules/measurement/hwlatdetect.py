@@ -0,0 +1,255 @@
+#
+#   hwlatdetect.py - rteval measurement module detecting hardware/firmware
+#                    induced latencies with the kernel hwlat tracer
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import re
+import time
+import libxml2
+from rteval.Log import Log
+from rteval.modules import rtevalModulePrototype
+from rteval.tracecapture import tracefs_mount
+
+
+class hwlatdetect(rtevalModulePrototype):
+    """Runs the hwlat tracer, which spins with interrupts disabled for
+'width' microseconds of every 'window' and records each gap in time longer
+than the threshold.  The samples are read from trace_pipe while the tracer
+runs."""
+
+    # #1     inner/outer(us):   12/14    ts:1497286321.123456789 count:3
+    __sample_rx = re.compile(r'inner/outer\(us\):\s*(\d+)/(\d+)\s+ts:(\d+\.\d+)')
+
+    def __init__(self, config, logger=None):
+        rtevalModulePrototype.__init__(self, 'measurement', 'hwlatdetect', logger)
+        self.__cfg = config
+        self.__threshold = int(self.__cfg.setdefault('threshold', 15))
+        self.__width = int(self.__cfg.setdefault('width', 500000))
+        self.__window = int(self.__cfg.setdefault('window', 1000000))
+        self.__tracedir = tracefs_mount()
+        self.__saved = {}
+        self.__pipe = None
+        self.__partial = b""
+        self.__samples = []
+        self.__started = None
+        self.__stopped = None
+        self.__aborted = False
+
+        if self.__width >= self.__window:
+            self._log(Log.WARN, "width (%d) must be smaller than window (%d), not running"
+                      % (self.__width, self.__window))
+            self.__aborted = True
+        elif self.__tracedir is None:
+            self._log(Log.WARN, "tracefs is not mounted, not running")
+            self.__aborted = True
+        elif 'hwlat' not in self.__read('available_tracers').split():
+            self._log(Log.WARN, "the kernel has no hwlat tracer, not running")
+            self.__aborted = True
+        self._donotrun = self.__aborted
+
+
+    def __path(self, name):
+        return os.path.join(self.__tracedir, name)
+
+
+    def __read(self, name):
+        fp = open(self.__path(name), 'r')
+        data = fp.read().strip()
+        fp.close()
+        return data
+
+
+    def __write(self, name, value):
+        if name not in self.__saved:
+            self.__saved[name] = self.__read(name)
+        self._log(Log.DEBUG, "%s = %s" % (name, value))
+        fp = open(self.__path(name), 'w')
+        fp.write(str(value))
+        fp.close()
+
+
+    def _WorkloadSetup(self):
+        pass
+
+
+    def _WorkloadBuild(self):
+        self._setReady()
+
+
+    def _WorkloadPrepare(self):
+        self.__write('tracing_on', '0')
+        self.__write('current_tracer', 'hwlat')
+        self.__write('tracing_thresh', self.__threshold)
+        self.__write('hwlat_detector/width', self.__width)
+        self.__write('hwlat_detector/window', self.__window)
+        # Start with an empty buffer
+        fp = open(self.__path('trace'), 'w')
+        fp.close()
+
+
+    def __read_samples(self):
+        "Parses whatever is available in trace_pipe, without blocking"
+        while True:
+            try:
+                data = os.read(self.__pipe, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            lines = (self.__partial + data).split(b'\n')
+            self.__partial = lines.pop()
+            for l in lines:
+                m = self.__sample_rx.search(l.decode(errors='replace'))
+                if m is None:
+                    continue
+                (inner, outer, ts) = m.groups()
+                self.__samples.append((ts, int(inner), int(outer)))
+                self._log(Log.DEBUG, "hardware latency %sus at %s" % (max(int(inner), int(outer)), ts))
+
+
+    def _WorkloadTask(self):
+        if self.__pipe is None:
+            self.__pipe = os.open(self.__path('trace_pipe'), os.O_RDONLY | os.O_NONBLOCK)
+            self.__started = time.time()
+            self.__write('tracing_on', '1')
+            return
+        self.__read_samples()
+
+
+    def WorkloadAlive(self):
+        return self.__pipe is not None
+
+
+    def _WorkloadCleanup(self):
+        if self.__pipe is not None:
+            self.__stopped = time.time()
+            # Stop tracing first, so nothing is lost between reading and closing
+            fp = open(self.__path('tracing_on'), 'w')
+            fp.write('0')
+            fp.close()
+            self.__read_samples()
+            os.close(self.__pipe)
+            self.__pipe = None
+
+        # Put back the tracer settings found, the tracer last
+        for name in ('tracing_thresh', 'hwlat_detector/width', 'hwlat_detector/window',
+                     'current_tracer', 'tracing_on'):
+            if name in self.__saved:
+                fp = open(self.__path(name), 'w')
+                fp.write(self.__saved[name])
+                fp.close()
+        self.__saved = {}
+        self._setFinished()
+
+
+    def MakeReport(self):
+        rep_n = libxml2.newNode('hwlatdetect')
+        rep_n.newProp('format', '1.0')
+        if self.__aborted:
+            rep_n.newProp('aborted', '1')
+            return rep_n
+        rep_n.addChild(self.GetTimestamps())
+
+        duration = 0
+        if self.__started and self.__stopped:
+            duration = int(self.__stopped - self.__started)
+        runp_n = rep_n.newChild(None, 'RunParams', None)
+        runp_n.newProp('duration', str(duration))
+        runp_n.newProp('threshold', str(self.__threshold))
+        runp_n.newProp('window', str(self.__window))
+        runp_n.newProp('width', str(self.__width))
+
+        samples_n = rep_n.newChild(None, 'samples', None)
+        samples_n.newProp('count', str(len(self.__samples)))
+        if self.__samples:
+            lat = [max(inner, outer) for (_, inner, outer) in self.__samples]
+            samples_n.newProp('min', str(min(lat)))
+            samples_n.newProp('avg', "%.2f" % (sum(lat) / float(len(lat))))
+            samples_n.newProp('max', str(max(lat)))
+        for (ts, inner, outer) in self.__samples:
+            s_n = samples_n.newChild(None, 'sample', None)
+            s_n.newProp('timestamp', ts)
+            s_n.newProp('duration', str(max(inner, outer)))
+            s_n.newProp('inner', str(inner))
+            s_n.newProp('outer', str(outer))
+
+        return rep_n
+
+
+
+def ModuleInfo():
+    # The hwlat tracer keeps cpus busy with interrupts disabled, it must
+    # neither run with loads nor with other measurements
+    return {"parallel": False,
+            "loads": False}
+
+
+
+def ModuleParameters():
+    return {"threshold": {"descr": "Report gaps longer than USEC microseconds",
+                          "default": 15,
+                          "metavar": "USEC"},
+            "width": {"descr": "Time spent sampling within each window",
+                      "default": 500000,
+                      "metavar": "USEC"},
+            "window": {"descr": "Length of a sampling window",
+                       "default": 1000000,
+                       "metavar": "USEC"}
+            }
+
+
+
+def create(params, logger):
+    return hwlatdetect(params, logger)
+
+
+if __name__ == '__main__':
+    from rteval.rtevalConfig import rtevalConfig
+
+    l = Log()
+    l.SetLogVerbosity(Log.INFO|Log.DEBUG|Log.ERR|Log.WARN)
+
+    cfg = rtevalConfig({}, logger=l)
+    prms = {}
+    modprms = ModuleParameters()
+    for c, p in list(modprms.items()):
+        prms[c] = p['default']
+    cfg.AppendConfig('hwlatdetect', prms)
+
+    cfg_ct = cfg.GetSection('hwlatdetect')
+
+    runtime = 10
+
+    c = hwlatdetect(cfg_ct, l)
+    c.start()
+    c.setStart()
+    print("Running for approx %i seconds" % runtime)
+    time.sleep(runtime)
+    c.setStop()
+    c.WaitForCompletion()
+    rep_n = c.MakeReport()
+
+    xml = libxml2.newDoc('1.0')
+    xml.setRootElement(rep_n)
+    xml.saveFormatFileEnc('-', 'UTF-8', 1)
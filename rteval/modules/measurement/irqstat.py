@@ -0,0 +1,259 @@
+#
+#   irqstat.py - rteval measurement module sampling the interrupts and
+#                softirqs handled by the measured cpus
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import time
+import heapq
+import libxml2
+from rteval.Log import Log
+from rteval.modules import rtevalModulePrototype
+from rteval.misc import expand_cpulist, online_cpus
+from rteval.procstat import PercpuTableReader
+
+
+class IrqCounter:
+    "Per cpu totals and peak rates of a single interrupt or softirq"
+
+    def __init__(self, kind, name, description, counts):
+        self.kind = kind
+        self.name = name
+        self.description = description
+        self.last = counts
+        self.total = [0] * len(counts)
+        self.peak = [0] * len(counts)
+        self.peak_time = [0.0] * len(counts)
+
+
+class irqstat(rtevalModulePrototype):
+    """Samples /proc/interrupts and /proc/softirqs at a high rate and keeps,
+for every measured cpu, the totals and peak rates of each interrupt source
+plus the intervals with the most interrupt activity.  The samples are
+taken with CLOCK_MONOTONIC, the clock used by cyclictest and by ftrace's
+'mono' trace clock, so bursts can be matched with latency spikes."""
+
+    def __init__(self, config, logger=None):
+        rtevalModulePrototype.__init__(self, 'measurement', 'irqstat', logger)
+        self.__cfg = config
+        self.__interval = float(self.__cfg.setdefault('interval', 0.01))
+        self.__nbursts = int(self.__cfg.setdefault('bursts', 10))
+
+        if self.__cfg.cpulist:
+            self.__cpus = [int(c) for c in expand_cpulist(self.__cfg.cpulist)]
+        else:
+            self.__cpus = [int(c) for c in online_cpus()]
+        cpuset = os.sched_getaffinity(0)
+        self.__cpus = [c for c in self.__cpus if c in cpuset]
+
+        self.__readers = []
+        self.__counters = {}
+        self.__bursts = {}
+        self.__numsamples = 0
+        self.__start = None
+        self.__start_realtime = None
+        self.__last = None
+
+
+    def _WorkloadSetup(self):
+        # Nothing to do here for irqstat
+        pass
+
+
+    def _WorkloadBuild(self):
+        # Nothing to build
+        self._setReady()
+
+
+    def _WorkloadPrepare(self):
+        self.__readers = [('interrupt', PercpuTableReader('/proc/interrupts', self.__cpus,
+                                                          described=True)),
+                          ('softirq', PercpuTableReader('/proc/softirqs', self.__cpus))]
+        self.__bursts = dict([(c, []) for c in self.__cpus])
+
+
+    def __sample(self):
+        now = time.clock_gettime(time.CLOCK_MONOTONIC)
+        elapsed = self.__last is not None and now - self.__last or None
+        self.__last = now
+        self.__numsamples += 1
+
+        burst = dict([(c, []) for c in self.__cpus])
+        for (kind, reader) in self.__readers:
+            cpus = reader.GetCpus()
+            for (name, counts) in reader.read().items():
+                ctr = self.__counters.get((kind, name))
+                if ctr is None:
+                    self.__counters[(kind, name)] = IrqCounter(kind, name,
+                                                               reader.GetDescription(name),
+                                                               counts)
+                    continue
+                for (i, cnt) in enumerate(counts):
+                    delta = cnt - ctr.last[i]
+                    if not delta:
+                        continue
+                    ctr.total[i] += delta
+                    if elapsed and delta / elapsed > ctr.peak[i]:
+                        ctr.peak[i] = delta / elapsed
+                        ctr.peak_time[i] = now
+                    burst[cpus[i]].append((delta, kind, name))
+                ctr.last = counts
+
+        # Keep the intervals with the most interrupt activity per cpu
+        for (cpu, events) in burst.items():
+            if not events:
+                continue
+            count = sum([e[0] for e in events])
+            if len(self.__bursts[cpu]) < self.__nbursts:
+                heapq.heappush(self.__bursts[cpu], (count, now, elapsed, events))
+            elif count > self.__bursts[cpu][0][0]:
+                heapq.heapreplace(self.__bursts[cpu], (count, now, elapsed, events))
+
+
+    def _WorkloadTask(self):
+        # Keep the sampling off the measured cpus
+        housekeeping = os.sched_getaffinity(0).difference(self.__cpus)
+        if housekeeping:
+            os.sched_setaffinity(0, housekeeping)
+        else:
+            self._log(Log.WARN, "no cpus left for sampling outside the measured cpus")
+
+        self.__start = time.clock_gettime(time.CLOCK_MONOTONIC)
+        self.__start_realtime = time.time()
+        nexttime = time.monotonic()
+        while not self.shouldStop():
+            self.__sample()
+            nexttime += self.__interval
+            delay = nexttime - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                nexttime = time.monotonic()
+
+
+    def WorkloadAlive(self):
+        # The sampling runs in the module thread itself
+        return True
+
+
+    def _WorkloadCleanup(self):
+        for (_, reader) in self.__readers:
+            reader.close()
+        self._setFinished()
+
+
+    def MakeReport(self):
+        rep_n = libxml2.newNode('irqstat')
+        rep_n.newProp('interval', str(self.__interval))
+        rep_n.newProp('samples', str(self.__numsamples))
+        rep_n.newProp('clock', 'CLOCK_MONOTONIC')
+        if self.__start is not None:
+            # Maps the monotonic times to wall clock time
+            rep_n.newProp('start', "%.6f" % self.__start)
+            rep_n.newProp('start_realtime', "%.6f" % self.__start_realtime)
+        rep_n.addChild(self.GetTimestamps())
+
+        counters = sorted(self.__counters.values(), key=lambda c: (c.kind, c.name))
+        for (i, cpu) in enumerate(self.__cpus):
+            cpu_n = rep_n.newChild(None, 'cpu', None)
+            cpu_n.newProp('id', str(cpu))
+            totals = {'interrupt': 0, 'softirq': 0}
+            for ctr in counters:
+                if i >= len(ctr.total) or not ctr.total[i]:
+                    continue
+                totals[ctr.kind] += ctr.total[i]
+                irq_n = cpu_n.newChild(None, ctr.kind, None)
+                irq_n.newProp('name', ctr.name)
+                if ctr.description:
+                    irq_n.newProp('description', ctr.description)
+                irq_n.newProp('total', str(ctr.total[i]))
+                irq_n.newProp('peak_rate', "%.1f" % ctr.peak[i])
+                irq_n.newProp('peak_time', "%.6f" % ctr.peak_time[i])
+            cpu_n.newProp('interrupts', str(totals['interrupt']))
+            cpu_n.newProp('softirqs', str(totals['softirq']))
+
+            for (count, when, elapsed, events) in sorted(self.__bursts.get(cpu, []), reverse=True):
+                burst_n = cpu_n.newChild(None, 'burst', None)
+                burst_n.newProp('time', "%.6f" % when)
+                burst_n.newProp('duration', "%.6f" % (elapsed or 0.0))
+                burst_n.newProp('count', str(count))
+                for (delta, kind, name) in sorted(events, reverse=True):
+                    ev_n = burst_n.newChild(None, kind, None)
+                    ev_n.newProp('name', name)
+                    ev_n.newProp('count', str(delta))
+
+        return rep_n
+
+
+
+def ModuleInfo():
+    # irqstat features - run in parallel with the latency measurements, with loads
+    return {"parallel": True,
+            "loads": True}
+
+
+
+def ModuleParameters():
+    return {"interval": {"descr": "Sampling interval in seconds",
+                         "default": 0.01,
+                         "metavar": "SECONDS"},
+            "bursts":   {"descr": "Number of busiest intervals reported per cpu",
+                         "default": 10,
+                         "metavar": "NUM"}
+            }
+
+
+
+def create(params, logger):
+    return irqstat(params, logger)
+
+
+if __name__ == '__main__':
+    from rteval.rtevalConfig import rtevalConfig
+
+    l = Log()
+    l.SetLogVerbosity(Log.INFO|Log.DEBUG|Log.ERR|Log.WARN)
+
+    cfg = rtevalConfig({}, logger=l)
+    prms = {}
+    modprms = ModuleParameters()
+    for c, p in list(modprms.items()):
+        prms[c] = p['default']
+    cfg.AppendConfig('MeasurementModuleTemplate', prms)
+
+    cfg_ct = cfg.GetSection('MeasurementModuleTemplate')
+
+    runtime = 10
+
+    c = irqstat(cfg_ct, l)
+    c.start()
+    c.setStart()
+    print("Running for approx %i seconds" % runtime)
+    time.sleep(runtime)
+    c.setStop()
+    c.WaitForCompletion()
+    rep_n = c.MakeReport()
+
+    xml = libxml2.newDoc('1.0')
+    xml.setRootElement(rep_n)
+    xml.saveFormatFileEnc('-', 'UTF-8', 1)
@@ -0,0 +1,273 @@
+#
+#   perf.py - rteval measurement module running perf stat, and optionally
+#             perf record, on the measured cpus
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import time
+import signal
+import shutil
+import subprocess
+import libxml2
+from rteval.Log import Log
+from rteval.modules import rtevalModulePrototype
+from rteval.misc import expand_cpulist, online_cpus, compress_cpulist
+
+
+class perf(rtevalModulePrototype):
+    """Counts cpu events with 'perf stat' on every measured cpu for the whole
+run.  With record enabled, 'perf record' keeps a size limited sample ring of
+the measured cpus, written to perf.data in the report directory when the
+run stops.  The perf processes themselves are kept off the measured cpus."""
+
+    def __init__(self, config, logger=None):
+        rtevalModulePrototype.__init__(self, 'measurement', 'perf', logger)
+        self.__cfg = config
+        self.__perf = shutil.which('perf')
+        self.__events = self.__cfg.setdefault('events',
+                                              'cycles,instructions,cache-misses,'
+                                              'context-switches,cpu-migrations')
+        self.__record = str(self.__cfg.setdefault('record', 'off')).lower() in ('on', 'yes', 'true', '1')
+        self.__stat_proc = None
+        self.__record_proc = None
+        self.__counters = {}
+        self.__cmd_stat = []
+        self.__cmd_record = []
+        self.__recordfile = None
+
+        if self.__cfg.cpulist:
+            self.__cpus = expand_cpulist(self.__cfg.cpulist)
+        else:
+            self.__cpus = online_cpus()
+        cpuset = [str(c) for c in os.sched_getaffinity(0)]
+        self.__cpus = [c for c in self.__cpus if c in cpuset]
+        self.__cpulist = compress_cpulist(self.__cpus)
+        self.__housekeeping = os.sched_getaffinity(0).difference([int(c) for c in self.__cpus])
+
+        if self.__perf is None:
+            self._log(Log.WARN, "perf not found, not running")
+            self._donotrun = True
+
+        reportdir = self.__cfg.reportdir or "."
+        self.__statfile = os.path.join(reportdir, 'perf-stat.csv')
+        self.__datafile = os.path.join(reportdir, 'perf.data')
+
+
+    def _WorkloadSetup(self):
+        pass
+
+
+    def _WorkloadBuild(self):
+        self._setReady()
+
+
+    def _WorkloadPrepare(self):
+        self.__cmd_stat = [self.__perf, 'stat', '-a', '-A', '-x,',
+                           '-C', self.__cpulist,
+                           '-e', self.__events,
+                           '-o', self.__statfile]
+        if self.__record:
+            # --overwrite keeps only the newest samples in the mmap ring
+            # buffers, which also bounds the size of the perf.data file
+            self.__cmd_record = [self.__perf, 'record', '-a', '-g', '--overwrite',
+                                 '-C', self.__cpulist,
+                                 '-F', str(self.__cfg.setdefault('frequency', 99)),
+                                 '-m', str(self.__cfg.setdefault('mmap_pages', 128)),
+                                 '--max-size=%s' % self.__cfg.setdefault('max_size', '256M'),
+                                 '-o', self.__datafile]
+
+
+    def __start(self, cmd):
+        self._log(Log.DEBUG, "starting with cmd: %s" % " ".join(cmd))
+        nullfp = open(os.devnull, 'w')
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=nullfp,
+                                stderr=nullfp)
+        nullfp.close()
+        # Move perf off the measured cpus from here, as the child of a
+        # threaded program must not run any Python code before the exec.
+        # Threads perf starts later on inherit the affinity.
+        if self.__housekeeping:
+            try:
+                os.sched_setaffinity(proc.pid, self.__housekeeping)
+            except OSError as err:
+                self._log(Log.WARN, "could not move perf off the measured cpus: %s" % err)
+        return proc
+
+
+    def _WorkloadTask(self):
+        if self.__stat_proc is not None:
+            # Already running
+            return
+        try:
+            self.__stat_proc = self.__start(self.__cmd_stat)
+            if self.__record:
+                self.__record_proc = self.__start(self.__cmd_record)
+        except OSError as err:
+            self._log(Log.WARN, "could not start perf: %s" % err)
+
+
+    def WorkloadAlive(self):
+        if self.__stat_proc is None:
+            return False
+        return self.__stat_proc.poll() is None
+
+
+    @staticmethod
+    def __stop(proc):
+        "Stops perf the way Ctrl-C does, perf writes its results on SIGINT"
+        if proc is None:
+            return None
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGINT)
+        try:
+            return proc.wait(60)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            return proc.wait()
+
+
+    def _WorkloadCleanup(self):
+        self.__stop(self.__record_proc)
+        self.__stop(self.__stat_proc)
+
+        if os.path.exists(self.__statfile):
+            self.__parse_stat()
+        if self.__record_proc is not None and os.path.exists(self.__datafile):
+            self.__recordfile = os.path.basename(self.__datafile)
+        self._setFinished()
+
+
+    def __parse_stat(self):
+        "Parses the per cpu CSV output of perf stat -A -x,"
+        fp = open(self.__statfile, 'r')
+        for line in fp:
+            fields = line.strip().split(',')
+            if len(fields) < 4 or not fields[0].startswith('CPU'):
+                continue
+            # CPU,value,unit,event,run time,percentage of run time counted,...
+            (cpu, value, unit, event) = fields[0:4]
+            running_pct = len(fields) > 5 and fields[5] or ""
+            self.__counters.setdefault(cpu[3:], []).append((event, value, unit, running_pct))
+        fp.close()
+
+
+    def MakeReport(self):
+        if self._donotrun:
+            return None
+
+        rep_n = libxml2.newNode('perf')
+        rep_n.newProp('command_line', ' '.join(self.__cmd_stat))
+        rep_n.addChild(self.GetTimestamps())
+
+        stat_n = rep_n.newChild(None, 'stat', None)
+        stat_n.newProp('file', os.path.basename(self.__statfile))
+        for cpu in sorted(self.__counters.keys(), key=int):
+            cpu_n = stat_n.newChild(None, 'cpu', None)
+            cpu_n.newProp('id', cpu)
+            values = {}
+            for (event, value, unit, running_pct) in self.__counters[cpu]:
+                ctr_n = cpu_n.newChild(None, 'counter', None)
+                ctr_n.newProp('name', event)
+                if value.startswith('<'):
+                    # <not counted> or <not supported>
+                    ctr_n.newProp('status', value.strip('<>'))
+                    continue
+                ctr_n.newProp('value', value)
+                if unit:
+                    ctr_n.newProp('unit', unit)
+                if running_pct:
+                    ctr_n.newProp('running_pct', running_pct)
+                values[event.split('/')[-2] if event.endswith('/') else event] = float(value)
+            if values.get('cycles') and 'instructions' in values:
+                cpu_n.newProp('ipc', "%.3f" % (values['instructions'] / values['cycles']))
+
+        if self.__record:
+            rec_n = rep_n.newChild(None, 'record', None)
+            rec_n.newProp('command_line', ' '.join(self.__cmd_record))
+            if self.__recordfile:
+                rec_n.newProp('file', self.__recordfile)
+                rec_n.newProp('size', str(os.path.getsize(self.__datafile)))
+
+        return rep_n
+
+
+
+def ModuleInfo():
+    return {"parallel": True,
+            "loads": True}
+
+
+
+def ModuleParameters():
+    return {"events": {"descr": "Comma separated list of events counted per cpu",
+                       "default": "cycles,instructions,cache-misses,context-switches,cpu-migrations",
+                       "metavar": "EVENTS"},
+            "record": {"descr": "Also sample the measured cpus with perf record (on/off)",
+                       "default": "off",
+                       "metavar": "on|off"},
+            "frequency": {"descr": "perf record sampling frequency",
+                          "default": 99,
+                          "metavar": "HZ"},
+            "mmap_pages": {"descr": "perf record ring buffer size per cpu",
+                           "default": 128,
+                           "metavar": "PAGES"},
+            "max_size": {"descr": "Maximum size of perf.data",
+                         "default": "256M",
+                         "metavar": "SIZE"}
+            }
+
+
+
+def create(params, logger):
+    return perf(params, logger)
+
+
+if __name__ == '__main__':
+    from rteval.rtevalConfig import rtevalConfig
+
+    l = Log()
+    l.SetLogVerbosity(Log.INFO|Log.DEBUG|Log.ERR|Log.WARN)
+
+    cfg = rtevalConfig({}, logger=l)
+    prms = {}
+    modprms = ModuleParameters()
+    for c, p in list(modprms.items()):
+        prms[c] = p['default']
+    cfg.AppendConfig('perf', prms)
+
+    cfg_ct = cfg.GetSection('perf')
+    cfg_ct.reportdir = "."
+
+    runtime = 10
+
+    c = perf(cfg_ct, l)
+    c._WorkloadSetup()
+    c._WorkloadPrepare()
+    c._WorkloadTask()
+    time.sleep(runtime)
+    c._WorkloadCleanup()
+    rep_n = c.MakeReport()
+
+    xml = libxml2.newDoc('1.0')
+    xml.setRootElement(rep_n)
+    xml.saveFormatFileEnc('-', 'UTF-8', 1)
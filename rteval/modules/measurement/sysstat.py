@@ -1,6 +1,6 @@
 #
 #   sysstat.py - rteval measurment module collecting system statistics
-#                using the sysstat utility
+#                from the /proc statistics files
 #
 #   Copyright 2013          David Sommerseth <davids@redhat.com>
 #
@@ -26,25 +26,60 @@
 #
 
 import os
+import csv
+import gzip
 import time
-import subprocess
-import base64
-import bz2
-import textwrap
 import libxml2
 from rteval.Log import Log
 from rteval.modules import rtevalModulePrototype
+from rteval import procstat
+
+
+def _is_counter(group, name):
+    "Returns True if the value is an ever increasing counter, False for gauges"
+    if group == 'meminfo':
+        return False
+    if group == 'vmstat':
+        return not name.startswith('nr_')
+    if group == 'stat':
+        return name not in ('procs_running', 'procs_blocked')
+    return True
+
+
+def _counter_deltas(vals):
+    """Returns the increase of a counter since the previous sample.  The
+deltas start at 0 from the first value the counter has; samples lacking
+the counter stay None and the next one counts from the last known value"""
+    ret = []
+    prev = None
+    for v in vals:
+        if v is None:
+            ret.append(None)
+        else:
+            ret.append(0 if prev is None else v - prev)
+            prev = v
+    return ret
+
+
+def _format_value(v):
+    "A CSV field, left empty for the samples lacking the column"
+    return '' if v is None else str(v)
 
 
 class sysstat(rtevalModulePrototype):
+    """Samples /proc/stat, /proc/interrupts, /proc/softirqs, /proc/vmstat and
+/proc/meminfo at a fixed interval into an in-memory ring buffer.  The
+report gives the statistics of each value, the samples themselves are
+written to sysstat.csv.gz in the report directory"""
+
     def __init__(self, config, logger=None):
         rtevalModulePrototype.__init__(self, 'measurement', 'sysstat', logger)
         self.__cfg = config
-        self.__started = False
+        self.__interval = float(self.__cfg.setdefault('interval', 1))
+        self.__samples = procstat.RingBuffer(int(self.__cfg.setdefault('buffer', 3600)))
         self.__logentry = 0
-        self.__bin_sadc = "/usr/lib64/sa/sadc" # FIXME: Do dynamically
-        self.__datadir = os.path.join(self.__cfg.reportdir, 'sysstat')
-        self.__datafile = os.path.join(self.__datadir, "sysstat.dat")
+        self.__csvfile = os.path.join(self.__cfg.reportdir or ".", 'sysstat.csv.gz')
+        self.__written = False
 
 
     def _WorkloadSetup(self):
@@ -58,54 +93,141 @@ class sysstat(rtevalModulePrototype):
 
 
     def _WorkloadPrepare(self):
-        os.mkdir(self.__datadir)
+        # Nothing to prepare, all data is kept in memory
+        pass
+
+
+    def __sample(self):
+        "Reads all the statistics files and stores them as one sample"
+        now = time.time()
+        values = {}
+        for (k, v) in procstat.read_stat().items():
+            values["stat." + k] = v
+
+        for (group, reader) in (('interrupts', procstat.read_interrupts),
+                                ('softirqs', procstat.read_softirqs)):
+            (cpus, rows) = reader()
+            percpu = [0] * len(cpus)
+            for (name, counts) in rows.items():
+                values["%s.%s" % (group, name)] = sum(counts)
+                if group == 'softirqs':
+                    for (cpu, cnt) in zip(cpus, counts):
+                        values["%s.%s.cpu%d" % (group, name, cpu)] = cnt
+                # The ERR and MIS rows of /proc/interrupts have a single
+                # counter, not one per cpu
+                if len(counts) != len(cpus):
+                    continue
+                for (i, cnt) in enumerate(counts):
+                    percpu[i] += cnt
+            for (cpu, cnt) in zip(cpus, percpu):
+                values["%s.cpu%d" % (group, cpu)] = cnt
+
+        for (k, v) in procstat.read_keyvalues('/proc/vmstat').items():
+            values["vmstat." + k] = v
+        for (k, v) in procstat.read_keyvalues('/proc/meminfo').items():
+            values["meminfo." + k] = v
+
+        self.__samples.append(now, values)
+        self.__logentry += 1
 
 
     def _WorkloadTask(self):
-        # This workload will actually not run any process, but
-        # it will update the data files each time rteval checks
-        # if this workload is alive.
-        #
-        # Just add a single notification that rteval started
-        if self.__logentry == 0:
-            cmd = [self.__bin_sadc, "-S", "XALL", "-C", "rteval started", self.__datafile]
-            subprocess.call(cmd)
-            self.__logentry += 1
+        # Sample at a fixed rate until told to stop, independent of how long
+        # reading the statistics takes
+        nexttime = time.monotonic()
+        while not self.shouldStop():
+            self.__sample()
+            nexttime += self.__interval
+            delay = nexttime - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self._log(Log.DEBUG, "sampling is %.3fs behind" % -delay)
+                nexttime = time.monotonic()
 
 
     def WorkloadAlive(self):
-        # Here the sysstat tool will be called, which will update
-        # the file containing the system information
-        cmd = [self.__bin_sadc, "-S", "XALL", "1", "1", self.__datafile]
-        subprocess.call(cmd)
-        self.__logentry += 1
+        # The sampling runs in the module thread itself
         return True
 
 
     def _WorkloadCleanup(self):
-        # Add 'rteval stopped' comment line
-        cmd = [self.__bin_sadc, "-S", "XALL", "-C", "rteval stopped", self.__datafile]
-        subprocess.call(cmd)
-        self.__logentry += 1
+        # Always keep the final state
+        if self.__logentry:
+            self.__sample()
+            try:
+                self.__write_samples()
+            except (IOError, OSError) as err:
+                self._log(Log.WARN, "could not write %s: %s" % (self.__csvfile, err))
         self._setFinished()
 
 
+    def __write_samples(self):
+        """Writes the samples in the ring buffer to a gzip compressed CSV
+        file, one row per sample and one column per value.  Counters are
+        given as the increase since the previous sample"""
+        times = self.__samples.GetTimes()
+        names = self.__samples.GetColumnNames()
+        columns = []
+        for col in names:
+            vals = self.__samples.GetColumn(col)
+            (group, name) = col.split('.', 1)
+            if _is_counter(group, name):
+                vals = _counter_deltas(vals)
+            columns.append(vals)
+
+        with gzip.open(self.__csvfile, 'wt', newline='') as fp:
+            out = csv.writer(fp)
+            out.writerow(['time'] + names)
+            for (i, t) in enumerate(times):
+                out.writerow(["%.3f" % t] + [_format_value(vals[i]) for vals in columns])
+        self.__written = True
+
+
     def MakeReport(self):
         rep_n = libxml2.newNode('sysstat')
-        rep_n.newProp('command_line', '(sysstat specifics)')
+        rep_n.newProp('command_line', '(native /proc sampler)')
         rep_n.newProp('num_entries', str(self.__logentry))
-
-        fp = open(self.__datafile, "rb")
-        compr = bz2.BZ2Compressor(9)
-        cmpr = compr.compress(fp.read())
-        data = base64.b64encode(cmpr + compr.flush())
-        data_n = rep_n.newTextChild(None, 'data', "\n"+"\n".join(textwrap.wrap(data, 75))+"\n")
-        data_n.newProp('contents', 'sysstat/sar binary data')
-        data_n.newProp('encoding', 'base64')
-        data_n.newProp('compression', 'bz2')
-        fp.close()
-        del cmpr
-        del compr
+        rep_n.newProp('interval', str(self.__interval))
+        rep_n.addChild(self.GetTimestamps())
+
+        times = self.__samples.GetTimes()
+        if not times:
+            return rep_n
+
+        # The statistics of each value, the samples in the ring buffer are
+        # only referenced
+        data_n = rep_n.newChild(None, 'samples', None)
+        if self.__written:
+            data_n.newProp('file', os.path.basename(self.__csvfile))
+        data_n.newProp('count', str(len(times)))
+        data_n.newProp('dropped', str(self.__samples.GetSampleCount() - len(times)))
+        data_n.newProp('start', "%.3f" % times[0])
+
+        (first, last) = self.__samples.GetTimeSpan()
+        duration = last - first
+        groups = {}
+        for col in self.__samples.GetColumnNames():
+            (group, name) = col.split('.', 1)
+            if group not in groups:
+                groups[group] = data_n.newChild(None, 'group', None)
+                groups[group].newProp('name', group)
+
+            st = self.__samples.GetColumnStats(col)
+            col_n = groups[group].newChild(None, 'column', None)
+            if _is_counter(group, name):
+                col_n.newProp('type', 'counter')
+                col_n.newProp('total', str(st['last'] - st['first']))
+                if duration > 0:
+                    col_n.newProp('rate', "%.3f" % ((st['last'] - st['first']) / duration))
+            else:
+                col_n.newProp('type', 'gauge')
+                col_n.newProp('min', str(st['min']))
+                col_n.newProp('max', str(st['max']))
+                col_n.newProp('avg', "%.1f" % (st['sum'] / float(st['count'])))
+            col_n.newProp('name', name)
+            if st['count'] < self.__samples.GetSampleCount():
+                col_n.newProp('samples', str(st['count']))
 
         # Return the report
         return rep_n
@@ -120,7 +242,13 @@ def ModuleInfo():
 
 
 def ModuleParameters():
-    return {}  # No arguments available
+    return {"interval": {"descr": "Sampling interval in seconds",
+                         "default": 1,
+                         "metavar": "SECONDS"},
+            "buffer":   {"descr": "Number of samples kept in the report",
+                         "default": 3600,
+                         "metavar": "NUM"}
+            }
 
 
 
@@ -147,15 +275,12 @@ if __name__ == '__main__':
     runtime = 10
 
     c = sysstat(cfg_ct, l)
-    c._WorkloadSetup()
-    c._WorkloadPrepare()
-    c._WorkloadTask()
+    c.start()
+    c.setStart()
     print("Running for approx %i seconds" % runtime)
-    while runtime > 0:
-        c.WorkloadAlive()
-        time.sleep(1)
-        runtime -= 1
-    c._WorkloadCleanup()
+    time.sleep(runtime)
+    c.setStop()
+    c.WaitForCompletion()
     rep_n = c.MakeReport()
 
     xml = libxml2.newDoc('1.0')
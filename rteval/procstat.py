@@ -0,0 +1,345 @@
+#
+#   procstat.py - readers for the /proc statistics files and a columnar
+#                 ring buffer for sampling them
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import sys
+import tempfile
+import time
+from array import array
+
+STAT_CPU_FIELDS = ('user', 'nice', 'system', 'idle', 'iowait',
+                   'irq', 'softirq', 'steal', 'guest', 'guest_nice')
+
+
+def _readlines(path):
+    fp = open(path, 'r')
+    lines = fp.readlines()
+    fp.close()
+    return lines
+
+
+def read_stat(path='/proc/stat'):
+    """Returns the counters of /proc/stat, such as 'cpu0.user' or 'ctxt'.
+    Only the totals are kept of the intr and softirq lines"""
+    ret = {}
+    for l in _readlines(path):
+        fields = l.split()
+        if not fields:
+            continue
+        if fields[0].startswith('cpu'):
+            for (name, val) in zip(STAT_CPU_FIELDS, fields[1:]):
+                ret["%s.%s" % (fields[0], name)] = int(val)
+        elif len(fields) > 1 and fields[1].isdigit():
+            ret[fields[0]] = int(fields[1])
+    return ret
+
+
+def read_percpu_table(path):
+    """Parses /proc/interrupts style tables.  Returns a list of the cpu
+    numbers of the columns and a dict with a list of per cpu counters for
+    each row.  Rows with a single counter (ERR, MIS) get a one element list"""
+    lines = _readlines(path)
+    cpus = [int(c[3:]) for c in lines[0].split()]
+    rows = {}
+    for l in lines[1:]:
+        fields = l.split()
+        if not fields:
+            continue
+        counts = []
+        for f in fields[1:len(cpus) + 1]:
+            if not f.isdigit():
+                break
+            counts.append(int(f))
+        rows[fields[0].rstrip(':')] = counts
+    return (cpus, rows)
+
+
+def read_interrupts(path='/proc/interrupts'):
+    "Returns (cpus, {irq: [per cpu counters]}) from /proc/interrupts"
+    return read_percpu_table(path)
+
+
+def read_softirqs(path='/proc/softirqs'):
+    "Returns (cpus, {softirq: [per cpu counters]}) from /proc/softirqs"
+    return read_percpu_table(path)
+
+
+def read_keyvalues(path):
+    "Parses files with one 'key value' or 'Key: value kB' per line, like /proc/vmstat"
+    ret = {}
+    for l in _readlines(path):
+        fields = l.split()
+        if len(fields) < 2:
+            continue
+        ret[fields[0].rstrip(':')] = int(fields[1])
+    return ret
+
+
+
+class PercpuTableReader:
+    """Low overhead reader for /proc/interrupts and /proc/softirqs, meant to
+be called at a high rate.  The file is kept open and read into a reused
+buffer.  The counters are printed in fixed width columns, so only the
+columns of the selected cpus are converted.  With described set, as for
+/proc/interrupts, only numbered rows and named rows followed by a
+description are read; this keeps out ERR and MIS, which have as many
+columns as a per cpu row on a single cpu machine."""
+
+    COLUMN_WIDTH = 11   # " %10u"
+
+    def __init__(self, path, cpus=None, described=False):
+        self.__path = path
+        self.__described = described
+        self.__fd = os.open(path, os.O_RDONLY)
+        self.__buf = bytearray(16384)
+        self.__descr = {}
+        self.__labels = {}
+        self.__selected = cpus
+        self.__cpus = []
+        self.__offsets = []
+        self.__ncols = 0
+
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+
+    def __read(self):
+        "Reads the whole file into the buffer, returns its length"
+        length = 0
+        while True:
+            if length == len(self.__buf):
+                self.__buf.extend(bytearray(len(self.__buf)))
+            n = os.preadv(self.__fd, [memoryview(self.__buf)[length:]], length)
+            if n == 0:
+                return length
+            length += n
+
+
+    def __header(self, line):
+        cpus = [int(c[3:]) for c in line.split()]
+        if cpus == self.__cpus:
+            return
+        sel = cpus if self.__selected is None else [c for c in self.__selected if c in cpus]
+        self.__cpus = cpus
+        self.__ncols = len(cpus)
+        self.__offsets = [(cpus.index(c) * self.COLUMN_WIDTH, c) for c in sel]
+
+
+    def GetCpus(self):
+        "Returns the selected cpus found in the file, in the order of read() counters"
+        return [c for (_, c) in self.__offsets]
+
+
+    def GetDescription(self, label):
+        "Returns the text following the counters of a row, e.g. the device name of an irq"
+        return self.__descr.get(label, "")
+
+
+    def read(self):
+        "Returns a dict with a list of counters of the selected cpus for each row"
+        length = self.__read()
+        lines = self.__buf[:length].split(b'\n')
+        self.__header(lines[0])
+        width = self.COLUMN_WIDTH
+        rowlen = self.__ncols * width
+        ret = {}
+        for line in lines[1:]:
+            p = line.find(b':')
+            if p < 0:
+                continue
+            key = bytes(line[:p])
+            label = self.__labels.get(key)
+            if label is None:
+                label = key.strip().decode()
+                descr = line[p + 1 + rowlen:].strip().decode()
+                if self.__described and not label.isdigit() and not descr:
+                    label = False
+                else:
+                    self.__descr[label] = descr
+                self.__labels[key] = label
+            if label is False:
+                continue
+            cols = line[p + 1:]
+            if len(cols) < rowlen:
+                # Not a per cpu row, like ERR and MIS
+                continue
+            try:
+                ret[label] = [int(cols[o:o + width]) for (o, _) in self.__offsets]
+            except ValueError:
+                # A counter overflowing its column, fall back to splitting
+                fields = cols.split()
+                ret[label] = [int(fields[o // width]) for (o, _) in self.__offsets]
+        return ret
+
+
+
+class RingBuffer:
+    """Fixed size columnar storage of samples.  Each named column is an
+array of integers; once the buffer is full the oldest samples are
+overwritten.  Samples lacking a column, such as the ones taken before the
+column first appeared, read as None.  First, last, min, max, sum and count
+of every column are kept for all samples, including the ones no longer in
+the buffer."""
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError("ring buffer size must be at least 1")
+        self.__size = size
+        self.__times = array('d', [0.0] * size)
+        self.__columns = {}
+        self.__valid = {}
+        self.__stats = {}
+        self.__next = 0
+        self.__count = 0
+        self.__span = [None, None]
+
+
+    def append(self, timestamp, values):
+        "Stores one sample, values being a dict of column name: integer"
+        pos = self.__next
+        self.__times[pos] = timestamp
+        if self.__span[0] is None:
+            self.__span[0] = timestamp
+        self.__span[1] = timestamp
+        for (name, valid) in self.__valid.items():
+            if name not in values:
+                valid[pos] = 0
+        for (name, val) in values.items():
+            col = self.__columns.get(name)
+            if col is None:
+                col = self.__columns[name] = array('q', [0] * self.__size)
+                self.__valid[name] = bytearray(self.__size)
+                self.__stats[name] = [val, val, val, val, 0, 0]
+            col[pos] = val
+            self.__valid[name][pos] = 1
+            st = self.__stats[name]
+            st[1] = val
+            if val < st[2]:
+                st[2] = val
+            if val > st[3]:
+                st[3] = val
+            st[4] += val
+            st[5] += 1
+        self.__next = (pos + 1) % self.__size
+        self.__count += 1
+
+
+    def __len__(self):
+        "Number of samples in the buffer"
+        return min(self.__count, self.__size)
+
+
+    def GetSampleCount(self):
+        "Number of samples appended, including the overwritten ones"
+        return self.__count
+
+
+    def GetTimeSpan(self):
+        "Returns the times of the first and the last sample ever appended"
+        return tuple(self.__span)
+
+
+    def GetColumnNames(self):
+        return sorted(self.__columns.keys())
+
+
+    def __order(self, arr):
+        if self.__count < self.__size:
+            return list(arr[:self.__count])
+        return list(arr[self.__next:] + arr[:self.__next])
+
+
+    def GetTimes(self):
+        "Returns the sample times, oldest first"
+        return self.__order(self.__times)
+
+
+    def GetColumn(self, name):
+        "Returns the values of a column, oldest first, None where it is missing"
+        return [v if ok else None for (v, ok) in zip(self.__order(self.__columns[name]),
+                                                     self.__order(self.__valid[name]))]
+
+
+    def GetColumnStats(self, name):
+        """Returns a dict with first, last, min, max, sum and count of all samples
+of a column"""
+        return dict(zip(('first', 'last', 'min', 'max', 'sum', 'count'), self.__stats[name]))
+
+
+
+def unit_test(rootdir):
+    try:
+        print("stat: %d counters" % len(read_stat()))
+        (cpus, irqs) = read_interrupts()
+        print("interrupts: %d cpus, %d rows" % (len(cpus), len(irqs)))
+        (cpus, sirqs) = read_softirqs()
+        print("softirqs: %s" % " ".join(sorted(sirqs.keys())))
+        print("vmstat: %d counters" % len(read_keyvalues('/proc/vmstat')))
+        print("meminfo: MemFree %d kB" % read_keyvalues('/proc/meminfo')['MemFree'])
+
+        rd = PercpuTableReader('/proc/interrupts', [0], described=True)
+        counts = rd.read()
+        assert counts['LOC'][0] == irqs['LOC'][cpus.index(0)] or counts['LOC'][0] > 0
+        assert 'ERR' not in counts and 'MIS' not in counts
+        print("PercpuTableReader: %d rows for cpus %s" % (len(counts), rd.GetCpus()))
+        rd.close()
+
+        # A single cpu machine, where ERR lines up like a per cpu row
+        with tempfile.NamedTemporaryFile('w', suffix='interrupts') as f:
+            f.write("           CPU0       \n"
+                    "  0:         42   IO-APIC   2-edge      timer\n"
+                    "LOC:       1234   Local timer interrupts\n"
+                    "ERR:          0\n"
+                    "MIS:          0\n")
+            f.flush()
+            rd = PercpuTableReader(f.name, described=True)
+            assert rd.read() == {'0': [42], 'LOC': [1234]}, rd.read()
+            rd.close()
+
+        rb = RingBuffer(3)
+        for i in range(5):
+            vals = {'a': i}
+            if i >= 3:
+                vals['b'] = i * 10
+            rb.append(time.time(), vals)
+        assert len(rb) == 3 and rb.GetSampleCount() == 5
+        assert rb.GetColumn('a') == [2, 3, 4], rb.GetColumn('a')
+        assert rb.GetColumn('b') == [None, 30, 40], rb.GetColumn('b')
+        assert rb.GetColumnStats('a') == {'first': 0, 'last': 4, 'min': 0, 'max': 4,
+                                          'sum': 10, 'count': 5}
+        assert rb.GetColumnStats('b')['count'] == 2
+        print("RingBuffer OK")
+        return 0
+    except Exception as e:
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        print("** EXCEPTION %s", str(e))
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(unit_test(None))
@@ -97,6 +97,8 @@ default_config = {
         'xslt_histogram': default_config_search(['rteval_histogram_raw.xsl'], os.path.isfile),
         'report_interval': '600',
         'logging'    : False,
+        'archive_format': 'bz2',
+        'archive_level': None,
         }
     }
 
@@ -203,7 +205,7 @@ class rtevalConfig:
 
         # Set the runtime provided init variables
         if initvars:
-            if not isinstance(newdict, dict):
+            if not isinstance(initvars, dict):
                 raise TypeError('initvars argument is not a dict variable')
 
             for sect, vals in list(initvars.items()):
@@ -0,0 +1,161 @@
+#
+#   rtevalOutbox.py - persistent queue of reports waiting to be sent to
+#                     an rteval XML-RPC server
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import bz2
+import json
+import time
+import random
+import socket
+import hashlib
+import tempfile
+import http.client
+import xmlrpc.client
+from .Log import Log
+
+BLOCKSIZE = 1024*1024
+
+
+class rtevalOutbox(object):
+    """Reports waiting for submission, kept as <sha1>.xml.bz2 files in a
+directory, the SHA1 being that of the uncompressed report.  Next to each
+report a <sha1>.state file records the failed attempts and when the next
+one is due; the delay doubles with every failure, from 'backoff' up to
+'maxbackoff' seconds.  Reports which have been delivered leave a
+sent/<sha1> file behind, so the same report is never queued twice."""
+
+    def __init__(self, directory, logger, backoff=60, maxbackoff=6*60*60):
+        self.__dir = directory
+        self.__sentdir = os.path.join(directory, 'sent')
+        self.__logger = logger
+        self.__backoff = backoff
+        self.__maxbackoff = maxbackoff
+        os.makedirs(self.__sentdir, exist_ok=True)
+
+
+    def __path(self, sha1, ext='.xml.bz2'):
+        return os.path.join(self.__dir, sha1 + ext)
+
+
+    def __read_state(self, sha1):
+        try:
+            with open(self.__path(sha1, '.state')) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {'added': os.path.getmtime(self.__path(sha1)),
+                    'attempts': 0, 'next_attempt': 0}
+
+
+    def __write_state(self, sha1, state):
+        tmpf = self.__path(sha1, '.state.tmp')
+        with open(tmpf, 'w') as f:
+            json.dump(state, f)
+        os.rename(tmpf, self.__path(sha1, '.state'))
+
+
+    def Add(self, xmldoc):
+        "Queues a libxml2 report document, returns its SHA1"
+        (fd, xmlname) = tempfile.mkstemp(suffix='.xml', dir=self.__dir)
+        os.close(fd)
+        try:
+            xmldoc.saveFormatFileEnc(xmlname, 'UTF-8', 1)
+            return self.AddFile(xmlname)
+        finally:
+            os.unlink(xmlname)
+
+
+    def AddFile(self, fname):
+        """Queues an XML report file, returns its SHA1.  A report which is
+        queued or has been sent already is not queued again"""
+        (fd, tmpname) = tempfile.mkstemp(suffix='.xml.bz2.tmp', dir=self.__dir)
+        csum = hashlib.sha1()
+        compr = bz2.BZ2Compressor(9)
+        with open(fname, 'rb') as inf, os.fdopen(fd, 'wb') as outf:
+            for block in iter(lambda: inf.read(BLOCKSIZE), b''):
+                csum.update(block)
+                outf.write(compr.compress(block))
+            outf.write(compr.flush())
+        sha1 = csum.hexdigest()
+
+        if os.path.exists(self.__path(sha1)) or os.path.exists(os.path.join(self.__sentdir, sha1)):
+            self.__logger.log(Log.DEBUG, "report %s is already in the outbox" % sha1)
+            os.unlink(tmpname)
+            return sha1
+        self.__write_state(sha1, {'added': time.time(), 'attempts': 0, 'next_attempt': 0,
+                                  'doclen': os.path.getsize(fname)})
+        os.rename(tmpname, self.__path(sha1))
+        self.__logger.log(Log.DEBUG, "report %s added to the outbox" % sha1)
+        return sha1
+
+
+    def IsSent(self, sha1):
+        "True if the report has been delivered"
+        return os.path.exists(os.path.join(self.__sentdir, sha1))
+
+
+    def Pending(self):
+        "Returns the SHA1 and state of the queued reports, oldest first"
+        ret = []
+        for f in os.listdir(self.__dir):
+            if f.endswith('.xml.bz2'):
+                sha1 = f[:-len('.xml.bz2')]
+                ret.append((sha1, self.__read_state(sha1)))
+        return sorted(ret, key=lambda e: e[1]['added'])
+
+
+    def Flush(self, client, force=False):
+        """Sends the queued reports which are due, or all of them with force,
+        through one rtevalclient.  Any failure delays the next attempt of
+        that report; the first communication failure ends the flush, the
+        server being unreachable.  Returns a dict of SHA1 to server reply
+        for the delivered reports"""
+        sent = {}
+        now = time.time()
+        for (sha1, state) in self.Pending():
+            if not force and state['next_attempt'] > now:
+                continue
+            try:
+                ret = client.SendCompressedReport(self.__path(sha1), state.get('doclen'))
+            except Exception as err:
+                state['attempts'] += 1
+                delay = min(self.__backoff * 2 ** (state['attempts'] - 1), self.__maxbackoff)
+                # Spread out the retries of nodes which failed together
+                state['next_attempt'] = time.time() + delay * random.uniform(0.8, 1.2)
+                state['last_error'] = str(err)
+                self.__write_state(sha1, state)
+                self.__logger.log(Log.INFO, "could not submit report %s (attempt %i), next attempt in %i seconds: %s"
+                                  % (sha1, state['attempts'], delay, str(err)))
+                if isinstance(err, (socket.error, http.client.HTTPException,
+                                    xmlrpc.client.ProtocolError)):
+                    break
+                continue
+
+            with open(os.path.join(self.__sentdir, sha1), 'w') as f:
+                f.write("%s\n" % str(ret))
+            os.unlink(self.__path(sha1))
+            os.unlink(self.__path(sha1, '.state'))
+            self.__logger.log(Log.INFO, "submitted report %s: %s" % (sha1, str(ret)))
+            sent[sha1] = ret
+        return sent
@@ -25,9 +25,9 @@
 #
 
 import os
-import tarfile
 from datetime import datetime
 from . import xmlout
+from . import archive
 
 
 class rtevalReport:
@@ -39,10 +39,55 @@ class rtevalReport:
         self.__xmlreport = None
         self.__reportdir = None
         self.__xmlfname = None
+        self.__archiver = None
+
+
+    def _report_begin(self):
+        """Starts the XML report.  The run info and the system info are
+        written right away, the measurement results are added by
+        _report_profile() as each measurement profile completes"""
+
+        self.__xmlreport = xmlout.XMLOut('rteval', self.__version)
+        self.__xmlreport.NewReport(self.__xmlfname)
+
+        # The run time is only known at the end, keep room for it
+        self.__xmlreport.openblock('run_info', {'days': 0,
+                                                'hours': 0,
+                                                'minutes': 0,
+                                                'seconds': 0}, 64)
+        self.__xmlreport.taggedvalue('date', self.__start.strftime('%Y-%m-%d'))
+        self.__xmlreport.taggedvalue('time', self.__start.strftime('%H:%M:%S'))
+        if self.__annotate:
+            self.__xmlreport.taggedvalue('annotate', self.__annotate)
+        self.__xmlreport.closeblock()
+
+        # Collect and add info about the system
+        self.__xmlreport.AppendXMLnodes(self._sysinfo.MakeReport())
+
+        # Add the cpu split between loads and measurements
+        if self._cpupartition is not None:
+            self.__xmlreport.AppendXMLnodes(self._cpupartition.MakeReport())
+
+        self.__xmlreport.openblock('Measurements')
+
+
+    def _report_profile(self, measure_profile):
+        "Adds the results of a completed measurement profile to the XML report"
+        try:
+            prof_n = measure_profile.MakeReport()
+            if prof_n:
+                self.__xmlreport.AppendXMLnodes(prof_n)
+        except Exception:
+            # Leave a well formed report behind, holding what was measured
+            # so far, before the error goes on
+            while self.__xmlreport.level > 0:
+                self.__xmlreport.closeblock()
+            self.__xmlreport.close()
+            raise
 
 
     def _report(self, measure_start, xslt_tpl):
-        "Create a screen report, based on a predefined XSLT template"
+        "Completes the XML report and creates a screen report, based on a predefined XSLT template"
 
         if measure_start is None:
             raise Exception("No measurement runs have been attempted")
@@ -58,36 +103,20 @@ class rtevalReport:
         if minutes:
             seconds -= (minutes * 60)
 
-        # Start new XML report
-        self.__xmlreport = xmlout.XMLOut('rteval', self.__version)
-        self.__xmlreport.NewReport()
-
-        self.__xmlreport.openblock('run_info', {'days': duration.days,
-                                                'hours': hours,
-                                                'minutes': minutes,
-                                                'seconds': seconds})
-        self.__xmlreport.taggedvalue('date', self.__start.strftime('%Y-%m-%d'))
-        self.__xmlreport.taggedvalue('time', self.__start.strftime('%H:%M:%S'))
-        if self.__annotate:
-            self.__xmlreport.taggedvalue('annotate', self.__annotate)
+        # End of the measurement data
         self.__xmlreport.closeblock()
 
-        # Collect and add info about the system
-        self.__xmlreport.AppendXMLnodes(self._sysinfo.MakeReport())
-
         # Add load info
         self.__xmlreport.AppendXMLnodes(self._loadmods.MakeReport())
 
-        # Add measurement data
-        self.__xmlreport.AppendXMLnodes(self._measuremods.MakeReport())
+        self.__xmlreport.UpdateBlockAttributes('run_info', {'days': duration.days,
+                                                            'hours': hours,
+                                                            'minutes': minutes,
+                                                            'seconds': seconds})
 
         # Close the report - prepare for return the result
         self.__xmlreport.close()
 
-        # Write the XML to the report directory
-        if self.__xmlfname is not None:
-            self.__xmlreport.Write(self.__xmlfname, None)
-
         # Write a text report to stdout as well, using the
         # rteval_text.xsl template
         self.__xmlreport.Write("-", xslt_tpl)
@@ -98,6 +127,11 @@ class rtevalReport:
         return self.__xmlreport.GetXMLdocument()
 
 
+    def GetXMLreportFile(self):
+        "Returns the file name of the XML report, complete once _report() has run"
+        return self.__xmlfname
+
+
     def _show_report(self, xmlfile, xsltfile):
         '''summarize a previously generated xml file'''
         print("Loading %s for summarizing" % xmlfile)
@@ -129,17 +163,17 @@ class rtevalReport:
         return self.__reportdir
 
 
-    def _tar_results(self):
-        if not os.path.isdir(self.__reportdir):
-            raise RuntimeError("no such directory: %s" % self.__reportdir)
+    def _tar_results_start(self, fmt='bz2', level=None, logger=None):
+        """Starts archiving the report directory in the background, files
+        added to it before _tar_results() is called are archived as well"""
+        self.__archiver = archive.ReportArchiver(self.__reportdir, fmt, level, logger)
+        self.__archiver.Start()
 
-        dirname = os.path.dirname(self.__reportdir)
-        rptdir = os.path.basename(self.__reportdir)
-        cwd = os.getcwd()
-        os.chdir(dirname)
-        try:
-            t = tarfile.open(rptdir + ".tar.bz2", "w:bz2")
-            t.add(rptdir)
-            t.close()
-        except:
-            os.chdir(cwd)
+
+    def _tar_results(self):
+        "Completes the archive of the report directory, returns its file name"
+        if self.__archiver is None:
+            self._tar_results_start()
+        fname = self.__archiver.Complete()
+        self.__archiver = None
+        return fname
@@ -24,99 +24,82 @@
 #   are deemed to be part of the source code.
 #
 
+import os
 import socket
-import time
+import http.client
 import xmlrpc.client
 from .rtevalclient import rtevalclient
+from .rtevalOutbox import rtevalOutbox
 from .Log import Log
 
 class rtevalXMLRPC:
-    def __init__(self, host, logger, mailer=None):
+    """Submits reports to an XML-RPC server through an outbox directory, so
+    that reports are kept until the server has accepted them"""
+    def __init__(self, host, logger, mailer=None, outboxdir=None, timeout=30):
         self.__host = host
         self.__url = "http://%s/rteval/API1/" % self.__host
         self.__logger = logger
         self.__mailer = mailer
-        self.__client = rtevalclient.rtevalclient(self.__url)
+        self.__client = rtevalclient(self.__url, timeout=timeout)
+        if outboxdir is None:
+            outboxdir = os.path.join(os.getcwd(), 'outbox')
+        self.__outbox = rtevalOutbox(outboxdir, logger)
 
 
     def Ping(self):
+        "Checks once if the server answers; reports are queued if it does not"
         res = None
         self.__logger.log(Log.DEBUG, "Checking if XML-RPC server '%s' is reachable" % self.__host)
-        attempt = 0
-        ping_success = False
-        warning_sent = False
-        while attempt < 6:
-            try:
-                res = self.__client.Hello()
-                attempt = 10
-                ping_success = True
-            except xmlrpc.client.ProtocolError:
-                # Server do not support Hello(), but is reachable
-                self.__logger.log(Log.INFO, "Got XML-RPC connection with %s but it did not support Hello()" % self.__host)
-                res = None
-            except socket.error as err:
-                self.__logger.log(Log.INFO, "Could not establish XML-RPC contact with %s\n%s" % (self.__host, str(err)))
-
-                # Do attempts handling
-                attempt += 1
-                if attempt > 5:
-                    break # To avoid sleeping before we abort
-
-                if (self.__mailer is not None) and (not warning_sent):
-                    self.__mailer.SendMessage("[RTEVAL:WARNING] Failed to ping XML-RPC server", "Server %s did not respond." % self.__host)
-                    warning_sent = True
-
-                print("Failed pinging XML-RPC server.  Doing another attempt(%i) " % attempt)
-                time.sleep(attempt) #*15) # Incremental sleep - sleep attempts*15 seconds
-                ping_success = False
-
-        if res:
-            self.__logger.log(Log.INFO, "Verified XML-RPC connection with %s (XML-RPC API version: %i)" % (res["server"], res["APIversion"]))
-            self.__logger.log(Log.DEBUG, "Recieved greeting: %s" % res["greeting"])
+        try:
+            res = self.__client.Hello()
+        except xmlrpc.client.ProtocolError:
+            # Server do not support Hello(), but is reachable
+            self.__logger.log(Log.INFO, "Got XML-RPC connection with %s but it did not support Hello()" % self.__host)
+            return True
+        except (socket.error, http.client.HTTPException) as err:
+            self.__logger.log(Log.INFO, "Could not establish XML-RPC contact with %s\n%s" % (self.__host, str(err)))
+            if self.__mailer is not None:
+                self.__mailer.SendMessage("[RTEVAL:WARNING] Failed to ping XML-RPC server",
+                                          "Server %s did not respond.  Reports will be kept in the outbox."
+                                          % self.__host)
+            return False
 
-        return ping_success
+        self.__logger.log(Log.INFO, "Verified XML-RPC connection with %s (XML-RPC API version: %i)" % (res["server"], res["APIversion"]))
+        self.__logger.log(Log.DEBUG, "Recieved greeting: %s" % res["greeting"])
+        return True
 
 
     def SendReport(self, xmlreport):
-        "Sends the report to a given XML-RPC host.  Returns 0 on success or 2 on submission failure."
-
-        attempt = 0
-        exitcode = 2   # Presume failure
-        warning_sent = False
-        while attempt < 6:
-            try:
-                print("Submitting report to %s" % self.__url)
-                rterid = self.__client.SendReport(xmlreport)
-                print("Report registered with submission id %i" % rterid)
-                attempt = 10
-                exitcode = 0 # Success
-            except socket.error:
-                attempt += 1
-                if attempt > 5:
-                    break # To avoid sleeping before we abort
-
-                if (self.__mailer is not None) and (not warning_sent):
-                    self.__mailer.SendMessage("[RTEVAL:WARNING] Failed to submit report to XML-RPC server",
-                                              "Server %s did not respond.  Not giving up yet."
-                                              % self.__host)
-                    warning_sent = True
-
-                print("Failed sending report.  Doing another attempt(%i) " % attempt)
-                time.sleep(attempt) #*5*60) # Incremental sleep - sleep attempts*5 minutes
-
-            except Exception as err:
-                raise err
-
+        """Queues a libxml2 report document in the outbox and sends whatever
+        is due there, see SendReportFile()"""
+        return self.__send(self.__outbox.Add(xmlreport))
+
+
+    def SendReportFile(self, fname):
+        """Queues an XML report file in the outbox and sends whatever is due
+        there.  Returns 0 if the report was delivered, or 2 if it is left in
+        the outbox for a later run or FlushOutbox()"""
+        return self.__send(self.__outbox.AddFile(fname))
+
+
+    def __send(self, sha1):
+        self.__outbox.Flush(self.__client)
+        if self.__outbox.IsSent(sha1):
+            print("Report submitted to %s" % self.__url)
+            exitcode = 0
+        else:
+            print("Report could not be submitted to %s, it is kept in the outbox" % self.__url)
+            exitcode = 2
+
+        if self.__mailer is not None and exitcode == 2:
+            self.__mailer.SendMessage("[RTEVAL:WARNING] Failed to submit report to XML-RPC server",
+                                      "Server %s did not accept the report.  It is kept in the "
+                                      "outbox and will be sent later." % self.__host)
+        return exitcode
 
-        if self.__mailer is not None:
-            # Send final result messages
-            if exitcode == 2:
-                self.__mailer.SendMessage("[RTEVAL:FAILURE] Failed to submit report to XML-RPC server",
-                                          "Server %s did not respond at all after %i attempts."
-                                          % (self.__host, attempt - 1))
-            elif (exitcode == 0) and warning_sent:
-                self.__mailer.SendMessage("[RTEVAL:SUCCESS] XML-RPC server available again",
-                                          "Succeeded to submit the report to %s"
-                                          % self.__host)
 
-        return exitcode
+    def FlushOutbox(self):
+        """Sends all reports in the outbox, ignoring their backoff delays.
+        Returns the number of reports sent and the number still queued"""
+        sent = self.__outbox.Flush(self.__client, force=True)
+        return (len(sent), len(self.__outbox.Pending()))
@@ -135,12 +135,28 @@
       <xsl:text>       Executed loads:&#10;</xsl:text>
       <xsl:apply-templates select="loads/command_line"/>
     </xsl:if>
+    <xsl:apply-templates select="loads/ioload|loads/netload|loads/memload"/>
+    <xsl:if test="loads/cgroup">
+      <xsl:text>&#10;</xsl:text>
+      <xsl:text>       Load cgroups:&#10;</xsl:text>
+      <xsl:apply-templates select="loads/cgroup"/>
+    </xsl:if>
     <xsl:text>&#10;</xsl:text>
 
     <xsl:text> Cmdline:        </xsl:text>
     <xsl:value-of select="SystemInfo/cmdlineInfo/cmdline"/>
     <xsl:text>&#10;</xsl:text>
 
+    <xsl:if test="CPUpartition">
+      <xsl:text> CPU partition:  measurement </xsl:text>
+      <xsl:value-of select="CPUpartition/measurement"/>
+      <xsl:text>, loads </xsl:text>
+      <xsl:value-of select="CPUpartition/loads"/>
+      <xsl:text> (</xsl:text>
+      <xsl:value-of select="CPUpartition/@source"/>
+      <xsl:text>)&#10;</xsl:text>
+    </xsl:if>
+
     <!-- Generate a summary report for all measurement profiles -->
     <xsl:apply-templates select="Measurements/Profile"/>
    <xsl:text>  ===================================================================&#10;</xsl:text>
@@ -162,6 +178,130 @@
       <xsl:otherwise>(Not run)</xsl:otherwise>
     </xsl:choose>
     <xsl:text>&#10;</xsl:text>
+    <xsl:if test="@type = 'external'">
+      <xsl:text>           </xsl:text>
+      <xsl:value-of select="@job_instances"/>
+      <xsl:text> instances, </xsl:text>
+      <xsl:value-of select="@restarts"/>
+      <xsl:text> restarts, cpu time user/system </xsl:text>
+      <xsl:value-of select="@user_time"/>
+      <xsl:text>s/</xsl:text>
+      <xsl:value-of select="@system_time"/>
+      <xsl:text>s&#10;</xsl:text>
+    </xsl:if>
+    <xsl:for-each select="stressor">
+      <xsl:text>           </xsl:text>
+      <xsl:value-of select="@name"/>
+      <xsl:text>: </xsl:text>
+      <xsl:value-of select="@bogo_ops"/>
+      <xsl:text> bogo ops, </xsl:text>
+      <xsl:value-of select="@ops_per_sec"/>
+      <xsl:text> bogo ops/s&#10;</xsl:text>
+    </xsl:for-each>
+  </xsl:template>
+
+
+  <!--  Throughput of the I/O load  -->
+  <xsl:template match="loads/ioload">
+    <xsl:text>&#10;</xsl:text>
+    <xsl:text>       I/O load: </xsl:text>
+    <xsl:value-of select="@iops"/>
+    <xsl:text> IOPS, </xsl:text>
+    <xsl:value-of select="@throughput"/>
+    <xsl:text> bytes/s (</xsl:text>
+    <xsl:value-of select="@blocksize"/>
+    <xsl:text> byte blocks, queue depth </xsl:text>
+    <xsl:value-of select="@qdepth"/>
+    <xsl:text>, </xsl:text>
+    <xsl:value-of select="@rwmix"/>
+    <xsl:text>% reads)&#10;</xsl:text>
+    <xsl:for-each select="node">
+      <xsl:text>         - node </xsl:text>
+      <xsl:value-of select="@id"/>
+      <xsl:text>: </xsl:text>
+      <xsl:value-of select="@iops"/>
+      <xsl:text> IOPS, latency avg/max </xsl:text>
+      <xsl:value-of select="@avg_latency"/>
+      <xsl:text>/</xsl:text>
+      <xsl:value-of select="@max_latency"/>
+      <xsl:text>us</xsl:text>
+      <xsl:if test="@direct = '0'">
+        <xsl:text> (buffered)</xsl:text>
+      </xsl:if>
+      <xsl:text>&#10;</xsl:text>
+    </xsl:for-each>
+  </xsl:template>
+
+
+  <!--  Throughput of the network load  -->
+  <xsl:template match="loads/netload">
+    <xsl:text>&#10;</xsl:text>
+    <xsl:text>       Network load: </xsl:text>
+    <xsl:value-of select="@pps"/>
+    <xsl:text> packets/s, </xsl:text>
+    <xsl:value-of select="@bps"/>
+    <xsl:text> bits/s received (</xsl:text>
+    <xsl:value-of select="@protocol"/>
+    <xsl:text> over </xsl:text>
+    <xsl:value-of select="@mode"/>
+    <xsl:text>, </xsl:text>
+    <xsl:value-of select="@msgsize"/>
+    <xsl:text> byte messages)&#10;</xsl:text>
+    <xsl:for-each select="pair">
+      <xsl:text>         - node </xsl:text>
+      <xsl:value-of select="@node"/>
+      <xsl:text> pair </xsl:text>
+      <xsl:value-of select="@id"/>
+      <xsl:text>: sent </xsl:text>
+      <xsl:value-of select="sent/@pps"/>
+      <xsl:text> packets/s, received </xsl:text>
+      <xsl:value-of select="received/@pps"/>
+      <xsl:text> packets/s</xsl:text>
+      <xsl:if test="@dropped">
+        <xsl:text>, </xsl:text>
+        <xsl:value-of select="@dropped"/>
+        <xsl:text> dropped</xsl:text>
+      </xsl:if>
+      <xsl:text>&#10;</xsl:text>
+    </xsl:for-each>
+  </xsl:template>
+
+
+  <!--  Bandwidth of the memory load  -->
+  <xsl:template match="loads/memload">
+    <xsl:text>&#10;</xsl:text>
+    <xsl:text>       Memory load: </xsl:text>
+    <xsl:value-of select="@bandwidth"/>
+    <xsl:text> bytes/s (</xsl:text>
+    <xsl:value-of select="@mode"/>
+    <xsl:text>)&#10;</xsl:text>
+    <xsl:for-each select="node">
+      <xsl:text>         - node </xsl:text>
+      <xsl:value-of select="@id"/>
+      <xsl:text>: </xsl:text>
+      <xsl:value-of select="@bandwidth"/>
+      <xsl:text> bytes/s, </xsl:text>
+      <xsl:value-of select="@workers"/>
+      <xsl:text> workers with </xsl:text>
+      <xsl:value-of select="@buffer_size"/>
+      <xsl:text> byte buffers&#10;</xsl:text>
+    </xsl:for-each>
+  </xsl:template>
+
+
+  <!--  Resource usage of the load cgroups  -->
+  <xsl:template match="loads/cgroup">
+    <xsl:text>         - </xsl:text>
+    <xsl:value-of select="@name"/>
+    <xsl:text>: cpu </xsl:text>
+    <xsl:value-of select="cpu/@usage_usec"/>
+    <xsl:text>us, memory peak </xsl:text>
+    <xsl:value-of select="memory/@peak"/>
+    <xsl:text> bytes, io read/write </xsl:text>
+    <xsl:value-of select="io/@rbytes"/>
+    <xsl:text>/</xsl:text>
+    <xsl:value-of select="io/@wbytes"/>
+    <xsl:text> bytes&#10;</xsl:text>
   </xsl:template>
 
 
@@ -188,7 +328,7 @@
     <!--                                                                        -->
     <!--       select="cyclictest|new_foo_section|another_section"              -->
     <!--                                                                        -->
-    <xsl:apply-templates select="cyclictest|hwlatdetect[@format='1.0']|sysstat"/>
+    <xsl:apply-templates select="cyclictest|hwlatdetect[@format='1.0']|sysstat|irqstat|perf"/>
     <xsl:text>&#10;</xsl:text>
   </xsl:template>
 
@@ -341,9 +481,77 @@
 
     <xsl:text>          Records saved: </xsl:text>
     <xsl:value-of select="@num_entries"/>
+    <xsl:if test="@interval">
+      <xsl:text> (every </xsl:text>
+      <xsl:value-of select="@interval"/>
+      <xsl:text>s, </xsl:text>
+      <xsl:value-of select="samples/@count"/>
+      <xsl:text> kept)</xsl:text>
+    </xsl:if>
     <xsl:text>&#10;</xsl:text>
   </xsl:template>
 
+  <!-- Format the interrupt statistics of the measured cpus -->
+  <xsl:template match="/rteval/Measurements/Profile/irqstat">
+    <xsl:text>       Interrupts on measured cpus (</xsl:text>
+    <xsl:value-of select="@samples"/>
+    <xsl:text> samples, every </xsl:text>
+    <xsl:value-of select="@interval"/>
+    <xsl:text>s)&#10;</xsl:text>
+    <xsl:apply-templates select="cpu"/>
+  </xsl:template>
+
+  <xsl:template match="/rteval/Measurements/Profile/irqstat/cpu">
+    <xsl:text>          CPU </xsl:text>
+    <xsl:value-of select="@id"/>
+    <xsl:text>: </xsl:text>
+    <xsl:value-of select="@interrupts"/>
+    <xsl:text> interrupts, </xsl:text>
+    <xsl:value-of select="@softirqs"/>
+    <xsl:text> softirqs</xsl:text>
+    <xsl:for-each select="interrupt|softirq">
+      <xsl:sort select="@total" data-type="number" order="descending"/>
+      <xsl:if test="position() = 1">
+        <xsl:text>, mostly </xsl:text>
+        <xsl:value-of select="@name"/>
+        <xsl:text> (</xsl:text>
+        <xsl:value-of select="@total"/>
+        <xsl:text>)</xsl:text>
+      </xsl:if>
+    </xsl:for-each>
+    <xsl:text>&#10;</xsl:text>
+  </xsl:template>
+
+  <!-- Format the perf counters of the measured cpus -->
+  <xsl:template match="/rteval/Measurements/Profile/perf">
+    <xsl:text>       perf counters&#10;</xsl:text>
+    <xsl:for-each select="stat/cpu">
+      <xsl:sort select="@id" data-type="number"/>
+      <xsl:text>          CPU </xsl:text>
+      <xsl:value-of select="@id"/>
+      <xsl:text>:</xsl:text>
+      <xsl:for-each select="counter[@value]">
+        <xsl:text> </xsl:text>
+        <xsl:value-of select="@name"/>
+        <xsl:text>=</xsl:text>
+        <xsl:value-of select="@value"/>
+      </xsl:for-each>
+      <xsl:if test="@ipc">
+        <xsl:text> (IPC </xsl:text>
+        <xsl:value-of select="@ipc"/>
+        <xsl:text>)</xsl:text>
+      </xsl:if>
+      <xsl:text>&#10;</xsl:text>
+    </xsl:for-each>
+    <xsl:if test="record/@file">
+      <xsl:text>          Samples: </xsl:text>
+      <xsl:value-of select="record/@file"/>
+      <xsl:text> (</xsl:text>
+      <xsl:value-of select="record/@size"/>
+      <xsl:text> bytes)&#10;</xsl:text>
+    </xsl:if>
+  </xsl:template>
+
   <!-- Format information about aborts - if present -->
   <xsl:template match="abort_report">
       <xsl:text>      Run aborted: </xsl:text>
@@ -358,7 +566,14 @@
         <xsl:text>                   </xsl:text>
         <xsl:text>Measured latency when stopping was </xsl:text>
         <xsl:value-of select="breaktrace/@measured_latency"/>
-        <xsl:text>us.&#10;&#10;</xsl:text>
+        <xsl:text>us.&#10;</xsl:text>
+        <xsl:if test="breaktrace/@tracefile">
+          <xsl:text>                   </xsl:text>
+          <xsl:text>Trace saved to </xsl:text>
+          <xsl:value-of select="breaktrace/@tracefile"/>
+          <xsl:text>.&#10;</xsl:text>
+        </xsl:if>
+        <xsl:text>&#10;</xsl:text>
       </xsl:if>
   </xsl:template>
 
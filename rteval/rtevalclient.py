@@ -25,19 +25,40 @@
 #   are deemed to be part of the source code.
 #
 
+import os
+import time
 import xmlrpc.client
 import libxml2
 import io
 import bz2
 import base64
+import hashlib
 import platform
+import tempfile
+
+class TimeoutTransport(xmlrpc.client.Transport):
+    "Transport giving up on a server which does not answer within timeout seconds"
+    def __init__(self, timeout):
+        xmlrpc.client.Transport.__init__(self)
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        conn = xmlrpc.client.Transport.make_connection(self, host)
+        conn.timeout = self.timeout
+        return conn
+
 
 class rtevalclient:
     """
     rtevalclient is a library for sending rteval reports to an rteval server via XML-RPC.
     """
-    def __init__(self, url="http://rtserver.farm.hsv.redhat.com/rteval/API1/", hostn = None):
-        self.srv = xmlrpc.client.ServerProxy(url)
+    def __init__(self, url="http://rtserver.farm.hsv.redhat.com/rteval/API1/", hostn = None,
+                 timeout = None):
+        # The transport keeps its HTTP connection open between calls
+        if timeout is not None:
+            self.srv = xmlrpc.client.ServerProxy(url, transport=TimeoutTransport(timeout))
+        else:
+            self.srv = xmlrpc.client.ServerProxy(url)
         if hostn is None:
             self.hostname = platform.node()
         else:
@@ -49,19 +70,120 @@ class rtevalclient:
     def DatabaseStatus(self):
         return self.srv.DatabaseStatus()
 
+    # Compressed reports are uploaded in chunks of this size
+    CHUNKSIZE = 1024*1024
+
+    # How long to wait for the server to register an uploaded report.  It
+    # is longer than the server takes to retry a failed registration
+    REGISTER_TIMEOUT = 15*60
+
     def SendReport(self, xmldoc):
         if xmldoc.type != 'document_xml':
             raise Exception("Input is not XML document")
 
-        fbuf = io.StringIO()
-        xmlbuf = libxml2.createOutputBuffer(fbuf, 'UTF-8')
-        doclen = xmldoc.saveFileTo(xmlbuf, 'UTF-8')
+        # The document is written to disk and streamed from there, so no
+        # complete serialised copy is held in memory
+        (fd, tmpname) = tempfile.mkstemp(suffix='.xml', prefix='rteval-report-')
+        os.close(fd)
+        try:
+            xmldoc.saveFormatFileEnc(tmpname, 'UTF-8', 1)
+            return self.SendReportFile(tmpname)
+        finally:
+            os.unlink(tmpname)
+
 
+    def __compress_file(self, fname):
+        "Returns the name of a bzip2 compressed copy of fname, its size and SHA1"
+        (fd, bz2name) = tempfile.mkstemp(suffix='.xml.bz2', prefix='rteval-report-')
+        csum = hashlib.sha1()
         compr = bz2.BZ2Compressor(9)
-        cmpr = compr.compress(fbuf.getvalue())
-        data = base64.b64encode(cmpr + compr.flush())
-        ret = self.srv.SendReport(self.hostname, data)
-        print("rtevalclient::SendReport() - Sent %i bytes (XML document length: %i bytes, compression ratio: %.02f%%)" % (len(data), doclen, (1-(float(len(data)) / float(doclen)))*100 ))
+        with open(fname, 'rb') as inf, os.fdopen(fd, 'wb') as outf:
+            for block in iter(lambda: inf.read(self.CHUNKSIZE), b''):
+                data = compr.compress(block)
+                csum.update(data)
+                outf.write(data)
+            data = compr.flush()
+            csum.update(data)
+            outf.write(data)
+            size = outf.tell()
+        return (bz2name, size, csum.hexdigest())
+
+
+    @staticmethod
+    def __method_missing(fault, method):
+        """Tells if an XML-RPC fault says the server does not know the method:
+        the standard 'method not found' code, or the errors older rteval
+        and Python XML-RPC servers report it with"""
+        if fault.faultCode == -32601:
+            return True
+        msg = fault.faultString
+        return method in msg and (msg.startswith('AttributeError') or 'not supported' in msg)
+
+
+    def __wait_registered(self, ticket):
+        """Polls the server until the report of a ticket is registered,
+        returns its submission id"""
+        deadline = time.time() + self.REGISTER_TIMEOUT
+        delay = 0.5
+        while True:
+            status = self.srv.SubmissionStatus(ticket)
+            if status['state'] == 'registered':
+                return status['submid']
+            if status['state'] == 'failed':
+                raise Exception("Report %s was rejected: %s" % (ticket, status.get('error')))
+            if status['state'] == 'unknown':
+                raise Exception("Report %s is unknown to the server" % ticket)
+            if time.time() > deadline:
+                raise Exception("Report %s was not registered within %i seconds"
+                                % (ticket, self.REGISTER_TIMEOUT))
+            time.sleep(delay)
+            delay = min(delay * 2, 10)
+
+
+    def SendReportFile(self, fname):
+        """Sends an XML report file in compressed chunks, returns the
+        submission id once the server has registered it.  Calling it again
+        after a failure resumes the upload where the server left off"""
+        (bz2name, size, sha1) = self.__compress_file(fname)
+        try:
+            return self.SendCompressedReport(bz2name, os.path.getsize(fname))
+        finally:
+            os.unlink(bz2name)
+
+
+    def SendCompressedReport(self, bz2name, doclen=None):
+        """Sends a bzip2 compressed XML report file in chunks, returns its
+        submission id, see SendReportFile()"""
+        size = os.path.getsize(bz2name)
+        csum = hashlib.sha1()
+        with open(bz2name, 'rb') as f:
+            for block in iter(lambda: f.read(self.CHUNKSIZE), b''):
+                csum.update(block)
+        sha1 = csum.hexdigest()
+
+        try:
+            upload = self.srv.BeginUpload(self.hostname, size, sha1)
+        except xmlrpc.client.Fault as err:
+            if not self.__method_missing(err, 'BeginUpload'):
+                raise
+            # Older servers only take the complete report in one call
+            with open(bz2name, 'rb') as f:
+                data = base64.b64encode(f.read()).decode('ascii')
+            return self.srv.SendReport(self.hostname, data)
+
+        offset = upload['offset']
+        with open(bz2name, 'rb') as f:
+            while offset < size:
+                f.seek(offset)
+                chunk = f.read(self.CHUNKSIZE)
+                offset = self.srv.AppendChunk(upload['uploadid'], offset,
+                                              base64.b64encode(chunk).decode('ascii'),
+                                              hashlib.sha1(chunk).hexdigest())
+        # The server spools the report and registers it in the background
+        ret = self.__wait_registered(self.srv.CommitUpload(upload['uploadid']))
+
+        if doclen:
+            print("rtevalclient::SendCompressedReport() - Sent %i bytes (XML document length: %i bytes, compression ratio: %.02f%%)" % (size, doclen, (1-(float(size) / float(doclen)))*100 ))
         return ret
 
     def SendDataAsFile(self, fname, data, decompr = False):
@@ -17,6 +17,26 @@ class cmdlineInfo:
         fp.close()
         return line
 
+    def cmdline_get_param(self, key):
+        """ Returns the value of a kernel command line parameter.  An empty
+        string is returned for parameters without a value, and None if the
+        parameter is not set at all
+        """
+        for arg in self.read_cmdline().split():
+            (k, _, v) = arg.partition('=')
+            if k == key:
+                return v
+        return None
+
+    def cmdline_get_cpulist(self, key):
+        """ Returns the cpu list of a kernel command line parameter such
+        as isolcpus= or nohz_full=, with any leading flags removed
+        """
+        val = self.cmdline_get_param(key)
+        if not val:
+            return ""
+        return ",".join([p for p in val.split(',') if p and p[0].isdigit()])
+
     def MakeReport(self):
         rep_n = libxml2.newNode("cmdlineInfo")
         cmdline_n = libxml2.newNode("cmdline")
@@ -251,6 +251,13 @@ class SysTopology:
     def getcpus(self, node):
         return self.nodes[node].getcpulist()
 
+    def getsiblings(self, cpu):
+        """ return the SMT siblings of a cpu, including the cpu itself """
+        path = os.path.join(SysTopology.cpupath, 'cpu%d' % int(cpu), 'topology')
+        if not os.path.exists(os.path.join(path, 'thread_siblings_list')):
+            return [int(cpu)]
+        return CpuList(sysread(path, 'thread_siblings_list')).getcpulist()
+
 
 if __name__ == "__main__":
 
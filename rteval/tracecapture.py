@@ -0,0 +1,309 @@
+#
+#   tracecapture.py - sets up ftrace for cyclictest breaktraces and saves
+#                     the trace buffers when a break happens
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import os
+import sys
+import glob
+import shutil
+from rteval.Log import Log
+from rteval.archive import ReportArchiver
+
+PAGESIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def tracefs_mount():
+    "Returns the tracing directory, None if neither tracefs nor debugfs is mounted"
+    tracefs = None
+    debugfs = None
+    mounts = open('/proc/mounts')
+    for l in mounts:
+        field = l.split()
+        if field[2] == "tracefs" and tracefs is None:
+            tracefs = field[1]
+        elif field[2] == "debugfs" and debugfs is None:
+            debugfs = os.path.join(field[1], 'tracing')
+    mounts.close()
+    if tracefs:
+        return tracefs
+    if debugfs and os.path.isdir(debugfs):
+        return debugfs
+    return None
+
+
+def splice_raw_buffer(src, dst):
+    """Moves the pages of a per_cpu/cpuN/trace_pipe_raw file to dst.  Full
+    pages are moved with splice(2) without copying them through user space,
+    the last partially filled page is only returned by read(2).  Returns the
+    number of bytes saved"""
+    total = 0
+    infd = os.open(src, os.O_RDONLY | os.O_NONBLOCK)
+    outfd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, 'splice'):
+            (piper, pipew) = os.pipe()
+            try:
+                while True:
+                    try:
+                        n = os.splice(infd, pipew, 16 * PAGESIZE,
+                                      flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+                    except BlockingIOError:
+                        break
+                    if n == 0:
+                        break
+                    while n:
+                        moved = os.splice(piper, outfd, n, flags=os.SPLICE_F_MOVE)
+                        n -= moved
+                        total += moved
+            finally:
+                os.close(piper)
+                os.close(pipew)
+
+        while True:
+            try:
+                data = os.read(infd, PAGESIZE)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            total += os.write(outfd, data)
+    finally:
+        os.close(infd)
+        os.close(outfd)
+    return total
+
+
+
+class TraceCapture:
+    """Prepares ftrace before a cyclictest breaktrace run and saves the trace
+buffers once cyclictest has stopped the tracing.  The previous tracer
+settings are restored afterwards."""
+
+    def __init__(self, reportdir, tracer='nop', events=None, bufsize_kb=None, logger=None,
+                 tracedir=None):
+        self.__reportdir = reportdir
+        self.__tracer = tracer or 'nop'
+        self.__events = events and events.split() or []
+        self.__bufsize = bufsize_kb and int(bufsize_kb) or None
+        self.__logger = logger
+        self.__saved = {}
+        self.__tracedir = tracedir or tracefs_mount()
+        if self.__tracedir is None:
+            raise RuntimeError("tracefs is not mounted")
+
+
+    def __log(self, logtype, msg):
+        if self.__logger:
+            self.__logger.log(logtype, "[tracecapture] %s" % msg)
+
+
+    def __path(self, name):
+        return os.path.join(self.__tracedir, name)
+
+
+    def __read(self, name):
+        fp = open(self.__path(name), 'r')
+        data = fp.read()
+        fp.close()
+        return data
+
+
+    def __write(self, name, value, append=False):
+        fp = open(self.__path(name), append and 'a' or 'w')
+        fp.write(value)
+        fp.close()
+
+
+    def __set(self, name, value):
+        "Changes a tracing setting, keeping the original value to restore"
+        if name not in self.__saved:
+            self.__saved[name] = self.__read(name)
+        self.__log(Log.DEBUG, "%s = %s" % (name, value))
+        self.__write(name, value)
+
+
+    def Setup(self):
+        "Configures the tracer and the buffers and starts a clean trace"
+        # The current tracer and clock are marked with [] in the lists
+        self.__saved['current_tracer'] = self.__read('current_tracer').strip()
+        for c in self.__read('trace_clock').split():
+            if c.startswith('['):
+                self.__saved['trace_clock'] = c.strip('[]')
+        self.__saved['set_event'] = self.__read('set_event')
+        if self.__bufsize:
+            # An unused buffer reads '7 (expanded: 1408)', the size to put
+            # back is the one it gets once tracing starts
+            size = self.__read('buffer_size_kb').replace(')', '').split()
+            self.__saved['buffer_size_kb'] = size[-1]
+        self.__saved['tracing_on'] = self.__read('tracing_on').strip()
+
+        self.__write('tracing_on', '0')
+        self.__set('current_tracer', self.__tracer)
+        # Same clock as cyclictest, so the trace can be matched with other data
+        self.__set('trace_clock', 'mono')
+        if self.__bufsize:
+            self.__set('buffer_size_kb', str(self.__bufsize))
+        self.__write('set_event', '')
+        for ev in self.__events:
+            try:
+                self.__write('set_event', ev, append=True)
+            except (IOError, OSError):
+                self.__log(Log.WARN, "unknown trace event '%s', ignoring" % ev)
+
+        # Truncating the trace file clears the buffers of all cpus
+        self.__write('trace', '')
+        self.__write('tracing_on', '1')
+        self.__log(Log.INFO, "tracing with %s, events: %s" % (
+            self.__tracer, " ".join(self.__events) or "none"))
+
+
+    def Capture(self, name='breaktrace'):
+        """Saves the trace of all cpus into <reportdir>/<name>.tar.xz,
+        returns the archive file name relative to the report directory"""
+        self.__write('tracing_on', '0')
+        capdir = os.path.join(self.__reportdir, name)
+        os.mkdir(capdir)
+
+        # The formatted trace first, reading it does not consume the buffers
+        with open(self.__path('trace'), 'rb') as src, open(os.path.join(capdir, 'trace'), 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+        # The event formats are needed to decode the raw buffers
+        fmtdir = os.path.join(capdir, 'events')
+        os.mkdir(fmtdir)
+        for f in ('header_page', 'header_event'):
+            shutil.copyfile(self.__path(os.path.join('events', f)), os.path.join(fmtdir, f))
+        for ev in self.__read('set_event').split():
+            (system, event) = ev.split(':')
+            fmt = self.__path(os.path.join('events', system, event, 'format'))
+            if os.path.exists(fmt):
+                shutil.copyfile(fmt, os.path.join(fmtdir, "%s:%s" % (system, event)))
+        if os.path.exists(self.__path('saved_cmdlines')):
+            shutil.copyfile(self.__path('saved_cmdlines'), os.path.join(capdir, 'saved_cmdlines'))
+
+        rawdir = os.path.join(capdir, 'per_cpu')
+        os.mkdir(rawdir)
+        total = 0
+        for cpudir in sorted(glob.glob(self.__path('per_cpu/cpu*'))):
+            total += splice_raw_buffer(os.path.join(cpudir, 'trace_pipe_raw'),
+                                       os.path.join(rawdir, os.path.basename(cpudir) + '.raw'))
+        self.__log(Log.DEBUG, "saved %d bytes of raw trace buffers" % total)
+
+        archiver = ReportArchiver(capdir, 'xz', logger=self.__logger)
+        archiver.Start()
+        fname = archiver.Complete()
+        shutil.rmtree(capdir)
+        self.__log(Log.INFO, "trace saved to %s" % fname)
+        return os.path.basename(fname)
+
+
+    def Restore(self):
+        "Puts back the tracer settings found by Setup()"
+        if not self.__saved:
+            return
+        self.__write('tracing_on', '0')
+        for name in ('current_tracer', 'trace_clock', 'buffer_size_kb'):
+            if name in self.__saved:
+                self.__write(name, self.__saved[name])
+        if 'set_event' in self.__saved:
+            self.__write('set_event', '')
+            for ev in self.__saved['set_event'].split():
+                self.__write('set_event', ev, append=True)
+        self.__write('tracing_on', self.__saved.get('tracing_on', '1'))
+        self.__saved = {}
+
+
+
+def _fake_tracefs(tracedir, bufsize):
+    "Fills tracedir with the files Setup() and Restore() use"
+    for (name, value) in (('current_tracer', 'function\n'),
+                          ('trace_clock', '[local] global mono\n'),
+                          ('set_event', 'sched:sched_switch\n'),
+                          ('buffer_size_kb', bufsize),
+                          ('tracing_on', '1\n'),
+                          ('trace', '')):
+        with open(os.path.join(tracedir, name), 'w') as fp:
+            fp.write(value)
+
+
+def unit_test(rootdir):
+    import tempfile
+    try:
+        l = Log()
+        l.SetLogVerbosity(Log.INFO|Log.DEBUG|Log.WARN)
+        tmp = tempfile.mkdtemp()
+
+        def content(name):
+            with open(os.path.join(tmp, name)) as fp:
+                return fp.read()
+
+        # Without a buffer size the buffers are left alone
+        _fake_tracefs(tmp, '7 (expanded: 1408)\n')
+        tc = TraceCapture(tmp, 'nop', None, None, logger=l, tracedir=tmp)
+        tc.Setup()
+        if content('current_tracer') != 'nop' or content('trace_clock') != 'mono':
+            raise Exception("tracer not set up")
+        tc.Restore()
+        if content('buffer_size_kb') != '7 (expanded: 1408)\n':
+            raise Exception("buffer_size_kb changed: %s" % content('buffer_size_kb'))
+        if content('current_tracer') != 'function' or content('trace_clock') != 'local':
+            raise Exception("tracer not restored")
+        if content('set_event') != 'sched:sched_switch' or content('tracing_on') != '1':
+            raise Exception("events not restored")
+
+        # A buffer not expanded yet gets its expanded size back
+        _fake_tracefs(tmp, '7 (expanded: 1408)\n')
+        tc = TraceCapture(tmp, 'nop', None, 1024, logger=l, tracedir=tmp)
+        tc.Setup()
+        if content('buffer_size_kb') != '1024':
+            raise Exception("buffer_size_kb not set")
+        tc.Restore()
+        if content('buffer_size_kb') != '1408':
+            raise Exception("buffer_size_kb restored to %s" % content('buffer_size_kb'))
+        shutil.rmtree(tmp)
+
+        tracedir = tracefs_mount()
+        if tracedir is None or not os.access(os.path.join(tracedir, 'tracing_on'), os.W_OK):
+            print("tracefs is not available, skipping the capture test")
+            return 0
+        tmp = tempfile.mkdtemp()
+        tc = TraceCapture(tmp, 'nop', 'sched:sched_switch', 1024, logger=l)
+        tc.Setup()
+        try:
+            import time
+            time.sleep(1)
+            print("captured %s" % tc.Capture())
+        finally:
+            tc.Restore()
+        print(os.listdir(tmp))
+        shutil.rmtree(tmp)
+        return 0
+    except Exception as e:
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        print("** EXCEPTION %s", str(e))
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(unit_test(None))
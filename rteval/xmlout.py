@@ -26,6 +26,8 @@
 import sys
 import re
 import codecs
+import shutil
+from xml.sax.saxutils import quoteattr
 import libxml2
 import lxml.etree
 
@@ -50,7 +52,15 @@ def convert_lxml_to_libxml2_nodes(inlxml):
     return libxml2.parseDoc(bytes.decode(lxml.etree.tostring(inlxml))).getRootElement()
 
 class XMLOut:
-    '''Class to create XML output'''
+    '''Class to create XML output
+
+    When NewReport() is given a file name, the report is written
+    incrementally.  The start tag of a top level block is written when the
+    block is opened, and each of its children is serialized to the file as
+    soon as it is complete and then freed.  The complete document is never
+    kept in memory, and whatever was written before a crash stays in the
+    file.  XSLT transformations of such a report parse the written file
+    directly.'''
     def __init__(self, roottag, version, attr=None, encoding='UTF-8'):
         self.level = 0
         self.encoding = encoding
@@ -64,10 +74,20 @@ class XMLOut:
         self.tag_trans = self.__setup_tag_trans()
         self.roottag = self.__fixtag(roottag)
         self.xmldoc = None
+        self.xmlroot = None
+        self.__stream = None      # Open file object while streaming a report
+        self.__streamtop = None   # Open top level block while streaming
+        self.__streamblock = None # Child of the top level block being built
+        self.__reserved = {}      # Blocks whose attributes may be updated later
+        self.__srcfile = None     # File holding the complete report, if any
+        self.__recovered = False  # Loaded report was truncated and recovered
 
     def __del__(self):
         if self.level > 0:
-            raise RuntimeError("XMLOut: open blocks at __del__ (last opened '%s')" % self.currtag.name)
+            # Raising here would only hide the error which left them open
+            sys.stderr.write("XMLOut: open blocks at __del__ (last opened '%s')\n" % self.currtag.name)
+        if self.__stream is not None:
+            self.__stream.close()
         if self.xmldoc is not None:
             self.xmldoc.freeDoc()
 
@@ -133,6 +153,22 @@ class XMLOut:
         else:
             raise TypeError("unhandled type (%s) for value '%s'" % (type(data), str(data)))
 
+    def __starttag(self, tagname, attributes):
+        "Returns an unterminated start tag, such as '<tag attr=\"val\"'"
+        return "<%s%s" % (tagname, "".join([" %s=%s" % (k, quoteattr(self.__encode(v)))
+                                            for (k, v) in list(attributes.items())]))
+
+    def __bytelen(self, txt):
+        return len(txt.encode(self.encoding))
+
+    def __flush(self, node):
+        "Writes a complete node to the report file and frees it"
+        node.unlinkNode()
+        self.__stream.write("%s%s\n" % ("  " * (self.level + 1),
+                                         node.serialize(self.encoding, 1)))
+        self.__stream.flush()
+        node.freeNode()
+
     def close(self):
         if self.status == 0:
             raise RuntimeError("XMLOut: No XML document is created nor loaded")
@@ -141,30 +177,62 @@ class XMLOut:
         if self.level > 0:
             raise RuntimeError("XMLOut: open blocks at close() (last opened '%s')" % self.currtag.name)
 
-        if self.status == 1: # Only set the root node in the doc on created reports (NewReport called)
+        if self.__stream is not None:
+            self.__stream.write("</%s>\n" % self.roottag)
+            self.__stream.close()
+            self.__stream = None
+            self.xmlroot.freeNode()
+            self.xmlroot = None
+        elif self.status == 1: # Only set the root node in the doc on created reports (NewReport called)
             self.xmldoc.setRootElement(self.xmlroot)
         self.status = 3
 
-    def NewReport(self):
+    def NewReport(self, filename=None):
+        """Starts a new report.  If a filename is given, the report is
+        streamed to that file as it is built"""
         if self.status != 0 and self.status != 3:
             raise RuntimeError("XMLOut: Cannot start a new report without closing the currently opened one")
 
-        if self.status == 3:
+        if self.xmldoc is not None:
             self.xmldoc.freeDoc() # Free the report from memory if we have one already
+            self.xmldoc = None
 
-        self.xmldoc = libxml2.newDoc("1.0")
         self.xmlroot = libxml2.newNode(self.roottag)
         self.__add_attributes(self.xmlroot, {'version': self.version})
         self.__add_attributes(self.xmlroot, self.rootattr)
         self.currtag = self.xmlroot
         self.level = 0
         self.status = 1
+        self.__srcfile = filename
+
+        if filename is None:
+            self.xmldoc = libxml2.newDoc("1.0")
+            return
+
+        attrs = {'version': self.version}
+        attrs.update(self.rootattr or {})
+        self.__reserved = {}
+        self.__stream = codecs.open(filename, "w", encoding=self.encoding)
+        self.__stream.write('<?xml version="1.0" encoding="%s"?>\n' % self.encoding)
+        self.__stream.write("%s>\n" % self.__starttag(self.roottag, attrs))
+        self.__stream.flush()
 
     def LoadReport(self, filename, validate_version=False):
-        if self.status == 3:
+        if self.xmldoc is not None:
             self.xmldoc.freeDoc() # Free the report from memory if we have one already
 
-        self.xmldoc = libxml2.parseFile(filename)
+        self.__srcfile = filename
+        self.__recovered = False
+        try:
+            self.xmldoc = libxml2.parseFile(filename)
+        except libxml2.parserError:
+            # A streamed report from an interrupted run lacks its closing
+            # tags, recover whatever was written before it stopped
+            self.xmldoc = libxml2.recoverFile(filename)
+            if self.xmldoc is None:
+                raise
+            sys.stderr.write("XMLOut: %s is incomplete, using the recovered part\n" % filename)
+            self.__recovered = True
         if self.xmldoc.name != filename:
             self.status = 3
             raise RuntimeError("XMLOut: Loading report failed")
@@ -193,7 +261,13 @@ class XMLOut:
 
         if xslt is None:
             # If no XSLT template is give, write raw XML
-            self.xmldoc.saveFormatFileEnc(filename, self.encoding, 1)
+            if self.xmldoc is not None:
+                self.xmldoc.saveFormatFileEnc(filename, self.encoding, 1)
+            elif filename == "-":
+                with open(self.__srcfile, "r", encoding=self.encoding) as src:
+                    shutil.copyfileobj(src, sys.stdout)
+            elif filename != self.__srcfile:
+                shutil.copyfile(self.__srcfile, filename)
             return
 
         # Load XSLT file and prepare the XSLT parser
@@ -208,9 +282,15 @@ class XMLOut:
         else:
             dstfile = sys.stdout
         #
-        # Parse XML+XSLT and write the result to file
+        # Parse XML+XSLT and write the result to file.  If the report
+        # exists as a file, parse that instead of converting the libxml2
+        # document through an in-memory serialization.
         #
-        xmldoc = convert_libxml2_to_lxml_doc(self.xmldoc)
+        if self.__srcfile is not None:
+            xmldoc = lxml.etree.parse(self.__srcfile,
+                                      lxml.etree.XMLParser(recover=self.__recovered))
+        else:
+            xmldoc = convert_libxml2_to_lxml_doc(self.xmldoc)
         resdoc = parser(xmldoc)
 
         #  Write the file with the requested output encoding
@@ -229,14 +309,37 @@ class XMLOut:
     def GetXMLdocument(self):
         if self.status != 2 and self.status != 3:
             raise RuntimeError("XMLOut: XML document is not closed")
+        if self.xmldoc is None:
+            # Streamed reports are only parsed back when really needed
+            self.xmldoc = libxml2.parseFile(self.__srcfile)
         return self.xmldoc
 
-    def openblock(self, tagname, attributes=None):
+    def openblock(self, tagname, attributes=None, reserve=0):
+        """Opens a new block.  The attributes of a top level block can be
+        changed later on with UpdateBlockAttributes(), if 'reserve' bytes are
+        set aside for them in the start tag"""
         if self.status != 1:
             raise RuntimeError("XMLOut: openblock() cannot be called before NewReport() is called")
         ntag = libxml2.newNode(self.__fixtag(tagname))
         self.__add_attributes(ntag, attributes)
-        self.currtag.addChild(ntag)
+        if self.__stream is not None and self.level == 0:
+            # Write the start tag right away, the node is only used to
+            # hold the children until they are written
+            tag = self.__starttag(ntag.name, attributes or {})
+            if reserve:
+                self.__reserved[ntag.name] = (self.__stream.tell(),
+                                              self.__bytelen(tag) + reserve)
+                tag += " " * reserve
+            self.__stream.write("  %s>\n" % tag)
+            self.__stream.flush()
+            self.__streamtop = ntag
+        elif self.__stream is not None and self.level == 1:
+            # Keep the block detached until it is complete
+            self.__streamblock = ntag
+        else:
+            self.currtag.addChild(ntag)
+            if reserve and self.level == 0:
+                self.__reserved[ntag.name] = ntag
         self.currtag = ntag
         self.level += 1
         return ntag
@@ -246,15 +349,56 @@ class XMLOut:
             raise RuntimeError("XMLOut: closeblock() cannot be called before NewReport() is called")
         if self.level == 0:
             raise RuntimeError("XMLOut: no open tags to close")
-        self.currtag = self.currtag.get_parent()
         self.level -= 1
+        if self.__stream is not None and self.level == 0:
+            self.__stream.write("  </%s>\n" % self.__streamtop.name)
+            self.__stream.flush()
+            self.__streamtop.freeNode()
+            self.__streamtop = None
+            self.currtag = self.xmlroot
+        elif self.__stream is not None and self.level == 1:
+            self.__flush(self.__streamblock)
+            self.__streamblock = None
+            self.currtag = self.__streamtop
+        else:
+            self.currtag = self.currtag.get_parent()
         return self.currtag
 
+    def UpdateBlockAttributes(self, tagname, attributes):
+        """Replaces the attributes of a top level block opened with room
+        reserved for it, even after the block has been written to file"""
+        if self.status != 1:
+            raise RuntimeError("XMLOut: UpdateBlockAttributes() cannot be called before NewReport() is called")
+        tagname = self.__fixtag(tagname)
+        if tagname not in self.__reserved:
+            raise RuntimeError("XMLOut: no room reserved for attributes in '%s'" % tagname)
+
+        if self.__stream is None:
+            node = self.__reserved[tagname]
+            for k, v in list(attributes.items()):
+                node.setProp(k, self.__encode(v))
+            return
+
+        (offset, size) = self.__reserved[tagname]
+        tag = self.__starttag(tagname, attributes)
+        if self.__bytelen(tag) > size:
+            raise RuntimeError("XMLOut: attributes do not fit the room reserved in '%s'" % tagname)
+        endpos = self.__stream.tell()
+        self.__stream.seek(offset)
+        self.__stream.write("  %s%s>" % (tag, " " * (size - self.__bytelen(tag))))
+        self.__stream.seek(endpos)
+        self.__stream.flush()
+
     def taggedvalue(self, tag, value, attributes=None):
+        """Adds a tag with a value.  Returns the new node, or None if it was
+        written straight to a streamed report"""
         if self.status != 1:
             raise RuntimeError("XMLOut: taggedvalue() cannot be called before NewReport() is called")
         ntag = self.currtag.newTextChild(None, self.__fixtag(tag), self.__encode(value))
         self.__add_attributes(ntag, attributes)
+        if self.__stream is not None and self.level <= 1:
+            self.__flush(ntag)
+            return None
         return ntag
 
     def ParseData(self, tagname, data, attributes=None, tuple_tagname="tuples", prefix=""):
@@ -267,13 +411,22 @@ class XMLOut:
         ntag = libxml2.newNode(self.__fixtag(tagname))
         self.__add_attributes(ntag, attributes)
         self.__parseToXML(ntag, data)
+        if self.__stream is not None and self.level <= 1:
+            self.__flush(ntag)
+            return None
         self.currtag.addChild(ntag)
         return ntag
 
     def AppendXMLnodes(self, nodes):
+        """Adds a node tree to the report.  On streamed reports, trees added
+        to the root level or to a top level block are written to the file and
+        freed immediately"""
         if not isinstance(nodes, libxml2.xmlNode):
             raise ValueError("Input value is not a libxml2.xmlNode")
 
+        if self.__stream is not None and self.level <= 1:
+            self.__flush(nodes)
+            return None
         return self.currtag.addChild(nodes)
 
 def unit_test(rootdir):
@@ -307,6 +460,22 @@ def unit_test(rootdir):
         x.Write("/tmp/xmlout-test.xml")
         del x
 
+        print("------------- STREAMED REPORT -------------------------")
+        x = XMLOut('rteval', 'UNIT-TEST', None, 'UTF-8')
+        x.NewReport("/tmp/xmlout-stream-test.xml")
+        x.openblock('run_info', {'days': 0, 'hours': 0, 'minutes': 0, 'seconds': 0}, 32)
+        x.taggedvalue('time', '11:22:33')
+        x.closeblock()
+        x.UpdateBlockAttributes('run_info', {'days': 0, 'hours': 0, 'minutes': 32, 'seconds': 18})
+        x.taggedvalue('annotate', 'streamed')
+        x.openblock('loads', {'load_average': 3.29})
+        x.taggedvalue('command_line', 'dd if=/dev/zero of=/dev/null', {'name': 'lightloader'})
+        x.closeblock()
+        x.close()
+        x.Write("-")
+        x.Write("-", "rteval_text.xsl")
+        del x
+
         print("------------- LOAD XML FROM FILE -----------------------------")
         x = XMLOut('rteval', 'UNIT-TEST', None, 'UTF-8')
         x.LoadReport("/tmp/xmlout-test.xml", True)
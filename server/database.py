@@ -26,7 +26,9 @@
 #   are deemed to be part of the source code.
 #
 
+import io
 import psycopg2
+import psycopg2.extras
 import types
 
 class Database(object):
@@ -52,8 +54,16 @@ class Database(object):
         dsn = " ".join(["%s='%s'" %(k,v) for (k,v) in list(dsnd.items())])
         self.conn = not self.noaction and psycopg2.connect(dsn) or None
 
+        # Names of the statements prepared on this connection
+        self.__prepared = set()
+        self.__cursorseq = 0
 
-    def INSERT(self, sqlvars):
+
+    # Record sets at least this large are loaded with COPY when no
+    # column values need to be returned
+    COPY_THRESHOLD = 1000
+
+    def __check_sqlvars(self, sqlvars):
         #
         # Validate input data
         #
@@ -65,7 +75,7 @@ class Database(object):
             sqlvars['fields']
             sqlvars['records']
         except KeyError as err:
-            raise KeyError("Input dictionary do not contain a required element: %s").with_traceback(str(err))
+            raise KeyError("Input dictionary do not contain a required element: %s" % str(err))
 
         if type(sqlvars['fields']) is not list:
             raise AttributeError("The 'fields' element is not a list of fields")
@@ -73,59 +83,86 @@ class Database(object):
         if type(sqlvars['records']) is not list:
             raise AttributeError("The 'records' element is not a list of fields")
 
+        for rec in sqlvars['records']:
+            if type(rec) is not list:
+                raise AttributeError("The field values inside the 'records' list must be in a list")
+
+
+    def INSERT(self, sqlvars):
+        """Inserts all records with a single multi-row INSERT statement.  If
+        'returning' names a column, its values are returned in record order,
+        otherwise a list of True values"""
+        self.__check_sqlvars(sqlvars)
         if len(sqlvars['records']) == 0:
             return True
 
-        try:
-            sqlvars['returning']
-        except:
-            sqlvars['returning'] = None
+        returning = sqlvars.get('returning')
+        if not returning and len(sqlvars['records']) >= self.COPY_THRESHOLD:
+            self.COPY(sqlvars)
+            return [True] * len(sqlvars['records'])
 
         #
-        # Build SQL template
+        # Build SQL template, execute_values() expands %s into all the rows
         #
-        sqlstub = "INSERT INTO %s (%s) VALUES (%s)" % (
+        sqlstub = "INSERT INTO %s (%s) VALUES %%s%s" % (
             sqlvars['table'],
             ",".join(sqlvars['fields']),
-            ",".join(["%%(%s)s" % f for f in sqlvars['fields']])
+            returning and " RETURNING %s" % returning or ""
             )
 
-        # Get a database cursor
-        curs = not self.noaction and self.conn.cursor() or None
+        if self.debug:
+            print("SQL QUERY: ==> %s [%i records]" % (sqlstub, len(sqlvars['records'])))
 
-        #
-        # Loop through all records and insert them into the database
-        #
-        results = []
-        for rec in sqlvars['records']:
-            if type(rec) is not list:
-                raise AttributeError("The field values inside the 'records' list must be in a list")
+        if self.noaction:
+            return [True] * len(sqlvars['records'])
 
-            # Create a dictionary, which will be used for the SQL operation
-            values = {}
-            for i in range(0, len(sqlvars['fields'])):
-                values[sqlvars['fields'][i]] = rec[i]
+        # One round trip for all the records
+        curs = self.conn.cursor()
+        res = psycopg2.extras.execute_values(curs, sqlstub, sqlvars['records'],
+                                             page_size=len(sqlvars['records']),
+                                             fetch=bool(returning))
+        curs.close()
 
-            if self.debug:
-                print("SQL QUERY: ==> %s" % (sqlstub % values))
+        if returning:
+            return [r[0] for r in res]
+        return [True] * len(sqlvars['records'])
 
-            # Do the INSERT query
-            if not self.noaction:
-                curs.execute(sqlstub, values)
-
-            # If a return value for the INSERT is defined, catch that one
-            if not self.noaction and sqlvars['returning']:
-                # The psycopg2 do not handle INSERT INTO ... RETURNING column queries, so we can only use
-                # this on tables with oid and do the look up that way
-                vls = {"table": sqlvars['table'], 'colname': sqlvars['returning'], 'oid': str(curs.lastrowid)}
-                curs.execute("SELECT %(colname)s FROM %(table)s WHERE oid='%(oid)s'" % vls)
-                results.append(curs.fetchone()[0])
-            else:
-                results.append(True)
 
-        if not self.noaction:
-            curs.close()
-        return results
+    def __copy_value(self, val):
+        "Formats a value for the COPY text format"
+        if val is None:
+            return "\\N"
+        if type(val) is bool:
+            return val and "t" or "f"
+        return str(val).replace("\\", "\\\\").replace("\t", "\\t") \
+                       .replace("\n", "\\n").replace("\r", "\\r")
+
+
+    def COPY(self, sqlvars):
+        """Bulk loads all records with COPY ... FROM STDIN, streaming the
+        whole record set to the server in one operation.  Returns the number
+        of rows loaded"""
+        self.__check_sqlvars(sqlvars)
+        if len(sqlvars['records']) == 0:
+            return 0
+
+        sql = "COPY %s (%s) FROM STDIN" % (sqlvars['table'], ",".join(sqlvars['fields']))
+        if self.debug:
+            print("SQL QUERY: ==> %s [%i records]" % (sql, len(sqlvars['records'])))
+        if self.noaction:
+            return 0
+
+        buf = io.StringIO()
+        for rec in sqlvars['records']:
+            buf.write("\t".join([self.__copy_value(v) for v in rec]))
+            buf.write("\n")
+        buf.seek(0)
+
+        curs = self.conn.cursor()
+        curs.copy_expert(sql, buf)
+        rows = curs.rowcount
+        curs.close()
+        return rows
 
 
     def DELETE(self, table, where):
@@ -161,32 +198,108 @@ class Database(object):
                 where and "WHERE %s" % " AND ".join(["%s = %%(%s)s" % (k,k) for (k,v) in list(where.items())] or "")
                 )
             if self.debug:
-                print("SQL QUERY: ==> %s" % (sql % where))
+                print("SQL QUERY: ==> %s %s" % (sql, where or ""))
             if not self.noaction:
                 curs.execute(sql, where)
             else:
                 # If no action is setup (mainly for debugging), return empty result set
-                return {"table": table, "fields": [], "records": []}
+                return self.__result(table, None, [])
         except Exception as err:
-            raise Exception("** SQL ERROR *** %s\n** SQL ERROR ** Message: %s" % (where and (sql % where) or sql, str(err)))
+            raise Exception("** SQL ERROR *** %s %s\n** SQL ERROR ** Message: %s" % (sql, where or "", str(err)))
 
-        # Extract field names
-        fields = []
-        for fn in curs.description:
-            fields.append(fn[0])
+        res = self.__result(table, curs.description, curs.fetchall())
+        curs.close()
+        if self.debug:
+            print("database::SELECT() result ** Fields: %s\nRecords: %s" % (res['fields'], res['records']))
+        return res
 
-        # Extract records
-        records = []
-        for dbrec in curs.fetchall():
-            values = []
-            for val in dbrec:
-                values.append(val)
-            records.append(values)
 
-        curs.close()
+    def __result(self, table, description, rows):
+        "Builds a result set, with a field name to index map for GetValue()"
+        fields = [fn[0] for fn in description or []]
+        return {"table": table,
+                "fields": fields,
+                "fieldmap": dict([(f, i) for (i, f) in enumerate(fields)]),
+                "records": [list(r) for r in rows]}
+
+
+    def QueryPrepared(self, name, sql, args=None):
+        """Runs a query as a prepared statement, parsed and planned by the
+        server only on the first call with that name on this connection.
+        The parameters in sql are $1, $2, ...  Returns a result set like
+        SELECT(), with the statement name as table"""
+        args = list(args or [])
+        if self.debug:
+            print("SQL QUERY: ==> [%s] %s %s" % (name, sql, args))
+        if self.noaction:
+            return self.__result(name, None, [])
+
+        curs = self.conn.cursor()
+        try:
+            if name not in self.__prepared:
+                # Prepared statements outlive transactions, but not the session
+                curs.execute("PREPARE %s AS %s" % (name, sql))
+                self.__prepared.add(name)
+            if args:
+                curs.execute("EXECUTE %s (%s)" % (name, ",".join(["%s"] * len(args))), args)
+            else:
+                curs.execute("EXECUTE %s" % name)
+            return self.__result(name, curs.description, curs.description and curs.fetchall() or [])
+        except Exception as err:
+            raise Exception("** SQL ERROR *** [%s] %s %s\n** SQL ERROR ** Message: %s" % (name, sql, args, str(err)))
+        finally:
+            curs.close()
+
+
+    def QueryStream(self, sql, args=None, batchsize=1000):
+        """Runs a query through a server side cursor and yields the records
+        as result sets of at most batchsize records, so even huge queries
+        run in constant memory.  The parameters in sql are %(name)s or %s as
+        for SELECT().  The cursor lives in the current transaction, which must
+        not be ended before the last batch has been read"""
+        if self.debug:
+            print("SQL QUERY: ==> [stream] %s %s" % (sql, args or ""))
+        if self.noaction:
+            return
+
+        self.__cursorseq += 1
+        curs = self.conn.cursor(name="rteval_stream_%i" % self.__cursorseq)
+        try:
+            curs.execute(sql, args)
+            while True:
+                rows = curs.fetchmany(batchsize)
+                if not rows:
+                    break
+                yield self.__result(curs.name, curs.description, rows)
+        except Exception as err:
+            raise Exception("** SQL ERROR *** %s %s\n** SQL ERROR ** Message: %s" % (sql, args or "", str(err)))
+        finally:
+            curs.close()
+
+    def GetHistograms(self, rterid):
+        """Returns the cyclictest histograms of an rteval run as a dict of core
+        to a (bucket indexes, bucket values) tuple of lists.  The system wide
+        histogram has core None.  Needs SQL schema version 1.6 or newer"""
+        sql = "SELECT core, bucket_index, bucket_value FROM cyclic_histogram_packed" \
+              " WHERE rterid = %(rterid)s"
         if self.debug:
-            print("database::SELECT() result ** Fields: %s\nRecords: %s" % (fields, records))
-        return {"table": table, "fields": fields, "records": records}
+            print("SQL QUERY: ==> %s" % (sql % {'rterid': rterid}))
+        if self.noaction:
+            return {}
+
+        # One record per core, psycopg2 returns the arrays as lists
+        curs = self.conn.cursor()
+        try:
+            curs.execute(sql, {'rterid': rterid})
+            hists = {}
+            for (core, idx, val) in curs:
+                hists[core] = (idx, val)
+        except Exception as err:
+            raise Exception("** SQL ERROR *** %s\n** SQL ERROR ** Message: %s" % (sql, str(err)))
+        finally:
+            curs.close()
+        return hists
+
 
     def COMMIT(self):
         # Commit the work
@@ -199,6 +312,28 @@ class Database(object):
             self.conn.rollback()
 
 
+    def Ping(self):
+        "Checks if the connection is still usable, returns True or False"
+        if self.noaction:
+            return True
+        if self.conn.closed:
+            return False
+        try:
+            curs = self.conn.cursor()
+            curs.execute("SELECT 1")
+            curs.fetchone()
+            curs.close()
+            # Do not leave the ping open as a transaction
+            self.conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def Close(self):
+        if not self.noaction and not self.conn.closed:
+            self.conn.close()
+
+
     def GetValue(self, dbres, recidx, field):
         "Helper function to easy extract a field from a record set"
 
@@ -223,11 +358,14 @@ class Database(object):
         if recidx >= len(dbres['records']):
             return None
 
-        if type(field) == bytes:
-            # Find the field index of the field name in the records set
+        if type(field) is str:
+            # Find the field index of the field name in the records set,
+            # result sets built elsewhere get their map on first use
+            if 'fieldmap' not in dbres:
+                dbres['fieldmap'] = dict([(f, i) for (i, f) in enumerate(dbres['fields'])])
             try:
-                fidx = dbres['fields'].index(field)
-            except ValueError:
+                fidx = dbres['fieldmap'][field]
+            except KeyError:
                 raise Exception("Field '%s' is not found in the database result" % field)
         elif type(field) == int:
             # If the field value is integer, assume it is the numeric field id
@@ -0,0 +1,207 @@
+#
+#   dbpool.py
+#   A bounded, thread-safe pool of Database connections, shared by the
+#   XML-RPC requests handled by a server process
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import time
+import threading
+from contextlib import contextmanager
+from database import Database
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class DatabasePool(object):
+    """Keeps up to maxconn open Database objects.  Get() hands out an idle
+    connection, or opens a new one while below maxconn, or waits for one to
+    be returned with Put().  Connections idle for longer than healthcheck
+    seconds are pinged before being handed out, and replaced if the ping
+    fails.  Connections returned as broken are closed and dropped"""
+
+    def __init__(self, dbargs, minconn=1, maxconn=10, timeout=30, healthcheck=60):
+        self.__dbargs = dbargs
+        self.__minconn = minconn
+        self.__maxconn = maxconn
+        self.__timeout = timeout
+        self.__healthcheck = healthcheck
+        self.__cond = threading.Condition()
+        self.__idle = []        # [(Database, time returned)], most recent last
+        self.__inuse = 0
+        self.__stats = {'created': 0,
+                        'reused': 0,
+                        'reconnects': 0,
+                        'failed_healthchecks': 0,
+                        'discarded': 0,
+                        'waits': 0,
+                        'timeouts': 0,
+                        'wait_time': 0.0}
+
+
+    def __connect(self):
+        dbc = Database(**self.__dbargs)
+        self.__stats['created'] += 1
+        return dbc
+
+
+    def Get(self, timeout=None):
+        "Returns a Database object, raises PoolTimeout if none is available in time"
+        if timeout is None:
+            timeout = self.__timeout
+        with self.__cond:
+            waitstart = None
+            while not self.__idle and self.__inuse >= self.__maxconn:
+                if waitstart is None:
+                    waitstart = time.time()
+                    self.__stats['waits'] += 1
+                remaining = timeout - (time.time() - waitstart)
+                if remaining <= 0:
+                    self.__stats['timeouts'] += 1
+                    raise PoolTimeout("No database connection available within %s seconds" % timeout)
+                self.__cond.wait(remaining)
+            if waitstart is not None:
+                self.__stats['wait_time'] += time.time() - waitstart
+
+            self.__inuse += 1
+            if self.__idle:
+                (dbc, returned) = self.__idle.pop()
+            else:
+                dbc = None
+
+        # Connecting and pinging is done without holding the lock
+        try:
+            if dbc is None:
+                return self.__connect()
+            if time.time() - returned > self.__healthcheck and not dbc.Ping():
+                with self.__cond:
+                    self.__stats['failed_healthchecks'] += 1
+                    self.__stats['reconnects'] += 1
+                dbc.Close()
+                return self.__connect()
+            with self.__cond:
+                self.__stats['reused'] += 1
+            return dbc
+        except Exception:
+            with self.__cond:
+                self.__inuse -= 1
+                self.__cond.notify()
+            raise
+
+
+    def Put(self, dbc, broken=False):
+        "Returns a Database object to the pool"
+        if not broken:
+            # Never hand out a connection in the middle of a transaction
+            try:
+                dbc.ROLLBACK()
+            except Exception:
+                broken = True
+        with self.__cond:
+            self.__inuse -= 1
+            if broken:
+                self.__stats['discarded'] += 1
+            else:
+                self.__idle.append((dbc, time.time()))
+            self.__cond.notify()
+        if broken:
+            try:
+                dbc.Close()
+            except Exception:
+                pass
+
+
+    @contextmanager
+    def Connection(self):
+        """Context manager lending a connection; it is dropped from the pool
+        if the block raises a database error"""
+        dbc = self.Get()
+        try:
+            yield dbc
+        except Exception as err:
+            self.Put(dbc, broken=IsConnectionError(err))
+            raise
+        else:
+            self.Put(dbc)
+
+
+    def Prefill(self):
+        "Opens minconn connections up front"
+        with self.__cond:
+            missing = self.__minconn - len(self.__idle) - self.__inuse
+        for i in range(missing):
+            dbc = self.__connect()
+            with self.__cond:
+                self.__idle.append((dbc, time.time()))
+                self.__cond.notify()
+
+
+    def GetStats(self):
+        "Returns the pool metrics, as a dict usable in XML-RPC replies"
+        with self.__cond:
+            ret = dict(self.__stats)
+            ret['wait_time'] = round(ret['wait_time'], 3)
+            ret.update({'idle': len(self.__idle),
+                        'in_use': self.__inuse,
+                        'max_size': self.__maxconn})
+        return ret
+
+
+    def Close(self):
+        "Closes all idle connections"
+        with self.__cond:
+            idle = self.__idle
+            self.__idle = []
+        for (dbc, _) in idle:
+            dbc.Close()
+
+
+
+def IsConnectionError(err):
+    "True if err means the connection itself is unusable"
+    try:
+        import psycopg2
+    except ImportError:
+        return False
+    return isinstance(err, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+
+__pools = {}
+__pools_lock = threading.Lock()
+
+def GetPool(config, debug=False, noaction=False):
+    """Returns the pool for the database in the configuration, created on
+    first use and shared by everything running in this process"""
+    dbargs = {'host': config.db_server, 'port': config.db_port,
+              'database': config.database, 'user': config.db_username,
+              'password': config.db_password, 'debug': debug, 'noaction': noaction}
+    key = tuple(sorted(dbargs.items()))
+    with __pools_lock:
+        if key not in __pools:
+            __pools[key] = DatabasePool(dbargs,
+                                        minconn=int(getattr(config, 'db_pool_min', None) or 1),
+                                        maxconn=int(getattr(config, 'db_pool_max', None) or 10),
+                                        timeout=int(getattr(config, 'db_pool_timeout', None) or 30),
+                                        healthcheck=int(getattr(config, 'db_pool_healthcheck', None) or 60))
+        return __pools[key]
@@ -263,6 +263,15 @@ inline int parse_report(threadData_t *thrdata, parseJob_t *job)
 		goto exit;
 	}
 
+	if( db_register_rollups(thrdata->dbc, rterid) != 1 ) {
+		writelog(thrdata->dbc->log, LOG_ERR,
+			 "[Thread %i] Failed to update latency rollups (submid: %i, XML file: %s)",
+			 thrdata->id, job->submid, job->filename);
+		db_rollback(thrdata->dbc);
+		rc = STAT_MEASURE;
+		goto exit;
+	}
+
 	// When all database registrations are done, move the file to it's right place
 	if( make_report_dir(thrdata->dbc->log, destfname) < 1 ) { // Make sure report directory exists
 		db_rollback(thrdata->dbc);
@@ -1098,3 +1098,63 @@ int db_register_measurements(dbconn *dbc, xsltStylesheet *xslt, xmlDoc *summaryx
  exit:
 	return result;
 }
+
+
+/**
+ * Updates the latency rollup tables with a registered rteval run, by calling
+ * the rollup_register_run() SQL function.  The rollups are a convenience for
+ * reporting; a failure is logged and rolled back to a savepoint, leaving the
+ * rest of the transaction intact.  Databases older than schema version 1.6
+ * have no rollup tables and are skipped.
+ *
+ * @param dbc        Database handler where to perform the SQL queries
+ * @param rterid     A positive integer referencing the rteval run ID
+ *
+ * @return Returns 1 on success or when skipped, otherwise -1
+ */
+int db_register_rollups(dbconn *dbc, int rterid) {
+	PGresult *dbres = NULL;
+	char sql[80];
+	int result = 1;
+
+	if( dbc->sqlschemaver < 106 ) {
+		return 1;
+	}
+
+	dbres = PQexec(dbc->db, "SAVEPOINT rollup");
+	if( PQresultStatus(dbres) != PGRES_COMMAND_OK ) {
+		writelog(dbc->log, LOG_ALERT, "[Connection %i] Failed to create a savepoint: %s",
+			 dbc->id, PQresultErrorMessage(dbres));
+		PQclear(dbres);
+		return -1;
+	}
+	PQclear(dbres);
+
+	snprintf(sql, 78, "SELECT rollup_register_run(%i)", rterid);
+	dbres = PQexec(dbc->db, sql);
+	if( PQresultStatus(dbres) != PGRES_TUPLES_OK ) {
+		writelog(dbc->log, LOG_WARNING,
+			 "[Connection %i] Failed to update the rollup tables (rterid: %i): %s",
+			 dbc->id, rterid, PQresultErrorMessage(dbres));
+		PQclear(dbres);
+		dbres = PQexec(dbc->db, "ROLLBACK TO SAVEPOINT rollup");
+		if( PQresultStatus(dbres) != PGRES_COMMAND_OK ) {
+			writelog(dbc->log, LOG_ALERT,
+				 "[Connection %i] Failed to roll back to savepoint: %s",
+				 dbc->id, PQresultErrorMessage(dbres));
+			PQclear(dbres);
+			return -1;
+		}
+		result = 0;
+	}
+	PQclear(dbres);
+
+	dbres = PQexec(dbc->db, "RELEASE SAVEPOINT rollup");
+	if( PQresultStatus(dbres) != PGRES_COMMAND_OK ) {
+		writelog(dbc->log, LOG_ALERT, "[Connection %i] Failed to release savepoint: %s",
+			 dbc->id, PQresultErrorMessage(dbres));
+		result = -1;
+	}
+	PQclear(dbres);
+	return (result < 0 ? -1 : 1);
+}
@@ -61,5 +61,6 @@ int db_get_new_rterid(dbconn *dbc);
 int db_register_rtevalrun(dbconn *dbc, xsltStylesheet *xslt, xmlDoc *summaryxml,
 			  unsigned int submid, int syskey, int rterid, const char *report_fname);
 int db_register_measurements(dbconn *dbc, xsltStylesheet *xslt, xmlDoc *summaryxml, int rterid);
+int db_register_rollups(dbconn *dbc, int rterid);
 
 #endif
@@ -286,6 +286,40 @@ int daemonise(LogContext *log) {
 }
 
 
+/**
+ * Makes the measurement tables use the histogram table of the connected database.
+ * From SQL schema version 1.6 on, histograms are stored in cyclic_histogram_packed
+ * and cyclic_histogram is a read-only view of it.  Older databases only have
+ * cyclic_histogram.  Either name in the configuration is replaced by the table
+ * the database has, so the same configuration works before and after an upgrade.
+ *
+ * @param log     Log context, where the replacement is reported
+ * @param tbls    Measurement tables, as parsed from the configuration
+ * @param schemaver SQL schema version of the database
+ * @param verbose Report a replacement to the log
+ */
+static void select_histogram_table(LogContext *log, array_str_t *tbls, unsigned int schemaver,
+				   int verbose) {
+	const char *want = (schemaver >= 106 ? "cyclic_histogram_packed" : "cyclic_histogram");
+	unsigned int i;
+
+	for( i = 0; i < strSize(tbls); i++ ) {
+		if( ((strcmp(tbls->data[i], "cyclic_histogram") != 0)
+		     && (strcmp(tbls->data[i], "cyclic_histogram_packed") != 0))
+		    || (strcmp(tbls->data[i], want) == 0) ) {
+			continue;
+		}
+		if( verbose ) {
+			writelog(log, LOG_INFO,
+				 "SQL schema version %i.%i: storing histograms in %s instead of %s",
+				 schemaver / 100, schemaver % 100, want, tbls->data[i]);
+		}
+		free(tbls->data[i]);
+		tbls->data[i] = strdup(want);
+	}
+}
+
+
 /**
  * rtevald_parser main function.
  *
@@ -417,6 +451,8 @@ int main(int argc, char **argv) {
 			shutdown = 1;
 			goto exit;
 		}
+		select_histogram_table(logctx, thrdata[i]->dbc->measurement_tbls,
+				       thrdata[i]->dbc->sqlschemaver, (i == 0));
 
 		thrdata[i]->shutdown = &shutdown;
 		thrdata[i]->threadcount = &activethreads;
@@ -62,6 +62,11 @@
         <xsl:apply-templates select="cyclictest" mode="tbl_cyclictest_histogram"/>
       </xsl:when>
 
+      <!-- TABLE: cyclic_histogram_packed -->
+      <xsl:when test="$table = 'cyclic_histogram_packed'">
+        <xsl:apply-templates select="cyclictest" mode="tbl_cyclictest_histogram_packed"/>
+      </xsl:when>
+
       <!-- TABLE: cyclic_rawdata - only used by rteval v1.4 and earlier -->
       <xsl:when test="$table = 'cyclic_rawdata'">
         <xsl:if test="string(number($rterid)) = 'NaN'">
@@ -137,6 +142,11 @@
         <xsl:apply-templates select="Measurements/Profile/cyclictest" mode="tbl_cyclictest_histogram"/>
       </xsl:when>
 
+      <!-- TABLE: cyclic_histogram_packed -->
+      <xsl:when test="$table = 'cyclic_histogram_packed'">
+        <xsl:apply-templates select="Measurements/Profile/cyclictest" mode="tbl_cyclictest_histogram_packed"/>
+      </xsl:when>
+
       <!-- TABLE: hwlatdetect_summary -->
       <xsl:when test="$table = 'hwlatdetect_summary'">
         <xsl:apply-templates select="Measurements/Profile/hwlatdetect" mode="tbl_hwlatdetect_summary"/>
@@ -525,6 +535,49 @@
 
 
 
+  <!-- TABLE: cyclic_histogram_packed - rteval - all versions -->
+  <xsl:template match="/rteval['2.0' > @version]/cyclictest|/rteval[@version >= '2.0']/Measurements/Profile/cyclictest"
+                mode="tbl_cyclictest_histogram_packed">
+    <xsl:if test="string(number($rterid)) = 'NaN'">
+      <xsl:message terminate="yes">
+        <xsl:text>Invalid 'rterid' parameter value: </xsl:text><xsl:value-of select="$rterid"/>
+      </xsl:message>
+    </xsl:if>
+    <sqldata schemaver="1.6" table="cyclic_histogram_packed">
+      <fields>
+        <field fid="0">rterid</field>
+        <field fid="1">core</field>
+        <field fid="2">bucket_index</field>
+        <field fid="3">bucket_value</field>
+      </fields>
+      <records>
+        <!-- One record per histogram, empty histograms are skipped -->
+        <xsl:apply-templates select="./system/histogram[bucket]" mode="cyclic_histogram_packed_rec_sql"/>
+        <xsl:apply-templates select="./core/histogram[bucket]" mode="cyclic_histogram_packed_rec_sql"/>
+      </records>
+    </sqldata>
+  </xsl:template>
+
+  <xsl:template match="/rteval['2.0' > @version]/cyclictest/*/histogram|/rteval[@version >= '2.0']/Measurements/Profile/cyclictest/*/histogram"
+		mode="cyclic_histogram_packed_rec_sql">
+      <record>
+	<value fid="0"><xsl:value-of select="$rterid"/></value>
+	<value fid="1"><xsl:value-of select="../@id"/></value>
+	<value fid="2" type="array">
+	  <xsl:for-each select="bucket">
+	    <value><xsl:value-of select="@index"/></value>
+	  </xsl:for-each>
+	</value>
+	<value fid="3" type="array">
+	  <xsl:for-each select="bucket">
+	    <value><xsl:value-of select="@value"/></value>
+	  </xsl:for-each>
+	</value>
+      </record>
+  </xsl:template>
+
+
+
   <!-- TABLE: hwlatdetect_summar - only for rteval 2.0 and newer -->
   <xsl:template match="/rteval[@version >= '2.0']/Measurements/Profile/hwlatdetect" mode="tbl_hwlatdetect_summary">
     <xsl:if test="string(number($rterid)) = 'NaN'">
@@ -0,0 +1,291 @@
+#
+#   regression.py
+#   Compares newly registered rteval runs with the previous runs on the
+#   same system and records latency regressions in the database
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+#
+#   For every run and metric (the max and the 99th percentile latency of
+#   each core), the per-core values of the run are tested against the
+#   per-core values of the baseline, the latest runs on the same system
+#   before it.  A run is a regression when the one-sided Mann-Whitney U
+#   test says its values are larger (p < alpha) and its median is at least
+#   min_increase above the baseline median.  Needs SQL schema 1.6.
+#
+
+import math
+import statistics
+from collections import OrderedDict
+
+METRICS = ('max', 'p99')
+
+
+def mann_whitney_u(x, y):
+    """One-sided Mann-Whitney U test of the values in x being larger than
+    those in y.  Returns (U, p), p from the normal approximation with tie
+    and continuity correction"""
+    n1 = len(x)
+    n2 = len(y)
+    n = n1 + n2
+    values = sorted([(v, 0) for v in x] + [(v, 1) for v in y])
+
+    # Average ranks over runs of equal values
+    r1 = 0.0
+    ties = 0.0
+    i = 0
+    while i < n:
+        j = i
+        while j < n and values[j][0] == values[i][0]:
+            j += 1
+        rank = (i + j + 1) / 2.0
+        r1 += rank * len([v for v in values[i:j] if v[1] == 0])
+        ties += (j - i) ** 3 - (j - i)
+        i = j
+
+    u = r1 - n1 * (n1 + 1) / 2.0
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1)))) if n > 1 else 0.0
+    if sigma == 0:
+        # All values equal, nothing to tell them apart
+        return (u, 1.0)
+    z = (u - n1 * n2 / 2.0 - 0.5) / sigma
+    return (u, 0.5 * math.erfc(z / math.sqrt(2)))
+
+
+class RegressionDetector(object):
+    """Analyses runs through database.Database connections.  The baseline
+    of every system is cached, as the metrics of up to baseline_runs runs,
+    for the cachesize most recently seen systems.  A run started after
+    everything in its system's cached baseline is analysed without reading
+    the baseline again, and then joins it; that holds when runs are
+    analysed in order by a single detector"""
+
+    def __init__(self, baseline_runs=20, min_baseline=5, alpha=0.01, min_increase=0.10,
+                 cachesize=256):
+        self.baseline_runs = baseline_runs
+        self.min_baseline = min_baseline
+        self.alpha = alpha
+        self.min_increase = min_increase
+        self.__cachesize = cachesize
+        # syskey -> [(run_start, rterid, metrics), ...], newest first
+        self.__baselines = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+    def __fetch_metrics(self, dbc, rterids):
+        """Returns {rterid: {metric: {core: value}}} for the runs.  The 99th
+        percentile is the histogram bucket holding it, worked out by the
+        database so the histograms do not have to be transferred"""
+        ret = dict([(r, dict([(m, {}) for m in METRICS])) for r in rterids])
+        if not rterids:
+            return ret
+        res = dbc.QueryPrepared("regression_metrics",
+                                "SELECT s.rterid, s.coreid, s.lat_max,"
+                                "       (SELECT h.index"
+                                "          FROM (SELECT index, sum(value) OVER (ORDER BY index) AS cum,"
+                                "                       sum(value) OVER () AS total"
+                                "                  FROM unnest(p.bucket_index, p.bucket_value)"
+                                "                       AS u(index, value)) h"
+                                "         WHERE h.cum >= 0.99 * h.total"
+                                "         ORDER BY h.index LIMIT 1)"
+                                "  FROM cyclic_statistics s"
+                                "  LEFT JOIN cyclic_histogram_packed p"
+                                "         ON (p.rterid = s.rterid AND p.core = s.coreid)"
+                                " WHERE s.rterid = ANY($1::INTEGER[]) AND s.coreid IS NOT NULL",
+                                [list(rterids)])
+        for (rterid, core, latmax, p99) in res['records']:
+            ret[rterid]['max'][core] = latmax
+            if p99 is not None:
+                ret[rterid]['p99'][core] = p99
+        return ret
+
+
+    def __get_baseline(self, dbc, syskey, run_start):
+        "Returns the baseline of a run as [(run_start, rterid, metrics), ...]"
+        cached = self.__baselines.get(syskey)
+        if cached and cached[0][0] < run_start:
+            self.__baselines.move_to_end(syskey)
+            self.cache_hits += 1
+            return cached
+
+        # Served by the rtevalruns_syskey_start index
+        self.cache_misses += 1
+        runs = dbc.QueryPrepared("regression_baseline",
+                                 "SELECT run_start, rterid FROM rtevalruns"
+                                 " WHERE syskey = $1 AND run_start < $2"
+                                 " ORDER BY run_start DESC LIMIT $3",
+                                 [syskey, run_start, self.baseline_runs])['records']
+        metrics = self.__fetch_metrics(dbc, [r[1] for r in runs])
+        baseline = [(start, rterid, metrics[rterid]) for (start, rterid) in runs]
+
+        # Only the newest part of a system's history is worth keeping
+        if cached is None or not cached or (baseline and baseline[0][0] >= cached[0][0]):
+            self.__remember(syskey, baseline)
+        return baseline
+
+
+    def __remember(self, syskey, baseline):
+        self.__baselines[syskey] = baseline[:self.baseline_runs]
+        self.__baselines.move_to_end(syskey)
+        while len(self.__baselines) > self.__cachesize:
+            self.__baselines.popitem(last=False)
+
+
+    def Compare(self, metrics, baseline):
+        """Compares the per-core values of a run with its baseline.  Returns a
+        dict of metric to verdict; regression is None without enough history"""
+        verdicts = {}
+        for m in METRICS:
+            new = metrics[m]
+            per_core = {}
+            for (start, rterid, bmetrics) in baseline:
+                for (core, val) in bmetrics[m].items():
+                    if core in new:
+                        per_core.setdefault(core, []).append(val)
+            pooled = [v for vals in per_core.values() for v in vals]
+
+            v = {'cores': len(new), 'baseline_values': len(pooled), 'median': None,
+                 'baseline_median': None, 'ratio': None, 'ustat': None, 'pvalue': None,
+                 'worst_core': None, 'worst_ratio': None, 'regression': None}
+            verdicts[m] = v
+            if not new:
+                continue
+            v['median'] = statistics.median(new.values())
+            if len(baseline) < self.min_baseline or not pooled:
+                continue
+
+            v['baseline_median'] = statistics.median(pooled)
+            (v['ustat'], v['pvalue']) = mann_whitney_u(list(new.values()), pooled)
+            if v['baseline_median'] > 0:
+                v['ratio'] = v['median'] / v['baseline_median']
+            for (core, vals) in per_core.items():
+                cmed = statistics.median(vals)
+                if cmed > 0 and (v['worst_ratio'] is None or new[core] / cmed > v['worst_ratio']):
+                    v['worst_core'] = core
+                    v['worst_ratio'] = new[core] / cmed
+            v['regression'] = (v['pvalue'] < self.alpha and v['ratio'] is not None
+                               and v['ratio'] >= 1 + self.min_increase)
+        return verdicts
+
+
+    def Analyse(self, dbc, rterid):
+        """Analyses a registered run and stores the verdicts, replacing any
+        earlier ones.  Returns True for a regression, False for none and None
+        when the run could not be judged"""
+        run = dbc.QueryPrepared("regression_run",
+                                "SELECT syskey, run_start FROM rtevalruns WHERE rterid = $1",
+                                [rterid])
+        if dbc.NumTuples(run) != 1:
+            return None
+        syskey = dbc.GetValue(run, 0, 'syskey')
+        run_start = dbc.GetValue(run, 0, 'run_start')
+
+        metrics = self.__fetch_metrics(dbc, [rterid])[rterid]
+        baseline = self.__get_baseline(dbc, syskey, run_start)
+        verdicts = self.Compare(metrics, baseline)
+
+        found = [v['regression'] for v in verdicts.values() if v['regression'] is not None]
+        regression = any(found) if found else None
+
+        dbc.DELETE('regression_verdicts', {'rterid': rterid})
+        dbc.DELETE('regression_runs', {'rterid': rterid})
+        dbc.INSERT({'table': 'regression_runs',
+                    'fields': ['rterid', 'syskey', 'baseline_runs', 'regression'],
+                    'records': [[rterid, syskey, len(baseline), regression]]})
+        fields = ['cores', 'baseline_values', 'median', 'baseline_median', 'ratio',
+                  'ustat', 'pvalue', 'worst_core', 'worst_ratio', 'regression']
+        dbc.INSERT({'table': 'regression_verdicts',
+                    'fields': ['rterid', 'metric'] + fields,
+                    'records': [[rterid, m] + [verdicts[m][f] for f in fields] for m in METRICS]})
+        dbc.COMMIT()
+
+        # The run is the newest of its system when it starts after the
+        # cached baseline; then it becomes part of it
+        cached = self.__baselines.get(syskey)
+        if cached is not None and (not cached or cached[0][0] < run_start):
+            self.__remember(syskey, [(run_start, rterid, metrics)] + cached)
+        return regression
+
+
+    def PendingRuns(self, dbc, limit=100, lookback=1000):
+        """Returns the rterids of runs not analysed yet.  Runs are looked for
+        from lookback rterids below the newest analysed run, as rterids are
+        handed out before the parser commits a run"""
+        res = dbc.QueryPrepared("regression_pending",
+                                "SELECT r.rterid FROM rtevalruns r"
+                                "  LEFT JOIN regression_runs v ON (v.rterid = r.rterid)"
+                                " WHERE r.rterid > (SELECT COALESCE(max(rterid), 0)"
+                                "                     FROM regression_runs) - $1"
+                                "   AND v.rterid IS NULL"
+                                " ORDER BY r.rterid LIMIT $2",
+                                [lookback, limit])
+        return [r[0] for r in res['records']]
+
+
+
+def unit_test(rootdir):
+    try:
+        # Clearly larger values
+        (u, p) = mann_whitney_u([20, 21, 22, 23], [10, 11, 12, 13, 14, 15, 16, 17])
+        if u != 32 or p > 0.01:
+            raise Exception("larger sample not detected: U=%s p=%s" % (u, p))
+
+        # Clearly smaller values are no regression
+        (u, p) = mann_whitney_u([1, 2, 3], [10, 11, 12, 13, 14])
+        if u != 0 or p < 0.9:
+            raise Exception("smaller sample flagged: U=%s p=%s" % (u, p))
+
+        # Identical samples, ties only
+        (u, p) = mann_whitney_u([5, 5, 5], [5, 5, 5, 5])
+        if p != 1.0:
+            raise Exception("identical samples flagged: p=%s" % p)
+
+        det = RegressionDetector(min_baseline=3)
+        baseline = [(i, i, {'max': {0: 10.0 + i, 1: 11.0 + i, 2: 10.5, 3: 12.0},
+                            'p99': {0: 5, 1: 5, 2: 6, 3: 5}}) for i in range(6)]
+
+        same = det.Compare({'max': {0: 12.0, 1: 13.0, 2: 11.0, 3: 12.0},
+                            'p99': {0: 5, 1: 6, 2: 5, 3: 5}}, baseline)
+        if same['max']['regression'] or same['p99']['regression']:
+            raise Exception("unchanged run flagged as regression: %s" % same)
+
+        worse = det.Compare({'max': {0: 40.0, 1: 42.0, 2: 45.0, 3: 41.0},
+                             'p99': {0: 5, 1: 5, 2: 30, 3: 5}}, baseline)
+        if not worse['max']['regression'] or worse['max']['worst_core'] != 2:
+            raise Exception("max latency regression not found: %s" % worse['max'])
+        if worse['p99']['worst_core'] != 2:
+            raise Exception("wrong worst core: %s" % worse['p99'])
+
+        short = det.Compare({'max': {0: 40.0}, 'p99': {}}, baseline[:2])
+        if short['max']['regression'] is not None or short['p99']['median'] is not None:
+            raise Exception("verdict without enough history: %s" % short)
+
+        print("regression: all tests passed")
+        return 0
+    except Exception as e:
+        print("** EXCEPTION: %s" % str(e))
+        return 1
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unit_test('..'))
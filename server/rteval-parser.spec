@@ -1,6 +1,6 @@
 Name:		rteval-parser
 Version:	1.6
-%define sqlschemaver 1.5
+%define sqlschemaver 1.6
 Release:	1%{?dist}
 Summary:	Report parser daemon for  rteval XML-RPC
 %define pkgname rteval-xmlrpc-%{version}
@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+#
+#   rteval_loadtest.py
+#   Replays recorded submissions against an rteval XML-RPC server from
+#   many concurrent clients, and reports the throughput and latencies
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+#
+#   Each input file is either an XML-RPC request recorded with
+#   'rteval_xmlrpcd.py --record DIR', which is sent as it is, or an rteval
+#   summary.xml report (optionally .bz2 compressed), which is sent as a
+#   SendReport() call.
+#
+
+import os
+import bz2
+import gzip
+import math
+import time
+import base64
+import threading
+import http.client
+from xmlrpc.client import dumps, loads, Fault
+from optparse import OptionParser
+
+
+def load_requests(paths, clientid):
+    "Returns a list of (name, XML-RPC request body) from files and directories"
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files += sorted([os.path.join(p, f) for f in os.listdir(p)])
+        else:
+            files.append(p)
+
+    requests = []
+    for fname in files:
+        with open(fname, 'rb') as f:
+            data = f.read()
+        if fname.endswith('.bz2'):
+            data = bz2.decompress(data)
+        if b'<methodCall>' in data[:512]:
+            requests.append((os.path.basename(fname), data))
+        else:
+            payload = base64.b64encode(bz2.compress(data, 9)).decode('ascii')
+            requests.append((os.path.basename(fname),
+                             dumps((clientid, payload), 'SendReport').encode('utf-8')))
+    return requests
+
+
+def percentile(values, pct):
+    "Nearest rank percentile of a sorted list"
+    if not values:
+        return 0.0
+    return values[max(0, int(math.ceil(pct / 100.0 * len(values))) - 1)]
+
+
+class LoadTest(object):
+    def __init__(self, host, port, path, requests, concurrency=8, repeat=1,
+                 encoding=None, retry=False, timeout=300):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.concurrency = concurrency
+        self.encoding = encoding
+        self.retry = retry
+        self.timeout = timeout
+        self.__lock = threading.Lock()
+        self.__work = []
+        for r in range(repeat):
+            self.__work += requests
+        self.__work.reverse()
+        self.latencies = []
+        self.results = {'ok': 0, 'faults': 0, 'rejected': 0, 'errors': 0, 'bytes_sent': 0}
+
+
+    def __encode(self, body):
+        if self.encoding == 'gzip':
+            return gzip.compress(body)
+        if self.encoding == 'bzip2':
+            return bz2.compress(body)
+        return body
+
+
+    def __count(self, key, value=1):
+        with self.__lock:
+            self.results[key] += value
+
+
+    def __client(self):
+        conn = None
+        while True:
+            with self.__lock:
+                if not self.__work:
+                    break
+                (name, body) = self.__work.pop()
+            body = self.__encode(body)
+            headers = {'Content-Type': 'text/xml'}
+            if self.encoding:
+                headers['Content-Encoding'] = self.encoding
+
+            while True:
+                if conn is None:
+                    conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                start = time.time()
+                try:
+                    conn.request('POST', self.path, body, headers)
+                    resp = conn.getresponse()
+                    data = resp.read()
+                except (OSError, http.client.HTTPException) as err:
+                    print("%s: %s" % (name, str(err)))
+                    self.__count('errors')
+                    conn.close()
+                    conn = None
+                    break
+                duration = time.time() - start
+                if resp.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+                    conn = None
+
+                if resp.status == 503:
+                    self.__count('rejected')
+                    if self.retry:
+                        time.sleep(int(resp.getheader('Retry-After', '1')))
+                        continue
+                    break
+                self.__count('bytes_sent', len(body))
+                if resp.status != 200:
+                    print("%s: HTTP %i %s" % (name, resp.status, data.decode('utf-8', 'replace').strip()))
+                    self.__count('errors')
+                    break
+                try:
+                    loads(data)
+                    self.__count('ok')
+                except Fault as err:
+                    print("%s: %s" % (name, err.faultString))
+                    self.__count('faults')
+                with self.__lock:
+                    self.latencies.append(duration)
+                break
+        if conn is not None:
+            conn.close()
+
+
+    def Run(self):
+        start = time.time()
+        threads = [threading.Thread(target=self.__client) for i in range(self.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.elapsed = time.time() - start
+
+
+    def Report(self):
+        lat = sorted(self.latencies)
+        print("Requests:     %i ok, %i faults, %i rejected (503), %i errors"
+              % (self.results['ok'], self.results['faults'], self.results['rejected'],
+                 self.results['errors']))
+        print("Elapsed:      %.2f s, %.1f requests/s, %.2f MB/s sent"
+              % (self.elapsed, len(lat) / self.elapsed,
+                 self.results['bytes_sent'] / self.elapsed / 1024 / 1024))
+        if lat:
+            print("Latency (ms): min %.1f  avg %.1f  p50 %.1f  p95 %.1f  p99 %.1f  max %.1f"
+                  % (lat[0] * 1000, sum(lat) / len(lat) * 1000, percentile(lat, 50) * 1000,
+                     percentile(lat, 95) * 1000, percentile(lat, 99) * 1000, lat[-1] * 1000))
+
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage="%prog [options] FILE|DIR ...", version="%prog v0.1")
+
+    parser.add_option("-X", "--xmlrpc-server", dest="server", default="localhost:65432",
+                      help="XML-RPC server to load (default: %default)", metavar="HOST[:PORT]")
+    parser.add_option("-c", "--concurrency", action="store", type="int", dest="concurrency",
+                      default=8, help="Concurrent clients (default: %default)", metavar="NUM")
+    parser.add_option("-n", "--repeat", action="store", type="int", dest="repeat", default=1,
+                      help="Times every request is sent (default: %default)", metavar="NUM")
+    parser.add_option("-e", "--encoding", action="store", dest="encoding", default=None,
+                      choices=['gzip', 'bzip2'], help="Compress the request bodies, gzip or bzip2",
+                      metavar="ENC")
+    parser.add_option("-i", "--clientid", action="store", dest="clientid", default="loadtest",
+                      help="Client id of replayed reports (default: %default)", metavar="NAME")
+    parser.add_option("-r", "--retry", action="store_true", dest="retry", default=False,
+                      help="Retry refused requests after the Retry-After delay")
+
+    (opts, args) = parser.parse_args()
+    if not args:
+        parser.error("no recorded requests or reports given")
+
+    (host, _, port) = opts.server.partition(':')
+    requests = load_requests(args, opts.clientid)
+    print("Replaying %i requests %i times with %i clients against %s"
+          % (len(requests), opts.repeat, opts.concurrency, opts.server))
+    test = LoadTest(host, int(port or 80), '/rteval/API1/', requests,
+                    concurrency=opts.concurrency, repeat=opts.repeat,
+                    encoding=opts.encoding, retry=opts.retry)
+    test.Run()
+    test.Report()
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+#
+#   rteval_regression.py
+#   Checks newly registered rteval runs for latency regressions against
+#   the earlier runs on the same system
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+import time
+from optparse import OptionParser
+
+from xmlrpcconfig import load_config
+from dbpool import GetPool
+from regression import RegressionDetector
+
+
+def analyse(pool, detector, rterids):
+    for rterid in rterids:
+        with pool.Connection() as dbc:
+            res = detector.Analyse(dbc, rterid)
+        print("rterid %i: %s" % (rterid, {True: "REGRESSION", False: "ok",
+                                          None: "not enough data"}[res]))
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage="%prog [options] [RTERID ...]", version="%prog v0.1")
+
+    parser.add_option("-f", "--config", action="store", dest="config", default=None,
+                      help="Configuration file with an [xmlrpc_server] section", metavar="FILE")
+    parser.add_option("-i", "--interval", action="store", type="int", dest="interval", default=0,
+                      help="Keep looking for new runs every SECS seconds, instead of "
+                      "analysing the pending runs once", metavar="SECS")
+    parser.add_option("-b", "--baseline", action="store", type="int", dest="baseline", default=20,
+                      help="Earlier runs to compare with [default: %default]", metavar="NUM")
+    parser.add_option("-a", "--alpha", action="store", type="float", dest="alpha", default=0.01,
+                      help="Significance level of the test [default: %default]", metavar="P")
+    parser.add_option("-m", "--min-increase", action="store", type="float", dest="min_increase",
+                      default=10, help="Smallest latency increase reported, in percent "
+                      "[default: %default]", metavar="PCT")
+    parser.add_option("-d", "--debug", action="store_true", dest="debug", default=False,
+                      help="Print debug information")
+
+    (opts, args) = parser.parse_args()
+
+    pool = GetPool(load_config(opts.config), opts.debug)
+    detector = RegressionDetector(baseline_runs=opts.baseline, alpha=opts.alpha,
+                                  min_increase=opts.min_increase / 100.0)
+
+    if args:
+        # Analyse the given runs again
+        analyse(pool, detector, [int(a) for a in args])
+    else:
+        while True:
+            with pool.Connection() as dbc:
+                pending = detector.PendingRuns(dbc)
+            analyse(pool, detector, pending)
+            if not opts.interval:
+                break
+            if not pending:
+                time.sleep(opts.interval)
+
+    if opts.debug:
+        print("Baseline cache: %i hits, %i misses" % (detector.cache_hits, detector.cache_misses))
+    pool.Close()
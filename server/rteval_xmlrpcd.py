@@ -0,0 +1,336 @@
+#!/usr/bin/python3
+#
+#   rteval_xmlrpcd.py
+#   Standalone asyncio based XML-RPC server for rteval, for setups
+#   without Apache
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+#
+#   The network side runs in an asyncio event loop, the XMLRPC_API1 calls
+#   (file and database I/O) in a thread pool.  Backpressure works on two
+#   levels: a request body is only read once one of the max_requests
+#   request slots is free, so waiting clients are held back by TCP flow
+#   control, and a request which does not get a slot within queue_timeout
+#   seconds is refused with 503 and a Retry-After header.
+#
+
+import os
+import bz2
+import zlib
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from xmlrpc.client import dumps, loads, Fault
+from optparse import OptionParser
+
+from xmlrpc_API1 import XMLRPC_API1
+from Logger import Logger
+from xmlrpcconfig import load_config
+
+# Default values
+LISTEN="127.0.0.1"
+PORT=65432
+RPC_PATHS = ('/rteval/API1/', '/rteval/API1')
+
+# Request bodies are read and decompressed in blocks of this size
+BLOCKSIZE = 64*1024
+
+
+class RequestError(Exception):
+    def __init__(self, status, msg, headers=None):
+        Exception.__init__(self, msg)
+        self.status = status
+        self.headers = headers or []
+
+
+class Decompressor(object):
+    "Incremental decoder for a Content-Encoding, refusing to grow beyond a limit"
+    def __init__(self, encoding, limit):
+        encoding = encoding.strip().lower()
+        if encoding in ('', 'identity'):
+            self.__obj = None
+        elif encoding in ('gzip', 'x-gzip'):
+            self.__obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self.__obj = zlib.decompressobj()
+        elif encoding in ('bzip2', 'x-bzip2', 'bz2'):
+            self.__obj = bz2.BZ2Decompressor()
+        else:
+            raise RequestError(415, "Unsupported Content-Encoding: %s" % encoding)
+        self.__limit = limit
+        self.__size = 0
+
+    def decompress(self, data):
+        if self.__obj is None:
+            ret = data
+        elif isinstance(self.__obj, bz2.BZ2Decompressor):
+            ret = self.__obj.decompress(data, max_length=self.__limit - self.__size + 1)
+        else:
+            ret = self.__obj.decompress(data, self.__limit - self.__size + 1)
+        self.__size += len(ret)
+        if self.__size > self.__limit:
+            raise RequestError(413, "Request body exceeds %i bytes" % self.__limit)
+        return ret
+
+
+class RTevalXMLRPCServer(object):
+    def __init__(self, config, log, listen=LISTEN, port=PORT, max_requests=32,
+                 queue_timeout=30, max_body=512*1024*1024, threads=8,
+                 nodbaction=False, debug=False, recorddir=None):
+        self.config = config
+        self.log = log
+        self.listen = listen
+        self.port = port
+        self.max_body = max_body
+        self.queue_timeout = queue_timeout
+        self.nodbaction = nodbaction
+        self.debug = debug
+        self.recorddir = recorddir
+        self.__slots = None
+        self.__max_requests = max_requests
+        self.__executor = ThreadPoolExecutor(max_workers=threads,
+                                             thread_name_prefix="xmlrpc")
+        self.__server = None
+        self.__recordseq = itertools.count()
+        self.stats = {'requests': 0, 'active': 0, 'waiting': 0,
+                      'rejected': 0, 'errors': 0, 'bytes_in': 0}
+        if recorddir:
+            os.makedirs(recorddir, exist_ok=True)
+
+
+    def __dispatch(self, body):
+        """Runs in the thread pool; returns the XML-RPC response document and
+        whether it is a fault"""
+        try:
+            (args, method) = loads(body)
+        except Exception:
+            raise RequestError(400, "Invalid XML-RPC request")
+        if self.recorddir:
+            fname = os.path.join(self.recorddir, "%06i-%s.xml" % (next(self.__recordseq), method))
+            with open(fname, 'wb') as f:
+                f.write(body)
+        try:
+            api = XMLRPC_API1(config=self.config, debug=self.debug, nodbaction=self.nodbaction)
+            result = api.Dispatch(method, args)
+            if type(result) != tuple:
+                result = (result,)
+            return (dumps(result, methodresponse=1, allow_none=True), False)
+        except Exception as err:
+            return (dumps(Fault(1, "%s:%s" % (type(err).__name__, str(err)))), True)
+
+
+    async def __read_headers(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            (method, path, version) = line.decode('latin-1').split()
+        except ValueError:
+            raise RequestError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            (key, _, value) = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        return (method, path, version, headers)
+
+
+    async def __read_body(self, reader, headers):
+        try:
+            length = int(headers.get('content-length', ''))
+        except ValueError:
+            raise RequestError(411, "Content-Length required")
+        if length > self.max_body:
+            raise RequestError(413, "Request body exceeds %i bytes" % self.max_body)
+        decompr = Decompressor(headers.get('content-encoding', ''), self.max_body)
+        body = []
+        while length > 0:
+            block = await reader.read(min(length, BLOCKSIZE))
+            if not block:
+                raise RequestError(400, "Connection closed in the request body")
+            length -= len(block)
+            self.stats['bytes_in'] += len(block)
+            body.append(decompr.decompress(block))
+        return b''.join(body)
+
+
+    async def __respond(self, writer, status, body, ctype='text/xml', headers=None,
+                        gzip_ok=False, keepalive=True):
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                  411: 'Length Required', 413: 'Payload Too Large',
+                  415: 'Unsupported Media Type', 500: 'Internal Server Error',
+                  503: 'Service Unavailable'}.get(status, 'Error')
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        hdrs = [('Content-Type', ctype)] + (headers or [])
+        if gzip_ok and len(body) > 1024:
+            gz = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = gz.compress(body) + gz.flush()
+            hdrs.append(('Content-Encoding', 'gzip'))
+        hdrs += [('Content-Length', str(len(body))),
+                 ('Connection', keepalive and 'keep-alive' or 'close')]
+        head = "HTTP/1.1 %i %s\r\n" % (status, reason)
+        head += "".join(["%s: %s\r\n" % h for h in hdrs]) + "\r\n"
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+    async def __handle_request(self, reader, writer, method, path, headers):
+        if path.split('?')[0] not in RPC_PATHS:
+            raise RequestError(404, "Not found")
+        if method != 'POST':
+            raise RequestError(405, "Not valid XML-RPC POST request", [('Allow', 'POST')])
+
+        # Wait for a request slot before reading the body
+        self.stats['waiting'] += 1
+        try:
+            await asyncio.wait_for(self.__slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats['rejected'] += 1
+            raise RequestError(503, "Server busy", [('Retry-After', '%i' % self.queue_timeout)])
+        finally:
+            self.stats['waiting'] -= 1
+
+        self.stats['active'] += 1
+        try:
+            body = await self.__read_body(reader, headers)
+            loop = asyncio.get_running_loop()
+            (response, fault) = await loop.run_in_executor(self.__executor, self.__dispatch, body)
+            # The statistics are only updated in the event loop
+            if fault:
+                self.stats['errors'] += 1
+            return response
+        finally:
+            self.stats['active'] -= 1
+            self.__slots.release()
+
+
+    async def __connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        try:
+            while True:
+                try:
+                    req = await self.__read_headers(reader)
+                    if req is None:
+                        break
+                    (method, path, version, headers) = req
+                    self.stats['requests'] += 1
+                    conn = headers.get('connection', '').lower()
+                    keepalive = (version == 'HTTP/1.1' and conn != 'close') or conn == 'keep-alive'
+                    response = await self.__handle_request(reader, writer, method, path, headers)
+                    await self.__respond(writer, 200, response, keepalive=keepalive,
+                                         gzip_ok='gzip' in headers.get('accept-encoding', ''))
+                except asyncio.IncompleteReadError:
+                    break
+                except RequestError as err:
+                    self.log.Log("request", "%s: %i %s" % (peer and peer[0], err.status, str(err)))
+                    # The body may not have been read, so the connection
+                    # cannot be reused
+                    await self.__respond(writer, err.status, "%s\n" % str(err), 'text/plain',
+                                         err.headers, keepalive=False)
+                    break
+                if not keepalive:
+                    break
+        except ConnectionError:
+            pass
+        except Exception as err:
+            self.log.Log("request", "%s: %s" % (peer and peer[0], str(err)))
+            try:
+                await self.__respond(writer, 500, "Internal server error\n", 'text/plain',
+                                     keepalive=False)
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+
+    async def Serve(self):
+        self.__slots = asyncio.Semaphore(self.__max_requests)
+        self.__server = await asyncio.start_server(self.__connection, self.listen, self.port,
+                                                   limit=BLOCKSIZE)
+        addr = self.__server.sockets[0].getsockname()
+        self.port = addr[1]
+        self.log.Log("Serve", "Listening on %s:%i" % (addr[0], addr[1]))
+        async with self.__server:
+            await self.__server.serve_forever()
+
+
+    def Stop(self):
+        if self.__server is not None:
+            self.__server.close()
+        self.__executor.shutdown(wait=False)
+
+
+
+#
+#  M A I N   F U N C T I O N
+#
+
+if __name__ == '__main__':
+    parser = OptionParser(version="%prog v0.1")
+
+    parser.add_option("-L", "--listen", action="store", dest="listen", default=LISTEN,
+                      help="Which interface to listen to [default: %default]", metavar="IPADDR")
+    parser.add_option("-P", "--port", action="store", type="int", dest="port", default=PORT,
+                      help="Which port to listen to [default: %default]",  metavar="PORT")
+    parser.add_option("-f", "--config", action="store", dest="config", default=None,
+                      help="Configuration file with an [xmlrpc_server] section", metavar="FILE")
+    parser.add_option("-l", "--log", action="store", dest="logfile", default=None,
+                      help="Where to log requests.", metavar="FILE")
+    parser.add_option("-r", "--max-requests", action="store", type="int", dest="max_requests",
+                      default=32, help="Requests processed at the same time [default: %default]",
+                      metavar="NUM")
+    parser.add_option("-q", "--queue-timeout", action="store", type="int", dest="queue_timeout",
+                      default=30, help="Seconds a request may wait before it is refused "
+                      "[default: %default]", metavar="SECS")
+    parser.add_option("-m", "--max-body", action="store", type="int", dest="max_body",
+                      default=512, help="Largest request body, decompressed, in MB "
+                      "[default: %default]", metavar="MB")
+    parser.add_option("-t", "--threads", action="store", type="int", dest="threads", default=8,
+                      help="Threads running the API calls [default: %default]", metavar="NUM")
+    parser.add_option("-R", "--record", action="store", dest="recorddir", default=None,
+                      help="Save every request in DIR, for rteval_loadtest.py", metavar="DIR")
+    parser.add_option("-n", "--no-database", action="store_true", dest="nodbaction", default=False,
+                      help="Do not register submissions in the database")
+    parser.add_option("-d", "--debug", action="store_true", dest="debug", default=False,
+                      help="Print debug information")
+
+    (options, args) = parser.parse_args()
+
+    logger = Logger(options.logfile, "RTeval")
+    server = RTevalXMLRPCServer(load_config(options.config), logger,
+                                listen=options.listen, port=options.port,
+                                max_requests=options.max_requests,
+                                queue_timeout=options.queue_timeout,
+                                max_body=options.max_body*1024*1024,
+                                threads=options.threads,
+                                nodbaction=options.nodbaction, debug=options.debug,
+                                recorddir=options.recorddir)
+    try:
+        asyncio.run(server.Serve())
+    except KeyboardInterrupt:
+        logger.Log("Serve", "Server caught SIGINT")
+    finally:
+        server.Stop()
+        logger.Log("Serve", "Server stopped")
@@ -26,51 +26,75 @@
 #
 
 import os
-from database import Database
+from dbpool import GetPool, IsConnectionError
+
+
+def __run_pooled(config, func, debug, noaction):
+    """Runs func(dbc) with a connection from the shared pool.  A connection
+    which was lost while it sat idle in the pool is only noticed when used,
+    so the call is retried once on a fresh connection"""
+    pool = GetPool(config, debug, noaction)
+    for attempt in (1, 2):
+        dbc = pool.Get()
+        try:
+            ret = func(dbc)
+        except Exception as err:
+            broken = IsConnectionError(err)
+            pool.Put(dbc, broken=broken)
+            if broken and attempt == 1:
+                continue
+            raise
+        pool.Put(dbc)
+        return ret
+
 
 def register_submission(config, clientid, filename, debug=False, noaction=False):
     "Registers a submission of a rteval report which signalises the rteval_parserd process"
 
-    dbc = Database(host=config.db_server, port=config.db_port, database=config.database,
-                   user=config.db_username, password=config.db_password,
-                   debug=debug, noaction=noaction)
+    def register(dbc):
+        submvars = {"table": "submissionqueue",
+                    "fields": ["clientid", "filename"],
+                    "records": [[clientid, filename]],
+                    "returning": "submid"
+                    }
 
-    submvars = {"table": "submissionqueue",
-                "fields": ["clientid", "filename"],
-                "records": [[clientid, filename]],
-                "returning": "submid"
-                }
+        res = dbc.INSERT(submvars)
+        if len(res) != 1:
+            raise Exception("Could not register the submission")
 
-    res = dbc.INSERT(submvars)
-    if len(res) != 1:
-        raise Exception("Could not register the submission")
+        dbc.COMMIT()
+        return res[0]
+
+    return __run_pooled(config, register, debug, noaction)
 
-    dbc.COMMIT()
-    return res[0]
 
 def database_status(config, debug=False, noaction=False):
-    dbc = Database(host=config.db_server, port=config.db_port, database=config.database,
-                   user=config.db_username, password=config.db_password,
-                   debug=debug, noaction=noaction)
-    if not dbc:
+    def status(dbc):
+        return dbc.SELECT('rtevalruns',
+                          ["to_char(CURRENT_TIMESTAMP, 'YYYY-MM-DD HH24:MI:SS') AS server_time",
+                           "max(rterid) AS last_rterid",
+                           "max(submid) AS last_submid"]
+                          )
+
+    pool = GetPool(config, debug, noaction)
+    try:
+        res = __run_pooled(config, status, debug, noaction)
+    except Exception:
         return {"status": "No connection to pgsql://%s:%s/%s" % (config.db_server,
                                                                  config.db_port,
-                                                                 config.database)}
+                                                                 config.database),
+                "pool": pool.GetStats()}
 
-    res = dbc.SELECT('rtevalruns',
-                     ["to_char(CURRENT_TIMESTAMP, 'YYYY-MM-DD HH24:MI:SS') AS server_time",
-                      "max(rterid) AS last_rterid",
-                      "max(submid) AS last_submid"]
-                     )
-    if len(res) != 3:
+    if len(res['records']) != 1:
         return {"status": "Could not query database pgsql://%s:%s/%s" % (config.db_server,
                                                                          config.db_port,
-                                                                         config.database)}
+                                                                         config.database),
+                "pool": pool.GetStats()}
     last_rterid = res['records'][0][1] and res['records'][0][1] or "(None)"
     last_submid = res['records'][0][1] and res['records'][0][2] or "(None)"
     return {"status": "OK",
             "server_time": res['records'][0][0],
             "last_rterid": last_rterid,
-            "last_submid": last_submid
+            "last_submid": last_submid,
+            "pool": pool.GetStats()
             }
-
@@ -0,0 +1,306 @@
+#
+#   spool.py
+#   On-disk spool for received rteval reports, and the worker threads
+#   which store and register them in the background
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+#
+#   The spool lives in <datadir>/spool and works like a maildir:
+#
+#     tmp/     payloads being written
+#     new/     complete payloads (<ticket>.bz2), waiting for a worker
+#     cur/     payloads claimed by a worker
+#     failed/  payloads which could not be decompressed or parsed
+#     meta/    <ticket>.meta, the client id and the state of each ticket
+#
+#   A payload only shows up in new/ through rename(2), and a worker claims
+#   it by renaming it to cur/, so any number of server processes and
+#   threads can share a spool.
+#
+
+import os
+import bz2
+import json
+import time
+import uuid
+import threading
+import libxml2
+import rtevaldb
+
+# Payloads are decompressed in blocks of this size
+BLOCKSIZE = 1024*1024
+
+# Claimed payloads untouched for this long are put back in new/; the
+# worker which claimed them has died
+STALE_CLAIM = 10*60
+
+# Finished tickets are forgotten after this many seconds
+TICKET_EXPIRY = 24*60*60
+
+# Replace path delimiters in file names
+FNAMETRANS = str.maketrans("/\\.", "::_")
+
+SUBDIRS = ('tmp', 'new', 'cur', 'failed', 'meta')
+
+
+def check_wellformed(fname):
+    """Raises an exception unless fname holds a well formed XML document.
+    The document is read as a stream, it is never held in memory"""
+    reader = libxml2.readerForFile(fname, None, 0)
+    if reader is None:
+        raise Exception("could not read %s" % fname)
+    ret = reader.Read()
+    while ret == 1:
+        ret = reader.Read()
+    if ret != 0:
+        raise Exception("%s is not a well formed XML document" % os.path.basename(fname))
+
+
+class Spool(object):
+    def __init__(self, config, debug=False, nodbaction=False):
+        self.config = config
+        self.debug = debug
+        self.nodbaction = nodbaction
+        self.spooldir = os.path.join(config.datadir, 'spool')
+        self.queuedir = os.path.join(config.datadir, 'queue')
+        self.__wakeup = threading.Event()
+        self.__workers = []
+        for d in SUBDIRS:
+            os.makedirs(os.path.join(self.spooldir, d), 0o700, exist_ok=True)
+        os.makedirs(self.queuedir, 0o700, exist_ok=True)
+
+
+    def __path(self, subdir, ticket, ext='.bz2'):
+        return os.path.join(self.spooldir, subdir, ticket + ext)
+
+
+    def __write_meta(self, ticket, meta):
+        # Written through tmp/ as well, readers never see half a file
+        tmpf = self.__path('tmp', ticket, '.meta')
+        with open(tmpf, 'w') as f:
+            json.dump(meta, f)
+        os.rename(tmpf, self.__path('meta', ticket, '.meta'))
+
+
+    def __read_meta(self, ticket):
+        with open(self.__path('meta', ticket, '.meta')) as f:
+            return json.load(f)
+
+
+    def NewTicket(self):
+        "Returns a unique name for a spool entry, without probing the file system"
+        return "%i.%i.%s" % (time.time(), os.getpid(), uuid.uuid4().hex)
+
+
+    def Add(self, clientid, payload):
+        "Spools a bzip2 compressed report, returns its ticket"
+        ticket = self.NewTicket()
+        tmpf = self.__path('tmp', ticket)
+        with open(tmpf, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        return self.AddFile(clientid, tmpf, ticket)
+
+
+    def AddFile(self, clientid, fname, ticket=None):
+        """Moves a complete bzip2 compressed report file into the spool; it
+        must be on the same file system.  Returns its ticket"""
+        if ticket is None:
+            ticket = self.NewTicket()
+        self.__write_meta(ticket, {"clientid": clientid,
+                                   "received": time.time(),
+                                   "state": "queued"})
+        os.rename(fname, self.__path('new', ticket))
+        self.__wakeup.set()
+        return ticket
+
+
+    def Register(self, clientid, payload):
+        """Spools a bzip2 compressed report and registers it right away in
+        the calling thread, returns its submission id.  Nothing is kept
+        if it fails, as the client will send the report again"""
+        ticket = self.NewTicket()
+        tmpf = self.__path('tmp', ticket)
+        with open(tmpf, 'wb') as f:
+            f.write(payload)
+        self.__write_meta(ticket, {"clientid": clientid,
+                                   "received": time.time(),
+                                   "state": "queued"})
+        # Claimed by this thread from the start, no worker sees it
+        os.rename(tmpf, self.__path('cur', ticket))
+        try:
+            self.Process(ticket)
+            meta = self.__read_meta(ticket)
+            if meta["state"] != "registered":
+                raise Exception(meta.get("error", "report not registered"))
+        except Exception:
+            for f in (self.__path('cur', ticket), self.__path('failed', ticket),
+                      self.__queuefile(clientid, ticket), self.__path('meta', ticket, '.meta')):
+                if os.path.exists(f):
+                    os.unlink(f)
+            raise
+        # The caller gets the submission id, nobody asks for the ticket
+        os.unlink(self.__path('meta', ticket, '.meta'))
+        return meta["submid"]
+
+
+    def Status(self, ticket):
+        "Returns the state of a ticket, with the submission id once registered"
+        if not ticket or ticket != os.path.basename(ticket):
+            raise Exception("Invalid ticket")
+        try:
+            meta = self.__read_meta(ticket)
+        except (IOError, OSError):
+            return {"state": "unknown"}
+        if meta["state"] == "queued" and os.path.exists(self.__path('cur', ticket)):
+            meta["state"] = "processing"
+        # Server side paths are of no use to clients
+        meta.pop("clientid", None)
+        meta.pop("filename", None)
+        return meta
+
+
+    def __claim(self):
+        "Returns the ticket of the oldest unclaimed payload, or None"
+        for f in sorted(os.listdir(os.path.join(self.spooldir, 'new'))):
+            ticket = f[:-len('.bz2')]
+            try:
+                os.rename(self.__path('new', ticket), self.__path('cur', ticket))
+            except OSError:
+                # Claimed by someone else
+                continue
+            # The age of a claim counts from here
+            os.utime(self.__path('cur', ticket))
+            return ticket
+        return None
+
+
+    def __requeue_stale(self):
+        now = time.time()
+        for f in os.listdir(os.path.join(self.spooldir, 'cur')):
+            ticket = f[:-len('.bz2')]
+            try:
+                if now - os.path.getmtime(self.__path('cur', ticket)) > STALE_CLAIM:
+                    os.rename(self.__path('cur', ticket), self.__path('new', ticket))
+            except OSError:
+                pass
+
+        for f in os.listdir(os.path.join(self.spooldir, 'meta')):
+            fname = os.path.join(self.spooldir, 'meta', f)
+            try:
+                ticket = f[:-len('.meta')]
+                if now - os.path.getmtime(fname) > TICKET_EXPIRY \
+                   and not os.path.exists(self.__path('new', ticket)) \
+                   and not os.path.exists(self.__path('cur', ticket)):
+                    os.unlink(fname)
+            except OSError:
+                pass
+
+
+    def __queuefile(self, clientid, ticket):
+        "The decompressed report in the parse queue"
+        return os.path.join(self.queuedir, "%s-%s.xml" % (clientid.translate(FNAMETRANS),
+                                                          ticket.translate(FNAMETRANS)))
+
+
+    def Process(self, ticket):
+        """Decompresses a claimed payload into the parse queue, checks that it
+        is a well formed XML document and registers the submission.  The
+        claim is renewed along the way, so it does not go stale"""
+        meta = self.__read_meta(ticket)
+        payload = self.__path('cur', ticket)
+        if meta["state"] == "registered":
+            # Registered before, by a worker which died before cleaning up
+            os.unlink(payload)
+            return
+        fname = self.__queuefile(meta["clientid"], ticket)
+        try:
+            decompr = bz2.BZ2Decompressor()
+            with open(payload, 'rb') as inf, open(fname, 'wb') as outf:
+                for block in iter(lambda: inf.read(BLOCKSIZE), b''):
+                    outf.write(decompr.decompress(block))
+                    os.utime(payload)
+            check_wellformed(fname)
+        except Exception as err:
+            if os.path.exists(fname):
+                os.unlink(fname)
+            os.rename(payload, self.__path('failed', ticket))
+            meta.update({"state": "failed", "error": str(err)})
+            self.__write_meta(ticket, meta)
+            return
+        if self.debug:
+            print("Copy of report: %s" % fname)
+
+        # A database failure leaves the payload claimed; it is retried when
+        # the claim goes stale
+        os.utime(payload)
+        submid = rtevaldb.register_submission(self.config, meta["clientid"], fname,
+                                              debug=self.debug, noaction=self.nodbaction)
+        if self.nodbaction:
+            submid = 999999999 # Fake ID when no database registration is done
+        os.unlink(payload)
+        meta.update({"state": "registered", "submid": submid, "filename": fname})
+        self.__write_meta(ticket, meta)
+
+
+    def __worker(self):
+        poll = float(getattr(self.config, 'spool_poll', None) or 1)
+        while True:
+            ticket = self.__claim()
+            if ticket is None:
+                self.__requeue_stale()
+                self.__wakeup.wait(poll)
+                self.__wakeup.clear()
+                continue
+            try:
+                self.Process(ticket)
+            except Exception as err:
+                print("spool: could not process %s: %s" % (ticket, str(err)))
+
+
+    def StartWorkers(self, count=None):
+        "Starts the background workers, once"
+        if self.__workers:
+            return
+        if count is None:
+            count = int(getattr(self.config, 'spool_workers', None) or 2)
+        for i in range(count):
+            thr = threading.Thread(target=self.__worker, name="spool-worker-%i" % i)
+            thr.daemon = True
+            thr.start()
+            self.__workers.append(thr)
+
+
+
+__spools = {}
+__spools_lock = threading.Lock()
+
+def GetSpool(config, debug=False, nodbaction=False):
+    """Returns the spool of the data directory in the configuration, its
+    workers running in this process"""
+    with __spools_lock:
+        if config.datadir not in __spools:
+            spool = Spool(config, debug, nodbaction)
+            spool.StartWorkers()
+            __spools[config.datadir] = spool
+        return __spools[config.datadir]
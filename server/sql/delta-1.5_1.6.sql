@@ -0,0 +1,368 @@
+-- SQL delta update from rteval-1.5.sql to rteval-1.6.sql
+
+UPDATE rteval_info SET value = '1.6' WHERE key = 'sql_schema_ver';
+
+-- TABLE: cyclic_histogram_packed
+-- This table keeps the histogram data for each rteval run being
+-- reported, one record per core (NULL=system) holding the bucket indexes
+-- and their values in two arrays of the same length.  Large arrays are
+-- compressed and stored out of line by PostgreSQL.
+--
+    CREATE TABLE cyclic_histogram_packed (
+        rterid        INTEGER REFERENCES rtevalruns(rterid) NOT NULL,
+        core          INTEGER, -- NULL=system
+        bucket_index  INTEGER[] NOT NULL,
+        bucket_value  BIGINT[] NOT NULL,
+        CHECK (array_length(bucket_index, 1) = array_length(bucket_value, 1))
+    ) WITHOUT OIDS;
+    CREATE UNIQUE INDEX cyclic_histogram_packed_key ON cyclic_histogram_packed(rterid, COALESCE(core, -1));
+
+    GRANT INSERT ON cyclic_histogram_packed TO rtevparser;
+    GRANT SELECT ON cyclic_histogram_packed TO rtevxmlrpc;
+
+-- Move the histograms into the packed table, one record per core
+    INSERT INTO cyclic_histogram_packed (rterid, core, bucket_index, bucket_value)
+         SELECT rterid, core, array_agg(index ORDER BY index), array_agg(value ORDER BY index)
+           FROM cyclic_histogram
+          GROUP BY rterid, core;
+    DROP TABLE cyclic_histogram;
+
+-- VIEW: cyclic_histogram
+-- The histograms with one record per bucket, as they were stored before
+-- schema version 1.6
+--
+    CREATE VIEW cyclic_histogram AS
+        SELECT p.rterid, p.core, h.index, h.value
+          FROM cyclic_histogram_packed p,
+               unnest(p.bucket_index, p.bucket_value) AS h(index, value);
+
+    GRANT SELECT ON cyclic_histogram TO rtevxmlrpc;
+
+-- TABLE: rollup_classes
+-- Groups runs by kernel and hardware, so histograms and statistics of
+-- comparable runs can be merged.  0 means the value was not reported.
+--
+    CREATE TABLE rollup_classes (
+        classid         SERIAL NOT NULL,
+        kernel_ver      VARCHAR(32) NOT NULL,
+        kernel_rt       BOOLEAN NOT NULL,
+        arch            VARCHAR(12) NOT NULL,
+        num_cpu_cores   INTEGER NOT NULL DEFAULT 0,
+        num_cpu_sockets INTEGER NOT NULL DEFAULT 0,
+        numa_nodes      INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(classid)
+    ) WITHOUT OIDS;
+    CREATE UNIQUE INDEX rollup_classes_key
+           ON rollup_classes(kernel_ver, kernel_rt, arch, num_cpu_cores, num_cpu_sockets, numa_nodes);
+
+    GRANT SELECT ON rollup_classes TO rtevparser;
+    GRANT SELECT ON rollup_classes TO rtevxmlrpc;
+
+-- TABLE: rollup_run_summary
+-- Latency summary of each run, computed from its histogram when the run
+-- is registered.  Latencies are in microseconds; the percentiles are the
+-- histogram buckets holding them.
+--
+    CREATE TABLE rollup_run_summary (
+        rterid        INTEGER REFERENCES rtevalruns(rterid) NOT NULL,
+        syskey        INTEGER REFERENCES systems(syskey) NOT NULL,
+        classid       INTEGER REFERENCES rollup_classes(classid) NOT NULL,
+        kernel_ver    VARCHAR(32) NOT NULL,
+        kernel_rt     BOOLEAN NOT NULL,
+        run_start     TIMESTAMP WITH TIME ZONE NOT NULL,
+        num_samples   BIGINT NOT NULL,
+        lat_min       REAL NOT NULL,
+        lat_mean      REAL NOT NULL,
+        lat_max       REAL NOT NULL,
+        lat_p50       INTEGER NOT NULL,
+        lat_p90       INTEGER NOT NULL,
+        lat_p99       INTEGER NOT NULL,
+        lat_p999      INTEGER NOT NULL,
+        PRIMARY KEY(rterid)
+    ) WITHOUT OIDS;
+    CREATE INDEX rollup_run_summary_kernel ON rollup_run_summary(kernel_ver, run_start);
+    CREATE INDEX rollup_run_summary_syskey ON rollup_run_summary(syskey, run_start);
+    CREATE INDEX rollup_run_summary_class ON rollup_run_summary(classid, run_start);
+    CREATE INDEX rollup_run_summary_start ON rollup_run_summary(run_start);
+
+    GRANT SELECT ON rollup_run_summary TO rtevparser;
+    GRANT SELECT ON rollup_run_summary TO rtevxmlrpc;
+
+-- TABLE: rollup_system_summary
+-- Running totals per system and kernel, updated with every new run
+--
+    CREATE TABLE rollup_system_summary (
+        syskey        INTEGER REFERENCES systems(syskey) NOT NULL,
+        kernel_ver    VARCHAR(32) NOT NULL,
+        kernel_rt     BOOLEAN NOT NULL,
+        runs          INTEGER NOT NULL,
+        first_run     TIMESTAMP WITH TIME ZONE NOT NULL,
+        last_run      TIMESTAMP WITH TIME ZONE NOT NULL,
+        num_samples   BIGINT NOT NULL,
+        lat_max       REAL NOT NULL,
+        lat_p99_sum   BIGINT NOT NULL, -- lat_p99_sum / runs = average p99
+        lat_p99_max   INTEGER NOT NULL,
+        PRIMARY KEY(syskey, kernel_ver, kernel_rt)
+    ) WITHOUT OIDS;
+
+    GRANT SELECT ON rollup_system_summary TO rtevparser;
+    GRANT SELECT ON rollup_system_summary TO rtevxmlrpc;
+
+-- TABLE: rollup_class_histogram
+-- The histograms of all runs in a class, merged per day the runs started.
+-- Percentiles over any range of days are computed from these rows by
+-- rollup_class_percentile(), without touching cyclic_histogram_packed.
+--
+    CREATE TABLE rollup_class_histogram (
+        classid       INTEGER REFERENCES rollup_classes(classid) NOT NULL,
+        day           DATE NOT NULL,
+        index         INTEGER NOT NULL,
+        value         BIGINT NOT NULL,
+        PRIMARY KEY(classid, day, index)
+    ) WITHOUT OIDS;
+
+    GRANT SELECT ON rollup_class_histogram TO rtevparser;
+    GRANT SELECT ON rollup_class_histogram TO rtevxmlrpc;
+
+-- FUNCTION: rollup_run_histogram
+-- Returns the histogram of a run: the system histogram, or the sum of
+-- the core histograms for reports without one.
+--
+    CREATE FUNCTION rollup_run_histogram(p_rterid INTEGER)
+    RETURNS TABLE(index INTEGER, value BIGINT)
+    AS $BODY$
+        SELECT h.index, sum(h.value)::BIGINT
+          FROM cyclic_histogram_packed p,
+               unnest(p.bucket_index, p.bucket_value) AS h(index, value)
+         WHERE p.rterid = $1
+           AND (p.core IS NULL) = EXISTS (SELECT 1 FROM cyclic_histogram_packed
+                                           WHERE rterid = $1 AND core IS NULL)
+         GROUP BY h.index
+        HAVING sum(h.value) > 0
+    $BODY$ LANGUAGE 'sql' STABLE;
+
+-- FUNCTION: rollup_register_run
+-- Adds a newly registered run to all the rollup tables.  Called by the
+-- parser in the transaction registering the run; registering a run twice
+-- does nothing.  Returns true if the run was added.
+--
+    CREATE FUNCTION rollup_register_run(p_rterid INTEGER) RETURNS BOOLEAN
+    AS $BODY$
+      DECLARE
+        run       RECORD;
+        stats     RECORD;
+        v_classid INTEGER;
+        v_max     REAL;
+      BEGIN
+        PERFORM 1 FROM rollup_run_summary WHERE rterid = p_rterid;
+        IF FOUND THEN
+            RETURN FALSE;
+        END IF;
+
+        SELECT r.syskey, r.kernel_ver, r.kernel_rt, r.arch, r.run_start,
+               COALESCE(d.num_cpu_cores, 0) AS num_cpu_cores,
+               COALESCE(d.num_cpu_sockets, 0) AS num_cpu_sockets,
+               COALESCE(d.numa_nodes, 0) AS numa_nodes
+          INTO run
+          FROM rtevalruns r LEFT JOIN rtevalruns_details d ON (d.rterid = r.rterid)
+         WHERE r.rterid = p_rterid;
+        IF NOT FOUND THEN
+            RETURN FALSE;
+        END IF;
+
+        SELECT max(total) AS total, min(index) AS lat_min, max(index) AS lat_max,
+               sum(index::BIGINT * value)::DOUBLE PRECISION / max(total) AS lat_mean,
+               min(CASE WHEN cum >= 0.5 * total THEN index END) AS lat_p50,
+               min(CASE WHEN cum >= 0.9 * total THEN index END) AS lat_p90,
+               min(CASE WHEN cum >= 0.99 * total THEN index END) AS lat_p99,
+               min(CASE WHEN cum >= 0.999 * total THEN index END) AS lat_p999
+          INTO stats
+          FROM (SELECT index, value,
+                       sum(value) OVER (ORDER BY index) AS cum,
+                       sum(value) OVER () AS total
+                  FROM rollup_run_histogram(p_rterid)) c;
+        IF stats.total IS NULL THEN
+            RETURN FALSE;
+        END IF;
+
+        -- Latencies beyond the last histogram bucket only show in the statistics
+        SELECT lat_max INTO v_max FROM cyclic_statistics
+         WHERE rterid = p_rterid AND coreid IS NULL;
+        v_max := GREATEST(stats.lat_max, v_max);
+
+        -- Find or create the class; the unique index settles races
+        -- between parser threads
+        LOOP
+            SELECT classid INTO v_classid FROM rollup_classes
+             WHERE kernel_ver = run.kernel_ver AND kernel_rt = run.kernel_rt
+               AND arch = run.arch AND num_cpu_cores = run.num_cpu_cores
+               AND num_cpu_sockets = run.num_cpu_sockets AND numa_nodes = run.numa_nodes;
+            EXIT WHEN FOUND;
+            BEGIN
+                INSERT INTO rollup_classes (kernel_ver, kernel_rt, arch, num_cpu_cores,
+                                            num_cpu_sockets, numa_nodes)
+                     VALUES (run.kernel_ver, run.kernel_rt, run.arch, run.num_cpu_cores,
+                             run.num_cpu_sockets, run.numa_nodes)
+                  RETURNING classid INTO v_classid;
+                EXIT;
+            EXCEPTION WHEN unique_violation THEN
+                -- Created by someone else meanwhile, look it up again
+                NULL;
+            END;
+        END LOOP;
+
+        INSERT INTO rollup_run_summary (rterid, syskey, classid, kernel_ver, kernel_rt,
+                                        run_start, num_samples, lat_min, lat_mean, lat_max,
+                                        lat_p50, lat_p90, lat_p99, lat_p999)
+             VALUES (p_rterid, run.syskey, v_classid, run.kernel_ver, run.kernel_rt,
+                     run.run_start, stats.total, stats.lat_min, stats.lat_mean, v_max,
+                     stats.lat_p50, stats.lat_p90, stats.lat_p99, stats.lat_p999);
+
+        LOOP
+            UPDATE rollup_system_summary
+               SET runs = runs + 1,
+                   first_run = LEAST(first_run, run.run_start),
+                   last_run = GREATEST(last_run, run.run_start),
+                   num_samples = num_samples + stats.total,
+                   lat_max = GREATEST(lat_max, v_max),
+                   lat_p99_sum = lat_p99_sum + stats.lat_p99,
+                   lat_p99_max = GREATEST(lat_p99_max, stats.lat_p99)
+             WHERE syskey = run.syskey AND kernel_ver = run.kernel_ver
+               AND kernel_rt = run.kernel_rt;
+            EXIT WHEN FOUND;
+            BEGIN
+                INSERT INTO rollup_system_summary (syskey, kernel_ver, kernel_rt, runs,
+                                                   first_run, last_run, num_samples, lat_max,
+                                                   lat_p99_sum, lat_p99_max)
+                     VALUES (run.syskey, run.kernel_ver, run.kernel_rt, 1,
+                             run.run_start, run.run_start, stats.total, v_max,
+                             stats.lat_p99, stats.lat_p99);
+                EXIT;
+            EXCEPTION WHEN unique_violation THEN
+                -- Inserted by someone else meanwhile, update it instead
+                NULL;
+            END;
+        END LOOP;
+
+        -- Merging into the class histogram is serialised per class
+        PERFORM 1 FROM rollup_classes WHERE classid = v_classid FOR UPDATE;
+        UPDATE rollup_class_histogram ch
+           SET value = ch.value + h.value
+          FROM rollup_run_histogram(p_rterid) h
+         WHERE ch.classid = v_classid AND ch.day = run.run_start::DATE
+           AND ch.index = h.index;
+        INSERT INTO rollup_class_histogram (classid, day, index, value)
+             SELECT v_classid, run.run_start::DATE, h.index, h.value
+               FROM rollup_run_histogram(p_rterid) h
+              WHERE NOT EXISTS (SELECT 1 FROM rollup_class_histogram ch
+                                 WHERE ch.classid = v_classid
+                                   AND ch.day = run.run_start::DATE
+                                   AND ch.index = h.index);
+        RETURN TRUE;
+      END
+    $BODY$ LANGUAGE 'plpgsql' SECURITY DEFINER SET search_path = public;
+
+    GRANT EXECUTE ON FUNCTION rollup_register_run(INTEGER) TO rtevparser;
+
+-- FUNCTION: rollup_class_percentile
+-- Returns the latency percentile (0 < pct <= 1) of all runs in a class
+-- started between two days, both included
+--
+    CREATE FUNCTION rollup_class_percentile(p_classid INTEGER, p_from DATE, p_to DATE,
+                                            p_pct DOUBLE PRECISION) RETURNS INTEGER
+    AS $BODY$
+        SELECT min(index) FROM (
+            SELECT index, sum(value) OVER (ORDER BY index) AS cum,
+                   sum(value) OVER () AS total
+              FROM (SELECT index, sum(value) AS value FROM rollup_class_histogram
+                     WHERE classid = $1 AND day BETWEEN $2 AND $3
+                     GROUP BY index) h
+        ) c WHERE cum >= $4 * total
+    $BODY$ LANGUAGE 'sql' STABLE;
+
+    GRANT EXECUTE ON FUNCTION rollup_class_percentile(INTEGER, DATE, DATE, DOUBLE PRECISION) TO rtevxmlrpc;
+
+-- MATERIALIZED VIEW: rollup_kernel_latency_90d
+-- Latency overview per kernel over the last 90 days, for dashboards.
+-- Refreshed by rollup_refresh_views(), which should be run periodically
+-- (e.g. from cron); it only reads rollup_run_summary.
+--
+    CREATE MATERIALIZED VIEW rollup_kernel_latency_90d AS
+        SELECT kernel_ver, kernel_rt,
+               count(*) AS runs,
+               count(DISTINCT syskey) AS systems,
+               min(lat_min) AS lat_min,
+               max(lat_max) AS lat_max,
+               avg(lat_p99)::REAL AS lat_p99_avg,
+               max(lat_p99) AS lat_p99_max,
+               avg(lat_p999)::REAL AS lat_p999_avg,
+               max(run_start) AS last_run
+          FROM rollup_run_summary
+         WHERE run_start > NOW() - INTERVAL '90 days'
+         GROUP BY kernel_ver, kernel_rt;
+    CREATE UNIQUE INDEX rollup_kernel_latency_90d_key
+           ON rollup_kernel_latency_90d(kernel_ver, kernel_rt);
+
+    GRANT SELECT ON rollup_kernel_latency_90d TO rtevxmlrpc;
+
+-- FUNCTION: rollup_refresh_views
+-- Refreshes the rollup materialized views without blocking readers
+--
+    CREATE FUNCTION rollup_refresh_views() RETURNS VOID
+    AS $BODY$
+      BEGIN
+        REFRESH MATERIALIZED VIEW CONCURRENTLY rollup_kernel_latency_90d;
+      END
+    $BODY$ LANGUAGE 'plpgsql' SECURITY DEFINER SET search_path = public;
+
+    GRANT EXECUTE ON FUNCTION rollup_refresh_views() TO rtevparser;
+
+-- The regression analysis reads the statistics and looks up the
+-- previous runs of a system
+    CREATE INDEX rtevalruns_syskey_start ON rtevalruns(syskey, run_start);
+    GRANT SELECT ON cyclic_statistics TO rtevxmlrpc;
+
+-- TABLE: regression_runs
+-- Runs checked for latency regressions against the previous runs on the
+-- same system.  regression is NULL when there was too little history.
+--
+    CREATE TABLE regression_runs (
+        rterid          INTEGER REFERENCES rtevalruns(rterid) NOT NULL,
+        syskey          INTEGER REFERENCES systems(syskey) NOT NULL,
+        analysed        TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        baseline_runs   INTEGER NOT NULL,
+        regression      BOOLEAN,
+        PRIMARY KEY(rterid)
+    ) WITHOUT OIDS;
+    CREATE INDEX regression_runs_syskey ON regression_runs(syskey, rterid);
+    CREATE INDEX regression_runs_found ON regression_runs(rterid) WHERE regression;
+
+    GRANT SELECT, INSERT, DELETE ON regression_runs TO rtevxmlrpc;
+
+-- TABLE: regression_verdicts
+-- Outcome of comparing the per-core values of one metric ('max' or 'p99'
+-- latency) of a run with those of its baseline runs.  pvalue is from a
+-- one-sided Mann-Whitney U test; the worst core is the one furthest above
+-- its own baseline median.
+--
+    CREATE TABLE regression_verdicts (
+        rterid          INTEGER REFERENCES regression_runs(rterid) NOT NULL,
+        metric          VARCHAR(8) NOT NULL,
+        cores           INTEGER NOT NULL,
+        baseline_values INTEGER NOT NULL,
+        median          REAL,
+        baseline_median REAL,
+        ratio           REAL,
+        ustat           REAL,
+        pvalue          DOUBLE PRECISION,
+        worst_core      INTEGER,
+        worst_ratio     REAL,
+        regression      BOOLEAN,
+        PRIMARY KEY(rterid, metric)
+    ) WITHOUT OIDS;
+
+    GRANT SELECT, INSERT, DELETE ON regression_verdicts TO rtevxmlrpc;
+
+-- Add the runs registered before the rollups existed
+    SELECT count(rollup_register_run(rterid)) FROM rtevalruns;
+    REFRESH MATERIALIZED VIEW rollup_kernel_latency_90d;
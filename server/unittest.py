@@ -2,6 +2,7 @@ import sys, threading, time, signal, libxml2
 from optparse import OptionParser
 from rteval_testserver import RTevald
 from Logger import Logger
+import regression
 
 sys.path.insert(0,'..')
 sys.path.insert(0,'../rteval')
@@ -63,6 +64,10 @@ class ClientTest(object):
 
 
 def unit_test(rootdir):
+    # The regression detection needs neither the server nor a database
+    if regression.unit_test(rootdir) != 0:
+        return 1
+
     ret = 1
     try:
         # Prepare server and client objects
@@ -26,56 +26,31 @@
 #
 
 import os
-import bz2
+import time
+import json
 import base64
-import libxml2
-import string
+import hashlib
 import platform
 import rtevaldb
+from spool import GetSpool
+
+
+# Uploads are read and decompressed in blocks of this size
+UPLOAD_BLOCKSIZE = 1024*1024
+
+# Unfinished uploads older than this many seconds are removed
+UPLOAD_EXPIRY = 24*60*60
 
 
 class XMLRPC_API1():
     def __init__(self, config=None, debug=False, nodbaction=False):
         # Some defaults
         self.apiversion = 1
-        self.fnametrans = string.maketrans("/\\.", "::_") # replace path delimiters in filenames
         self.debug = debug
         self.nodbaction = nodbaction
         self.config = config
 
 
-    def __mkdatadir(self, dirpath):
-        startdir = os.getcwd()
-        if dirpath[0] == '/':
-            os.chdir('/')
-        for dir in dirpath.split("/"):
-            if dir is '':
-                continue
-            if not os.path.exists(dir):
-                os.mkdir(dir, 0o700)
-            os.chdir(dir)
-        os.chdir(startdir)
-
-
-    def __getfilename(self, dir, fname, ext, comp):
-        idx = 0
-        if comp:
-            filename = "%s/%s/%s%s.bz2" % (self.config.datadir, dir, fname.translate(self.fnametrans), ext)
-        else:
-            filename = "%s/%s/%s%s" % (self.config.datadir, dir, fname.translate(self.fnametrans), ext)
-
-        while 1:
-            if not os.path.exists(filename):
-                return filename
-            idx += 1
-            if comp:
-                filename = "%s/%s/%s-{%i}.bz2" % (self.config.datadir, dir,
-                                                  fname.translate(self.fnametrans), idx)
-            else:
-                filename = "%s/%s/%s-{%i}" % (self.config.datadir, dir,
-                                              fname.translate(self.fnametrans), idx)
-
-
     def Dispatch(self, method, params):
         # Call the method requested
         # FIXME: Improve checking for valid methods
@@ -89,24 +64,115 @@ class XMLRPC_API1():
 
 
     def SendReport(self, clientid, xmlbzb64):
-        decompr = bz2.BZ2Decompressor()
-        xmldoc = libxml2.parseDoc(decompr.decompress(base64.b64decode(xmlbzb64)))
-
-        # Save a copy of the report on the file system
-        # Make sure we have a directory to write files into
-        self.__mkdatadir(os.path.join(self.config.datadir, 'queue'))
-        fname = self.__getfilename('queue/', ('%s' % clientid), '.xml', False)
-        xmldoc.saveFormatFileEnc(fname,'UTF-8',1)
-        if self.debug:
-            print("Copy of report: %s" % fname)
-
-        # Register the submission and put it in a parse queue
-        rterid = rtevaldb.register_submission(self.config, clientid, fname,
-                                                        debug=self.debug, noaction=self.nodbaction)
-        if self.nodbaction:
-            rterid = 999999999 # Fake ID when no database registration is done
-
-        return rterid
+        """Stores and registers a bzip2 compressed, base64 encoded report,
+        returns its submission id"""
+        spool = GetSpool(self.config, debug=self.debug, nodbaction=self.nodbaction)
+        return spool.Register(clientid, base64.b64decode(xmlbzb64))
+
+
+    def SendReportAsync(self, clientid, xmlbzb64):
+        """Spools a bzip2 compressed, base64 encoded report.  It is stored and
+        registered in the background; returns a ticket for SubmissionStatus()"""
+        spool = GetSpool(self.config, debug=self.debug, nodbaction=self.nodbaction)
+        return spool.Add(clientid, base64.b64decode(xmlbzb64))
+
+
+    def SubmissionStatus(self, ticket):
+        "Returns the state of a spooled report, and its submission id once registered"
+        spool = GetSpool(self.config, debug=self.debug, nodbaction=self.nodbaction)
+        return spool.Status(ticket)
+
+
+    def __uploadfiles(self, uploadid):
+        # Only accept the ids BeginUpload() hands out, they end up in file names
+        if len(uploadid) != 40 or uploadid.strip("0123456789abcdef"):
+            raise Exception("Invalid upload id")
+        updir = os.path.join(self.config.datadir, 'uploads')
+        return (os.path.join(updir, "%s.meta" % uploadid),
+                os.path.join(updir, "%s.bz2.part" % uploadid))
+
+
+    def __expire_uploads(self, updir):
+        now = time.time()
+        for f in os.listdir(updir):
+            fname = os.path.join(updir, f)
+            try:
+                if now - os.path.getmtime(fname) > UPLOAD_EXPIRY:
+                    os.unlink(fname)
+            except OSError:
+                pass
+
+
+    def BeginUpload(self, clientid, size, sha1):
+        """Starts, or resumes, a chunked upload of a bzip2 compressed report
+        of size bytes with the given SHA1 checksum.  Returns the upload id
+        and the offset the next chunk must be appended at"""
+        updir = os.path.join(self.config.datadir, 'uploads')
+        os.makedirs(updir, 0o700, exist_ok=True)
+        self.__expire_uploads(updir)
+
+        # The same report from the same client always gets the same id,
+        # which makes an interrupted upload resumable
+        uploadid = hashlib.sha1(("%s\0%s\0%i" % (clientid, sha1, int(size))).encode('utf-8')).hexdigest()
+        (metaf, partf) = self.__uploadfiles(uploadid)
+        if not os.path.exists(metaf):
+            with open(metaf, 'w') as f:
+                json.dump({"clientid": clientid, "size": int(size), "sha1": sha1}, f)
+            if os.path.exists(partf):
+                os.unlink(partf)
+        offset = os.path.exists(partf) and os.path.getsize(partf) or 0
+        return {"uploadid": uploadid, "offset": offset}
+
+
+    def AppendChunk(self, uploadid, offset, chunkb64, sha1):
+        """Appends a base64 encoded chunk at offset.  The chunk is discarded
+        if its checksum does not match or the offset is not where the
+        previous chunk ended.  Returns the offset of the next chunk"""
+        (metaf, partf) = self.__uploadfiles(uploadid)
+        if not os.path.exists(metaf):
+            raise Exception("Unknown upload id %s" % uploadid)
+        with open(metaf) as f:
+            meta = json.load(f)
+
+        chunk = base64.b64decode(chunkb64)
+        if hashlib.sha1(chunk).hexdigest() != sha1:
+            raise Exception("Checksum mismatch in chunk at offset %i" % offset)
+
+        with open(partf, 'ab') as f:
+            current = f.tell()
+            if current != offset:
+                # A retried chunk which has already been stored, or a gap;
+                # the client continues from the returned offset
+                return current
+            if current + len(chunk) > meta["size"]:
+                raise Exception("Chunk at offset %i exceeds the upload size" % offset)
+            f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+
+    def CommitUpload(self, uploadid):
+        """Checks the complete upload against its checksum and spools it,
+        returns a ticket for SubmissionStatus()"""
+        (metaf, partf) = self.__uploadfiles(uploadid)
+        if not os.path.exists(metaf):
+            raise Exception("Unknown upload id %s" % uploadid)
+        with open(metaf) as f:
+            meta = json.load(f)
+
+        csum = hashlib.sha1()
+        with open(partf, 'rb') as f:
+            for block in iter(lambda: f.read(UPLOAD_BLOCKSIZE), b''):
+                csum.update(block)
+            if f.tell() != meta["size"] or csum.hexdigest() != meta["sha1"]:
+                raise Exception("Upload %s is incomplete or corrupted" % uploadid)
+
+        # Hand the compressed file over to the spool as it is
+        spool = GetSpool(self.config, debug=self.debug, nodbaction=self.nodbaction)
+        ticket = spool.AddFile(meta["clientid"], partf)
+        os.unlink(metaf)
+        return ticket
 
 
     def Hello(self, clientid):
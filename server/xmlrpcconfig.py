@@ -0,0 +1,42 @@
+#
+#   xmlrpcconfig.py
+#   The [xmlrpc_server] configuration shared by the XML-RPC server and
+#   its helper programs
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#   For the avoidance of doubt the "preferred form" of this code is one which
+#   is in an open unpatent encumbered format. Where cryptographic key signing
+#   forms part of the process of creating an executable the information
+#   including keys needed to generate an equivalently functional executable
+#   are deemed to be part of the source code.
+#
+
+from rteval.rtevalConfig import rtevalConfig
+
+
+def load_config(cfgfile=None):
+    "Returns the [xmlrpc_server] configuration, with the defaults of rteval_xmlrpc.py"
+    defcfg = {'xmlrpc_server': { 'datadir':     '/var/lib/rteval',
+                                 'db_server':   'localhost',
+                                 'db_port':     5432,
+                                 'database':    'rteval',
+                                 'db_username': 'rtevxmlrpc',
+                                 'db_password': 'rtevaldb'
+                                 }
+              }
+    cfg = rtevalConfig(defcfg)
+    cfg.Load(fname=cfgfile, append=True)
+    return cfg.GetSection('xmlrpc_server')
@@ -123,6 +123,15 @@ if __name__ == '__main__':
             ('rteval/sysinfo','dmi'),
             ('rteval','rtevalConfig'),
             ('rteval','xmlout'),
+            ('rteval','procstat'),
+            ('rteval','cpupartition'),
+            ('rteval','archive'),
+            ('rteval','tracecapture'),
+            ('rteval/modules/loads','external'),
+            ('rteval/modules/loads','ioload'),
+            ('rteval/modules/loads','memload'),
+            ('rteval/modules/loads','netload'),
+            ('rteval/modules/loads','stressng'),
             ('server','unittest')
             ))
     # Run all tests